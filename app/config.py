@@ -1,7 +1,77 @@
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
-    mongodb_uri: str
+    # A local server by default, so the app starts without an env file; the client connects on first use
+    mongodb_uri: str = "mongodb://localhost:27017"
+
+    # Where polls, intermediates and report metadata live: "mongodb", or "sqlite" for a local
+    # file at sqlite_path that needs no server
+    storage_backend: str = "mongodb"
+    sqlite_path: str = "storedash.db"
+
+    # MongoDB connection pool and timeouts
+    mongodb_max_pool_size: int = 50
+    mongodb_min_pool_size: int = 0
+    mongodb_connect_timeout_ms: int = 10000
+    mongodb_server_selection_timeout_ms: int = 10000
+    mongodb_socket_timeout_ms: int = 60000
+
+    # Threads running blocking database calls for the async services; keep it at or below the pool size
+    db_executor_workers: int = 16
+
+    # Number of documents sent per unordered insert_many round trip during ingest
+    insert_batch_size: int = 10000
+
+    # Streaming ingest reads store_status.csv in chunks of ingest_chunk_size rows and
+    # keeps at most ingest_queue_depth converted chunks waiting for the database writer
+    ingest_streaming: bool = False
+    ingest_chunk_size: int = 100000
+    ingest_queue_depth: int = 4
+
+    # Only ingest polls that are newer than the persisted watermark
+    ingest_incremental: bool = True
+
+    # Also keep ingested polls as memory-mapped segment files in segment_dir, which the columnar engine reads
+    # instead of the database; compaction merges segment_compaction_fanin segments of a similar size,
+    # starting with the ones below segment_compaction_bytes
+    poll_segments: bool = False
+    segment_dir: str = "segments"
+    segment_compaction_bytes: int = 8 * 1024 * 1024
+    segment_compaction_fanin: int = 4
+
+    # Keep hourly rollups of each store's business-hours uptime up to date at ingest, so any window
+    # is read as a sum of whole hours plus the polls of its two partial hours
+    poll_rollups: bool = False
+
+    # Reports run as background jobs; triggers beyond this many running jobs are rejected
+    report_max_concurrent_jobs: int = 2
+
+    # Worker processes computing report shards in parallel; 1 computes stores serially
+    report_workers: int = 1
+
+    # "fused" reads each store's polls once and computes hour/day/week together;
+    # "aggregation" computes the six numbers per store in a MongoDB aggregation pipeline;
+    # "legacy" runs the separate filter and uptime steps with intermediate collections;
+    # "columnar" reads every store's week of polls once into compact arrays and computes from those;
+    # "online" keeps running per-store aggregates that ingest updates, so a report only reads them;
+    # "rollup" sums each store's hourly rollups
+    report_engine: str = "fused"
+
+    # Results kept by the least recently used cache in front of GET /stores/{store_id}/uptime; 0 disables it
+    uptime_cache_size: int = 10000
+
+    # Stores computed at once by the /stores/* batch endpoints; 1 runs them one after another
+    store_batch_concurrency: int = 16
+
+    # Reuse a finished report whose inputs are unchanged and attach identical triggers to a running one
+    report_cache: bool = True
+
+    # Directory finished report CSVs are written to, and the read size when streaming one to a client
+    report_dir: str = "reports"
+    download_chunk_size: int = 64 * 1024
+
+    # Intermediate documents written by the legacy engine are tagged with their run and expire after this long
+    intermediate_ttl_seconds: int = 24 * 60 * 60
 
     class Config:
         env_file = ".env"
@@ -1,6 +1,145 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pymongo import MongoClient
 from app.config import settings
+from app.utils.metrics import CommandCounter
 
-client = MongoClient(settings.mongodb_uri)
-db = client.restaurant_monitoring
-print("Connected to MongoDB Atlas")
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    # Built on first use, so importing the app, or running on sqlite storage, never creates a MongoDB client
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(
+                settings.mongodb_uri,
+                maxPoolSize=settings.mongodb_max_pool_size,
+                minPoolSize=settings.mongodb_min_pool_size,
+                connectTimeoutMS=settings.mongodb_connect_timeout_ms,
+                serverSelectionTimeoutMS=settings.mongodb_server_selection_timeout_ms,
+                socketTimeoutMS=settings.mongodb_socket_timeout_ms,
+                # Counts every command sent, for /metrics and the per-stage breakdown on reports
+                event_listeners=[CommandCounter()],
+            )
+        return _client
+
+
+def get_database():
+    return get_client().restaurant_monitoring
+
+
+def __getattr__(name):
+    # app.db.client and app.db.db still work, resolved on first access
+    if name == "client":
+        return get_client()
+    if name == "db":
+        return get_database()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class AsyncCollection:
+    # Awaitable wrappers around a pymongo collection; every call runs on the database executor
+    # so the event loop keeps serving requests while MongoDB works
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+
+    @property
+    def sync(self):
+        return self.database.sync[self.name]
+
+    async def run(self, method, *args, **kwargs):
+        return await self.database.run(partial(getattr(self.sync, method), *args, **kwargs))
+
+    async def find(self, filter=None, projection=None, sort=None, limit=0):
+        # Cursors are drained on the executor as well, so the caller gets a list
+        def fetch():
+            cursor = self.sync.find(filter or {}, projection)
+            if sort:
+                cursor = cursor.sort(sort)
+            if limit:
+                cursor = cursor.limit(limit)
+            return list(cursor)
+
+        return await self.database.run(fetch)
+
+    async def explain(self, filter=None, sort=None):
+        def explain():
+            cursor = self.sync.find(filter or {})
+            if sort:
+                cursor = cursor.sort(sort)
+            return cursor.explain()
+
+        return await self.database.run(explain)
+
+    async def aggregate(self, pipeline, **kwargs):
+        return await self.database.run(lambda: list(self.sync.aggregate(pipeline, **kwargs)))
+
+    async def find_one(self, *args, **kwargs):
+        return await self.run("find_one", *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await self.run("insert_one", *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await self.run("insert_many", *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await self.run("update_one", *args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return await self.run("update_many", *args, **kwargs)
+
+    async def replace_one(self, *args, **kwargs):
+        return await self.run("replace_one", *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await self.run("delete_many", *args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        return await self.run("bulk_write", *args, **kwargs)
+
+    async def count_documents(self, *args, **kwargs):
+        return await self.run("count_documents", *args, **kwargs)
+
+    async def create_index(self, *args, **kwargs):
+        return await self.run("create_index", *args, **kwargs)
+
+
+class AsyncDatabase:
+    # Blocking driver calls are offloaded to a bounded thread pool sized below the connection pool
+
+    def __init__(self, database=None, max_workers=None):
+        # Without a database, the app's MongoDB database is resolved on first use
+        self.database = database
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mongodb")
+
+    @property
+    def sync(self):
+        if self.database is None:
+            self.database = get_database()
+        return self.database
+
+    def bind(self, database):
+        # Point every service at another database, e.g. an in-process mongomock stand-in
+        self.database = database
+
+    async def run(self, function):
+        # The caller's context goes along, so DB commands are credited to the stage that issued them
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, context.run, function)
+
+    def __getattr__(self, name):
+        return AsyncCollection(self, name)
+
+    def __getitem__(self, name):
+        return AsyncCollection(self, name)
+
+
+adb = AsyncDatabase(max_workers=settings.db_executor_workers)
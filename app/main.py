@@ -1,9 +1,57 @@
-from fastapi import FastAPI
-from app.routers import polling
+import time
+
+# Import and readiness timings are measured from here
+IMPORT_STARTED_AT = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from app.routers import diagnostics, polling
+from app.services.index_service import ensure_indexes_on_startup
+from app.services.polling_service import build_poll_segments_on_startup, migrate_polling_epochs_on_startup
+from app.services.warmup import record_startup, start_warmup
+from app.utils.metrics import REQUEST_SECONDS
+
+record_startup("import", time.perf_counter() - IMPORT_STARTED_AT)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Backfill epoch timestamps, create the indexes the service queries rely on and seed the poll segments
+    # before serving requests, then warm the caches in the background. The backfill goes first because
+    # undated polls it archives would keep the unique poll index from being built.
+    started_at = time.perf_counter()
+    await migrate_polling_epochs_on_startup()
+    await ensure_indexes_on_startup()
+    await build_poll_segments_on_startup()
+    record_startup("startup", time.perf_counter() - started_at)
+
+    warmup = start_warmup(IMPORT_STARTED_AT)
+    yield
+    warmup.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    # Labelled by route template rather than raw path, so query strings and ids do not create new series;
+    # streamed bodies are timed up to the start of the response
+    started_at = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started_at, request.method, route.path if route else "unmatched", status
+        )
 
-app = FastAPI()
 
 app.include_router(polling.router)
+app.include_router(diagnostics.router)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pymongo.errors import PyMongoError
+from app.config import settings
+from app.services.engine_comparison import REPORT_ENGINES, compare_engines
+from app.services.index_service import ensure_indexes, explain_hot_queries
+from app.services.warmup import startup_state, startup_timings
+from app.utils.metrics import render_metrics
+router = APIRouter()
+
+
+def require_mongodb():
+    if settings.storage_backend != "mongodb":
+        raise HTTPException(status_code=400, detail="Index diagnostics are only available with mongodb storage")
+
+
+@router.get("/diagnostics/query_plans")
+async def query_plans_endpoint():
+    require_mongodb()
+    try:
+        return await explain_hot_queries()
+    except PyMongoError as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.post("/diagnostics/ensure_indexes")
+async def ensure_indexes_endpoint():
+    require_mongodb()
+    try:
+        return await ensure_indexes()
+    except PyMongoError as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.get("/diagnostics/compare_engines")
+async def compare_engines_endpoint(engines: str = "fused,aggregation", stores: int = 100):
+    engine_list = [engine.strip() for engine in engines.split(",") if engine.strip()]
+    unknown = [engine for engine in engine_list if engine not in REPORT_ENGINES]
+    if len(engine_list) < 2 or unknown:
+        raise HTTPException(status_code=400, detail=f"engines must list at least two of {', '.join(REPORT_ENGINES)}")
+    try:
+        return await compare_engines(engine_list, max(1, stores))
+    except PyMongoError as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    # Prometheus scrape target: route and stage latency histograms, rows, bytes and DB command counts
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/ready")
+async def ready_endpoint():
+    # Readiness probe: 503 while the startup caches are still warming, with the time each phase took
+    status = "ready" if startup_state["ready"] else "warming"
+    return JSONResponse({"status": status, "timings": startup_timings}, status_code=200 if startup_state["ready"] else 503)
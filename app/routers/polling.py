@@ -1,41 +1,17 @@
-from fastapi import APIRouter
-from app.services.polling_service import process_all_polling_data,process_latest_polling_data,generate_filtered_data_table_last_hour,calculate_uptime_downtime_last_hour,generate_filtered_data_table_last_day,calculate_uptime_downtime_last_day,generate_filtered_data_table_last_week,calculate_uptime_downtime_last_week,generate_report,get_report
-from app.db import db
+from fastapi import APIRouter, Request
+from app.services.polling_service import process_all_polling_data,process_latest_polling_data,generate_filtered_data_table_last_hour,calculate_uptime_downtime_last_hour,generate_filtered_data_table_last_day,calculate_uptime_downtime_last_day,generate_filtered_data_table_last_week,calculate_uptime_downtime_last_week,generate_report,get_report,get_store_ids,get_store_uptime
+from app.services.report_download import report_download_response
+from app.services.report_jobs import submit_report_job
 from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from collections import deque
+from datetime import datetime, timezone
+from app.config import settings
+import asyncio
+import json
 import os
-import pandas as pd
 router = APIRouter()
-store_ids_arr=[]
-
-async def extract_store_ids():
-    global store_ids_arr  
-    try:
-        
-        df = pd.read_csv("data/store_status.csv")
-
-
-        if 'store_id' not in df.columns:
-            raise ValueError("CSV file must contain a 'store_id' column.")
-
-        
-        store_ids = df['store_id'].unique()
-
-    
-        store_ids_arr = store_ids.tolist()  
-
-        return {"store_ids": store_ids_arr}
-
-    except pd.errors.EmptyDataError:
-        raise HTTPException(status_code=500, detail="CSV file is empty.")
-    except pd.errors.ParserError:
-        raise HTTPException(status_code=500, detail="Error parsing CSV file.")
-    except ValueError as ve:
-        raise HTTPException(status_code=400, detail=str(ve))
-    except Exception as e:
-        print(f"Error: {e}")
-        raise HTTPException(status_code=500, detail="Internal Server Error")
-
-
 
 
 ## Testing API Endpoints
@@ -49,77 +25,84 @@ async def process_latest_polling_data_endpoint():
 
     return await process_latest_polling_data()
 
+async def compute_for_stores(store_ids, compute_store):
+    # Up to store_batch_concurrency stores are computed at once and results come out in store order;
+    # a store that fails is reported in place instead of failing the whole batch
+    async def compute_one(store_id):
+        try:
+            return await compute_store(store_id)
+        except HTTPException as e:
+            return {"store_id": store_id, "error": e.detail}
+        except Exception as e:
+            print(f"Error: {e}")
+            return {"store_id": store_id, "error": "Internal Server Error"}
+
+    pending = deque()
+    try:
+        for store_id in store_ids:
+            pending.append(asyncio.ensure_future(compute_one(store_id)))
+            if len(pending) >= max(1, settings.store_batch_concurrency):
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        # The client went away; stop the stores that are still running
+        for task in pending:
+            task.cancel()
+
+
+async def stores_response(compute_store):
+    store_ids = list(await get_store_ids())
+
+    # The JSON array is streamed item by item, so the response is never held in memory as a whole
+    async def body():
+        yield "["
+        separator = ""
+        async for result in compute_for_stores(store_ids, compute_store):
+            yield separator + json.dumps(jsonable_encoder(result))
+            separator = ","
+        yield "]"
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
 @router.get("/stores/filtered_data_last_hour")
 async def get_filtered_data_for_all_stores_last_hour():
-
-    if not store_ids_arr:
-        await extract_store_ids()
-    results = []
-    
-    for store_id in store_ids_arr:
-        result = await generate_filtered_data_table_last_hour(store_id)
-        results.append(result)
-    
-    return results
+    return await stores_response(generate_filtered_data_table_last_hour)
 
 @router.get("/stores/filtered_data_last_day")
 async def get_filtered_data_for_all_stores_last_day():
-    if not store_ids_arr:
-        await extract_store_ids()
-    results = []
-    
-    for store_id in store_ids_arr:
-        result = await generate_filtered_data_table_last_day(store_id)
-        results.append(result)
-    
-    return results
+    return await stores_response(generate_filtered_data_table_last_day)
+
 @router.get("/stores/filtered_data_last_week")
 async def get_filtered_data_for_all_stores_last_week():
-    if not store_ids_arr:
-        await extract_store_ids()
-    results = []
-    
-    for store_id in store_ids_arr:
-        result = await generate_filtered_data_table_last_week(store_id)
-        results.append(result)
-    
-    return results
+    return await stores_response(generate_filtered_data_table_last_week)
 
 
 @router.get("/stores/uptime_downtime_last_hour")
 async def calculate_uptime_downtime_for_all_stores_last_hour():
-    if not store_ids_arr:
-        await extract_store_ids()
-    results = []
-    
-    for store_id in store_ids_arr:
-        result = await calculate_uptime_downtime_last_hour(store_id)
-        results.append(result)
-    
-    return results
+    return await stores_response(calculate_uptime_downtime_last_hour)
+
 @router.get("/stores/uptime_downtime_last_day")
 async def calculate_uptime_downtime_for_all_stores_last_day():
-    if not store_ids_arr:
-        await extract_store_ids()
-    results = []
-    
-    for store_id in store_ids_arr:
-        result = await calculate_uptime_downtime_last_day(store_id)
-        results.append(result)
-    
-    return results
+    return await stores_response(calculate_uptime_downtime_last_day)
 
 @router.get("/stores/uptime_downtime_last_week")
 async def calculate_uptime_downtime_for_all_stores_last_week():
-    if not store_ids_arr:
-        await extract_store_ids()
-    results = []
-    
-    for store_id in store_ids_arr:
-        result = await calculate_uptime_downtime_last_week(store_id)
-        results.append(result)
-    
-    return results
+    return await stores_response(calculate_uptime_downtime_last_week)
+
+
+def epoch_or_none(value: datetime):
+    # Datetimes without an offset are taken as UTC, like the poll timestamps
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+@router.get("/stores/{store_id}/uptime")
+async def store_uptime_endpoint(store_id: int, start: datetime = None, end: datetime = None):
+    return await get_store_uptime(store_id, epoch_or_none(start), epoch_or_none(end))
 
 
 
@@ -127,19 +110,22 @@ async def calculate_uptime_downtime_for_all_stores_last_week():
 
 @router.post("/trigger_report")
 async def trigger_report_endpoint():
-    report_id = await generate_report()
-    return {"report_id": report_id}
+    return await submit_report_job()
 
 @router.get("/get_report")
 async def get_report_endpoint(report_id: str):
     report = await get_report(report_id)
-    if report["status"] == "Running":
-        return {"status": "Running"}
+    if report["status"] in ("Running", "Failed"):
+        return report
     elif report["status"] == "Complete":
         file_path = report.get("file_path")
         if file_path and os.path.exists(file_path):
-            return {"status": "Complete", "file_path": file_path}
+            return {"status": "Complete", "file_path": file_path, "download_url": f"/download_report?report_id={report_id}", "stages": report.get("stages")}
         else:
             return {"status": "Complete", "message": "File not found"}
     else:
-        raise HTTPException(status_code=404, detail="Report not found")
\ No newline at end of file
+        raise HTTPException(status_code=404, detail="Report not found")
+
+@router.get("/download_report")
+async def download_report_endpoint(report_id: str, request: Request):
+    return await report_download_response(report_id, request.headers)
@@ -0,0 +1,117 @@
+from fastapi import HTTPException
+from app.storage import get_storage
+from app.utils.metrics import timed
+from app.services.report_pipeline import WINDOWS, latest_poll_epoch
+from app.utils.business_hours import MINUTES_PER_WEEK, get_business_hours_index
+
+
+def open_minutes_expression(start, length, hours):
+    # Business minutes within [start, start + length) as an aggregation expression. The start is
+    # wrapped into the week and the hours are repeated one week later, which covers spans up to a week.
+    terms = [
+        {"$max": [0, {"$subtract": [{"$min": [end + offset, "$$end"]}, {"$max": [begin + offset, "$$start"]}]}]}
+        for begin, end in zip(hours.starts.tolist(), hours.ends.tolist())
+        for offset in (0, MINUTES_PER_WEEK)
+    ]
+    return {"$let": {
+        "vars": {"start": {"$mod": [{"$add": [{"$mod": [start, MINUTES_PER_WEEK]}, MINUTES_PER_WEEK]}, MINUTES_PER_WEEK]}},
+        "in": {"$let": {
+            "vars": {"end": {"$add": ["$$start", length]}},
+            "in": {"$add": terms or [0]}
+        }}
+    }}
+
+
+def in_hours_expression(minutes, hours):
+    # Inclusive at both ends like StoreHours.contains
+    return {"$or": [
+        {"$and": [{"$gte": [minutes, begin]}, {"$lte": [minutes, end]}]}
+        for begin, end in zip(hours.starts.tolist(), hours.ends.tolist())
+    ] or [False]}
+
+
+def store_uptime_pipeline(store_id: int, latest_epoch: int, hours):
+    # Same model as window_estimates: each status holds until the next business-hours poll (the last
+    # one until the latest poll), the first poll in a window also covers the time back to the window
+    # start, and only business minutes count. MongoDB returns just the six numbers.
+    week_start = latest_epoch - WINDOWS[-1][1]
+
+    totals = {"_id": None}
+    for name, length, _ in WINDOWS:
+        window_start = latest_epoch - length
+        lead_minutes = {"$divide": [{"$subtract": ["$timestamp_epoch", window_start]}, 60]}
+        first_in_window = {"$and": [
+            {"$gte": ["$timestamp_epoch", window_start]},
+            {"$lt": ["$previous_epoch", window_start]}
+        ]}
+        lead = {"$cond": [
+            first_in_window,
+            open_minutes_expression({"$subtract": ["$minute_of_week", lead_minutes]}, lead_minutes, hours),
+            0
+        ]}
+        counted = {"$cond": [{"$gte": ["$timestamp_epoch", window_start]}, {"$add": ["$open", lead]}, 0]}
+        totals[f"uptime_{name}"] = {"$sum": {"$cond": ["$active", counted, 0]}}
+        totals[f"downtime_{name}"] = {"$sum": {"$cond": ["$active", 0, counted]}}
+
+    return [
+        {"$match": {"store_id": store_id, "timestamp_epoch": {"$gte": week_start, "$lte": latest_epoch}}},
+        {"$match": {"$expr": in_hours_expression("$minute_of_week", hours)}},
+        # Each poll's neighbours among the business-hours polls, in time order
+        {"$setWindowFields": {
+            "sortBy": {"timestamp_epoch": 1},
+            "output": {
+                "next_epoch": {"$shift": {"output": "$timestamp_epoch", "by": 1, "default": latest_epoch}},
+                "previous_epoch": {"$shift": {"output": "$timestamp_epoch", "by": -1, "default": week_start - 1}}
+            }
+        }},
+        {"$set": {
+            "active": {"$eq": ["$status", "active"]},
+            "open": open_minutes_expression(
+                "$minute_of_week", {"$divide": [{"$subtract": ["$next_epoch", "$timestamp_epoch"]}, 60]}, hours
+            )
+        }},
+        {"$group": totals},
+        {"$project": {"_id": 0, **{
+            f"{kind}_last_{name}": {"$divide": [f"${kind}_{name}", unit_minutes]}
+            for name, _, unit_minutes in WINDOWS
+            for kind in ("uptime", "downtime")
+        }}}
+    ]
+
+
+@timed
+async def compute_store_report_entry_aggregation(store_id: int, business_hours=None):
+    try:
+        storage = get_storage()
+        if not storage.supports_aggregation:
+            raise HTTPException(status_code=400, detail=f"The aggregation engine is not available with {storage.name} storage")
+
+        if business_hours is None:
+            business_hours = get_business_hours_index()
+
+        entry = {
+            "store_id": store_id,
+            "uptime_last_hour": 0,
+            "uptime_last_day": 0,
+            "uptime_last_week": 0,
+            "downtime_last_hour": 0,
+            "downtime_last_day": 0,
+            "downtime_last_week": 0
+        }
+
+        latest_epoch = await latest_poll_epoch(store_id)
+        if latest_epoch is None:
+            return entry
+
+        pipeline = store_uptime_pipeline(store_id, latest_epoch, business_hours.hours_for(store_id))
+        results = await storage.aggregate_polls(pipeline)
+        if results:
+            entry.update(results[0])
+
+        return entry
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -0,0 +1,2 @@
+# Run id for intermediates written by the step-by-step testing endpoints outside of a report
+ADHOC_RUN_ID = "adhoc"
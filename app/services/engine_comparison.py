@@ -0,0 +1,60 @@
+import time
+from app.services.polling_service import compute_store_report_entry, discard_run_intermediates, get_store_ids, new_report_id
+from app.utils.business_hours import get_business_hours_index
+
+
+REPORT_ENGINES = ("fused", "aggregation", "legacy", "columnar", "online", "rollup")
+
+REPORT_FIELDS = [
+    "uptime_last_hour", "uptime_last_day", "uptime_last_week",
+    "downtime_last_hour", "downtime_last_day", "downtime_last_week"
+]
+
+# Engines sum the same segments in a different order, so allow for floating point noise
+TOLERANCE = 1e-6
+
+
+async def compare_engines(engines, store_limit: int):
+    # Run every engine over the same stores and data, timing each one and diffing it against the first
+    store_ids = list(await get_store_ids())[:store_limit]
+    business_hours = get_business_hours_index()
+    run_id = f"compare-{new_report_id()}"
+
+    entries = {}
+    seconds = {}
+    try:
+        for engine in engines:
+            started_at = time.perf_counter()
+            entries[engine] = [
+                await compute_store_report_entry(store_id, business_hours, run_id, engine) for store_id in store_ids
+            ]
+            seconds[engine] = round(time.perf_counter() - started_at, 3)
+    finally:
+        if "legacy" in engines:
+            await discard_run_intermediates(run_id)
+
+    baseline = engines[0]
+    differences = {}
+    for engine in engines[1:]:
+        max_difference = 0.0
+        mismatched_stores = []
+        for expected, actual in zip(entries[baseline], entries[engine]):
+            difference = max(abs(float(expected[field]) - float(actual[field])) for field in REPORT_FIELDS)
+            max_difference = max(max_difference, difference)
+            if difference > TOLERANCE:
+                mismatched_stores.append(expected["store_id"])
+        differences[engine] = {
+            "max_abs_difference": max_difference,
+            "mismatched_stores": len(mismatched_stores),
+            "sample_mismatches": mismatched_stores[:20]
+        }
+
+    return {
+        "stores": len(store_ids),
+        "baseline": baseline,
+        "seconds": seconds,
+        "stores_per_sec": {
+            engine: round(len(store_ids) / elapsed, 1) if elapsed > 0 else None for engine, elapsed in seconds.items()
+        },
+        "differences": differences
+    }
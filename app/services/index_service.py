@@ -0,0 +1,132 @@
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from app.config import settings
+from app.db import adb
+from app.services.constants import ADHOC_RUN_ID
+from app.services.report_pipeline import SECONDS_PER_WEEK
+from app.storage.mongodb import INTERMEDIATE_COLLECTIONS
+
+
+# (collection, keys, options) for every access path used by the services
+INDEXES = [
+    # Upserts and per-store reads of raw polls
+    ("all_polling_data", [("store_id", ASCENDING), ("timestamp_utc", ASCENDING)], {"name": "store_id_timestamp_utc", "unique": True}),
+    # Report windows: equality on store, range and sort on the UTC epoch
+    ("all_polling_data", [("store_id", ASCENDING), ("timestamp_epoch", ASCENDING)], {"name": "store_id_timestamp_epoch"}),
+    ("latest_polling_data", [("store_id", ASCENDING)], {"name": "store_id", "unique": True}),
+    # Legacy engine intermediates are read and replaced per (run_id, store_id) and discarded per run_id
+    ("last_hour_records", [("run_id", ASCENDING), ("store_id", ASCENDING), ("timestamp_epoch", ASCENDING)], {"name": "run_id_store_id_timestamp_epoch"}),
+    ("last_day_records", [("run_id", ASCENDING), ("store_id", ASCENDING), ("timestamp_epoch", ASCENDING)], {"name": "run_id_store_id_timestamp_epoch"}),
+    ("last_week_records", [("run_id", ASCENDING), ("store_id", ASCENDING), ("timestamp_epoch", ASCENDING)], {"name": "run_id_store_id_timestamp_epoch"}),
+    ("up_down_hour", [("run_id", ASCENDING), ("store_id", ASCENDING)], {"name": "run_id_store_id"}),
+    ("up_down_day", [("run_id", ASCENDING), ("store_id", ASCENDING)], {"name": "run_id_store_id"}),
+    ("up_down_week", [("run_id", ASCENDING), ("store_id", ASCENDING)], {"name": "run_id_store_id"}),
+    # Rollups are upserted per (store_id, hour) and read as hour ranges of one store
+    ("poll_rollups", [("store_id", ASCENDING), ("hour", ASCENDING)], {"name": "store_id_hour", "unique": True}),
+    ("reports", [("report_id", ASCENDING)], {"name": "report_id", "unique": True}),
+    ("reports", [("fingerprint", ASCENDING), ("created_at", DESCENDING)], {"name": "fingerprint_created_at"}),
+] + [
+    # Intermediates left behind by a run that never finished expire on their own
+    (collection, [("created_at", ASCENDING)], {"name": "created_at_ttl", "expireAfterSeconds": settings.intermediate_ttl_seconds})
+    for collection in INTERMEDIATE_COLLECTIONS
+]
+
+
+# IndexOptionsConflict and IndexKeySpecsConflict
+INDEX_OPTIONS_CONFLICT_CODES = (85, 86)
+
+
+async def ensure_indexes():
+    # create_index is a no-op for indexes that already exist, so this is safe on every startup
+    results = []
+    for collection, keys, options in INDEXES:
+        try:
+            await adb[collection].create_index(keys, **options)
+            results.append({"collection": collection, "index": options["name"], "status": "ok"})
+        except OperationFailure as e:
+            if "expireAfterSeconds" in options and e.code in INDEX_OPTIONS_CONFLICT_CODES:
+                # A changed TTL is applied in place instead of rebuilding the index
+                await adb.run(lambda: adb.sync.command(
+                    "collMod", collection, index={"name": options["name"], "expireAfterSeconds": options["expireAfterSeconds"]}
+                ))
+                results.append({"collection": collection, "index": options["name"], "status": "ttl_updated"})
+                continue
+            if not options.get("unique"):
+                raise
+            # Duplicates written before upserts block a unique index; still index the lookup
+            print(f"Error: unique index {options['name']} on {collection} not created: {e}")
+            await adb[collection].create_index(keys, name=f"{options['name']}_non_unique")
+            results.append({"collection": collection, "index": f"{options['name']}_non_unique", "status": "duplicates"})
+    return results
+
+
+async def ensure_indexes_on_startup():
+    # The sqlite backend creates its indexes with its schema
+    if settings.storage_backend != "mongodb":
+        return
+    try:
+        for result in await ensure_indexes():
+            if result["status"] != "ok":
+                print(f"Index {result['index']} on {result['collection']}: {result['status']}")
+    except PyMongoError as e:
+        print(f"Error: could not ensure indexes: {e}")
+
+
+def hot_queries(store_id, report_id):
+    # (name, collection, filter, sort) mirroring the queries issued by polling_service and report_pipeline
+    return [
+        ("latest_poll_epoch", "all_polling_data", {
+            "store_id": store_id, "timestamp_epoch": {"$exists": True}
+        }, [("timestamp_epoch", DESCENDING)]),
+        ("week_window", "all_polling_data", {
+            "store_id": store_id, "timestamp_epoch": {"$gte": 0, "$lte": SECONDS_PER_WEEK}
+        }, [("timestamp_epoch", ASCENDING)]),
+        ("poll_upsert_key", "all_polling_data", {"store_id": store_id, "timestamp_utc": None}, None),
+        ("week_rollups", "poll_rollups", {"store_id": store_id, "hour": {"$gte": 0, "$lte": SECONDS_PER_WEEK // 3600}}, [("hour", ASCENDING)]),
+        ("last_hour_records_window", "last_hour_records", {
+            "run_id": ADHOC_RUN_ID, "store_id": store_id, "timestamp_epoch": {"$gte": 0, "$lte": SECONDS_PER_WEEK}
+        }, [("timestamp_epoch", ASCENDING)]),
+        ("last_day_records_window", "last_day_records", {
+            "run_id": ADHOC_RUN_ID, "store_id": store_id, "timestamp_epoch": {"$gte": 0, "$lte": SECONDS_PER_WEEK}
+        }, [("timestamp_epoch", ASCENDING)]),
+        ("last_week_records_window", "last_week_records", {
+            "run_id": ADHOC_RUN_ID, "store_id": store_id, "timestamp_epoch": {"$gte": 0, "$lte": SECONDS_PER_WEEK}
+        }, [("timestamp_epoch", ASCENDING)]),
+        ("report_by_id", "reports", {"report_id": report_id}, None),
+        ("cached_report", "reports", {"fingerprint": "", "status": "Complete"}, [("created_at", DESCENDING)]),
+    ]
+
+
+def plan_stages(plan):
+    # Every stage name in a winning plan, walking nested inputStage/inputStages and SBE queryPlan wrappers
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for key in ("queryPlan", "inputStage"):
+            stages.extend(plan_stages(plan.get(key)))
+        for child in plan.get("inputStages", []):
+            stages.extend(plan_stages(child))
+    return stages
+
+
+async def explain_hot_queries():
+    sample_store = await adb.latest_polling_data.find_one({}, {"store_id": 1}) or {"store_id": 0}
+    sample_report = await adb.reports.find_one({}, {"report_id": 1}) or {"report_id": ""}
+
+    results = []
+    for name, collection, query, sort in hot_queries(sample_store["store_id"], sample_report["report_id"]):
+        plan = await adb[collection].explain(query, sort)
+        winning_plan = plan.get("queryPlanner", {}).get("winningPlan", {})
+        stages = plan_stages(winning_plan)
+        results.append({
+            "query": name,
+            "collection": collection,
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages
+        })
+
+    return {
+        "collection_scans": [result["query"] for result in results if result["collection_scan"]],
+        "queries": results
+    }
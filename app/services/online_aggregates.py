@@ -0,0 +1,216 @@
+import threading
+import numpy as np
+from app.config import settings
+from app.services.poll_store import empty_report_entry
+from app.services.report_pipeline import SECONDS_PER_HOUR, SECONDS_PER_WEEK, WINDOWS
+from app.utils.time_conversion import DEFAULT_TIMEZONE, local_minute_of_week
+
+
+# Polls expire a whole hour at a time; a store keeps the hours of its trailing week plus the hour the
+# week's start falls in
+RETAINED_HOURS = SECONDS_PER_WEEK // SECONDS_PER_HOUR + 1
+
+WINDOW_LENGTHS = np.array([length for _, length, _ in WINDOWS], dtype=np.int64)
+WINDOW_UNITS = np.array([unit_minutes for _, _, unit_minutes in WINDOWS], dtype=np.float64)
+
+
+class StoreWindows:
+    # One store's running state: its latest poll, and the business-hours polls of the trailing week with
+    # running sums of the open minutes each status held. up_before[i] and down_before[i] are the open
+    # minutes of the intervals between polls 0..i, so a window is one difference of the sums plus the
+    # partial intervals at its two edges. Per-hour sums alone would not do: the windows end at the latest
+    # poll and extrapolate their first poll back to their start, so the polls at both edges are needed,
+    # and as the window starts move with every new poll each poll of the week becomes an edge in turn.
+    # active_now and transition_epoch are the status of the newest of those polls and the first poll of
+    # the unbroken run of that status, as far back as the week goes.
+    __slots__ = ("latest_epoch", "active_now", "transition_epoch", "epochs", "minutes_of_week", "active", "up_before", "down_before", "estimates")
+
+    def __init__(self):
+        self.latest_epoch = None
+        self.active_now = None
+        self.transition_epoch = None
+        self.epochs = np.zeros(0, dtype=np.int64)
+        self.minutes_of_week = np.zeros(0, dtype=np.float64)
+        self.active = np.zeros(0, dtype=bool)
+        self.up_before = np.zeros(0, dtype=np.float64)
+        self.down_before = np.zeros(0, dtype=np.float64)
+        self.estimates = None
+
+    def add(self, epochs, minutes_of_week, active, hours):
+        # epochs sorted and unique; polls the store already has are ignored, late ones are merged in place
+        if self.latest_epoch is None or epochs[-1] > self.latest_epoch:
+            self.latest_epoch = int(epochs[-1])
+
+        inside = hours.contains(minutes_of_week)
+        epochs, minutes_of_week, active = epochs[inside], minutes_of_week[inside], active[inside]
+        unseen = ~np.isin(epochs, self.epochs)
+        epochs, minutes_of_week, active = epochs[unseen], minutes_of_week[unseen], active[unseen]
+
+        if len(epochs):
+            # Sums before the first new poll still hold; everything from the interval it splits is recomputed
+            first_changed = int(np.searchsorted(self.epochs, epochs[0]))
+            order = np.argsort(np.concatenate((self.epochs, epochs)), kind='stable')
+            self.epochs = np.concatenate((self.epochs, epochs))[order]
+            self.minutes_of_week = np.concatenate((self.minutes_of_week, minutes_of_week))[order]
+            self.active = np.concatenate((self.active, active))[order]
+            self.accumulate(max(first_changed - 1, 0), hours)
+
+        self.expire()
+        self.current_run()
+        self.estimates = self.window_estimates(hours)
+
+    def current_run(self):
+        # Read off the merged polls, so a late poll inside the current run ends it where it falls
+        if not len(self.active):
+            self.active_now = self.transition_epoch = None
+            return
+        changes = np.flatnonzero(self.active[1:] != self.active[:-1])
+        self.active_now = bool(self.active[-1])
+        self.transition_epoch = int(self.epochs[changes[-1] + 1 if len(changes) else 0])
+
+    def accumulate(self, start: int, hours):
+        # Recompute the running sums from poll start on; each status holds until the next poll
+        up_before = np.zeros(len(self.epochs), dtype=np.float64)
+        down_before = np.zeros(len(self.epochs), dtype=np.float64)
+        kept = min(start + 1, len(self.up_before))
+        up_before[:kept] = self.up_before[:kept]
+        down_before[:kept] = self.down_before[:kept]
+
+        open_minutes = hours.overlap(self.minutes_of_week[start:-1], np.diff(self.epochs[start:]) / 60)
+        up_before[start + 1:] = up_before[start] + np.cumsum(np.where(self.active[start:-1], open_minutes, 0.0))
+        down_before[start + 1:] = down_before[start] + np.cumsum(np.where(self.active[start:-1], 0.0, open_minutes))
+        self.up_before, self.down_before = up_before, down_before
+
+    def expire(self):
+        # Drop the hours that fell out of the week
+        oldest = (self.latest_epoch // SECONDS_PER_HOUR - RETAINED_HOURS + 1) * SECONDS_PER_HOUR
+        first = int(np.searchsorted(self.epochs, oldest))
+        if first:
+            self.epochs, self.minutes_of_week, self.active = self.epochs[first:], self.minutes_of_week[first:], self.active[first:]
+            self.up_before, self.down_before = self.up_before[first:] - self.up_before[first], self.down_before[first:] - self.down_before[first]
+
+    def window_estimates(self, hours):
+        # (uptime, downtime) per report window, with the same edges as active_window_estimates: the last
+        # status holds until the latest poll and the first one in the window is extrapolated back to its start
+        count = len(self.epochs)
+        if not count:
+            return (0.0,) * 6
+
+        window_starts = self.latest_epoch - WINDOW_LENGTHS
+        firsts = np.searchsorted(self.epochs, window_starts, side='left')
+        in_window = firsts < count
+        firsts = np.minimum(firsts, count - 1)
+
+        tail = float(hours.overlap(self.minutes_of_week[-1:], [(self.latest_epoch - self.epochs[-1]) / 60])[0])
+        leads = (self.epochs[firsts] - window_starts) / 60
+        lead_open = hours.overlap(self.minutes_of_week[firsts] - leads, leads)
+        first_active = self.active[firsts]
+
+        uptime = self.up_before[-1] - self.up_before[firsts] + (tail if self.active[-1] else 0.0) + np.where(first_active, lead_open, 0.0)
+        downtime = self.down_before[-1] - self.down_before[firsts] + (0.0 if self.active[-1] else tail) + np.where(first_active, 0.0, lead_open)
+        uptime = np.where(in_window, uptime / WINDOW_UNITS, 0.0)
+        downtime = np.where(in_window, downtime / WINDOW_UNITS, 0.0)
+        return tuple(uptime.tolist()) + tuple(downtime.tolist())
+
+
+def sorted_store_polls(store_ids, epochs, minutes_of_week, active):
+    # Polls grouped by store then time, the first of any repeated (store_id, timestamp_epoch) kept
+    order = np.lexsort((epochs, store_ids))
+    store_ids, epochs, minutes_of_week, active = store_ids[order], epochs[order], minutes_of_week[order], active[order]
+    keep = np.ones(len(epochs), dtype=bool)
+    keep[1:] = (store_ids[1:] != store_ids[:-1]) | (epochs[1:] != epochs[:-1])
+    store_ids, epochs, minutes_of_week, active = store_ids[keep], epochs[keep], minutes_of_week[keep], active[keep]
+
+    boundaries = np.flatnonzero(store_ids[1:] != store_ids[:-1]) + 1
+    starts = np.concatenate(([0], boundaries)) if len(store_ids) else boundaries
+    return zip(
+        store_ids[starts].tolist(), np.split(epochs, boundaries), np.split(minutes_of_week, boundaries), np.split(active, boundaries)
+    )
+
+
+class OnlineAggregates:
+    # Running uptime state for every store in this process. Ingest feeds it each batch of polls and
+    # folds them in once the batch is written, so a report only reads the cached numbers. version is
+    # the ingest watermark the state reflects; with another version, other business hours or other
+    # store timezones (which place every poll in the week) it is rebuilt.
+
+    def __init__(self):
+        self.stores = {}
+        self.pending = []
+        self.pending_rows = 0
+        self.version = None
+        self.business_hours = None
+        self.store_timezones = None
+        self.lock = threading.Lock()
+
+    def is_current(self, version, business_hours, store_timezones):
+        # The business hours index and the timezones are cached per file mtime, so a changed file is a new object
+        return self.business_hours is business_hours and self.store_timezones is store_timezones and self.version == version
+
+    def add_polls(self, store_ids, epochs, minutes_of_week, active):
+        # Queued so a store touched by several chunks is updated once, but folded in as soon as an
+        # ingest chunk's worth is waiting, so a large ingest never holds all of its polls
+        with self.lock:
+            self.pending.append((
+                np.asarray(store_ids), np.asarray(epochs, dtype=np.int64),
+                np.asarray(minutes_of_week, dtype=np.float64), np.asarray(active, dtype=bool)
+            ))
+            self.pending_rows += len(self.pending[-1][0])
+            full = self.pending_rows >= settings.ingest_chunk_size
+        return self.flush() if full else 0
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return 0
+            columns = [np.concatenate(column) for column in zip(*self.pending)]
+            self.pending = []
+            self.pending_rows = 0
+            updated = 0
+            for store_id, epochs, minutes_of_week, active in sorted_store_polls(*columns):
+                self.stores.setdefault(store_id, StoreWindows()).add(
+                    epochs, minutes_of_week, active, self.business_hours.hours_for(store_id)
+                )
+                updated += 1
+            return updated
+
+    def rebuild(self, poll_store, business_hours, store_timezones, version):
+        # Start over from every store's stored week of polls; the current status and its start are
+        # then known as far back as that week
+        stores = {}
+        for position, store_id in enumerate(poll_store.store_ids.tolist()):
+            epochs, active = poll_store.polls(position)
+            if not len(epochs):
+                continue
+            recent = np.searchsorted(epochs, epochs[-1] - SECONDS_PER_WEEK, side='left')
+            epochs, active = np.asarray(epochs[recent:]), np.asarray(active[recent:])
+            minutes_of_week = local_minute_of_week(epochs, store_timezones.get(store_id, DEFAULT_TIMEZONE))
+            stores[store_id] = StoreWindows()
+            stores[store_id].add(epochs, minutes_of_week, active, business_hours.hours_for(store_id))
+
+        with self.lock:
+            self.stores = stores
+            self.pending = []
+            self.pending_rows = 0
+            self.business_hours = business_hours
+            self.store_timezones = store_timezones
+            self.version = version
+        return len(stores)
+
+    def entry(self, store_id):
+        windows = self.stores.get(store_id)
+        if windows is None or windows.estimates is None:
+            return empty_report_entry(store_id)
+        uptime_hour, uptime_day, uptime_week, downtime_hour, downtime_day, downtime_week = windows.estimates
+        return {
+            "store_id": store_id,
+            "uptime_last_hour": uptime_hour,
+            "uptime_last_day": uptime_day,
+            "uptime_last_week": uptime_week,
+            "downtime_last_hour": downtime_hour,
+            "downtime_last_day": downtime_day,
+            "downtime_last_week": downtime_week
+        }
+
+
+online_aggregates = OnlineAggregates()
@@ -0,0 +1,265 @@
+import threading
+import numpy as np
+from app.config import settings
+from app.services.online_aggregates import sorted_store_polls
+from app.services.report_pipeline import SECONDS_PER_HOUR, active_window_estimates
+from app.utils.time_conversion import DEFAULT_TIMEZONE, local_minute_of_week
+
+
+# One rollup per store and UTC hour. up_minutes and down_minutes are the open business minutes of the
+# intervals between consecutive business-hours polls that start in the hour, each credited to the status
+# of the poll it starts at. The hour's first and last polls are kept for the partial hours at window edges,
+# and last_up_minutes / last_down_minutes are the share of the last poll's interval, 0 until the next poll.
+ROLLUP_FIELDS = [
+    "store_id", "hour", "up_minutes", "down_minutes", "polls",
+    "first_epoch", "first_minute_of_week", "first_active",
+    "last_epoch", "last_minute_of_week", "last_active", "last_up_minutes", "last_down_minutes"
+]
+
+# Stores looked up per last_rollups call
+ROLLUP_LOOKUP_BATCH = 500
+
+rollup_lock = threading.Lock()
+
+
+def store_rollups(store_id, epochs, minutes_of_week, active, hours, carry=None):
+    # Rollups for a store's business-hours polls, sorted and all later than carry's last poll. carry is the
+    # rollup holding the store's previous poll: the first new poll completes its last interval, and new polls
+    # in its hour are added to it. Returns carry, updated, followed by the rollups of later hours.
+    if not len(epochs):
+        return [carry] if carry is not None else []
+
+    if carry is not None:
+        carry = dict(carry)
+        epochs_from = np.concatenate(([carry["last_epoch"]], epochs))
+        minutes_from = np.concatenate(([carry["last_minute_of_week"]], minutes_of_week))
+    else:
+        epochs_from, minutes_from = epochs, minutes_of_week
+    open_minutes = hours.overlap(minutes_from[:-1], np.diff(epochs_from) / 60)
+
+    if carry is not None:
+        carry["last_up_minutes"], carry["last_down_minutes"] = (float(open_minutes[0]), 0.0) if carry["last_active"] else (0.0, float(open_minutes[0]))
+        carry["up_minutes"] += carry["last_up_minutes"]
+        carry["down_minutes"] += carry["last_down_minutes"]
+        open_minutes = open_minutes[1:]
+
+    # Interval i starts at poll i; the newest poll has none yet
+    open_minutes = np.append(open_minutes, 0.0)
+    up = np.where(active, open_minutes, 0.0)
+    down = np.where(active, 0.0, open_minutes)
+
+    hour_of_poll = epochs // SECONDS_PER_HOUR
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(hour_of_poll)) + 1))
+    ends = np.append(starts[1:], len(epochs))
+    rollups = [carry] if carry is not None else []
+    for start, end, up_minutes, down_minutes in zip(starts.tolist(), ends.tolist(), np.add.reduceat(up, starts).tolist(), np.add.reduceat(down, starts).tolist()):
+        last = end - 1
+        latest = {
+            "last_epoch": int(epochs[last]),
+            "last_minute_of_week": float(minutes_of_week[last]),
+            "last_active": bool(active[last]),
+            "last_up_minutes": float(up[last]),
+            "last_down_minutes": float(down[last])
+        }
+        if carry is not None and int(hour_of_poll[start]) == carry["hour"]:
+            carry["up_minutes"] += up_minutes
+            carry["down_minutes"] += down_minutes
+            carry["polls"] += end - start
+            carry.update(latest)
+            continue
+        rollups.append({
+            "store_id": store_id,
+            "hour": int(hour_of_poll[start]),
+            "up_minutes": up_minutes,
+            "down_minutes": down_minutes,
+            "polls": end - start,
+            "first_epoch": int(epochs[start]),
+            "first_minute_of_week": float(minutes_of_week[start]),
+            "first_active": bool(active[start]),
+            **latest
+        })
+    return rollups
+
+
+def reopen_last_interval(rollup):
+    # The rollup as it was before the poll after its last one arrived
+    rollup = dict(rollup)
+    rollup["up_minutes"] -= rollup["last_up_minutes"]
+    rollup["down_minutes"] -= rollup["last_down_minutes"]
+    rollup["last_up_minutes"] = rollup["last_down_minutes"] = 0.0
+    return rollup
+
+
+def window_hours(window_start: int, window_end: int):
+    # (first_hour, last_hour) of the whole hours inside the window, empty when first_hour > last_hour
+    return window_start // SECONDS_PER_HOUR + 1, window_end // SECONDS_PER_HOUR - 1
+
+
+def window_edges(window_start: int, window_end: int):
+    # The epoch ranges whose polls a window needs besides the rollups of its whole hours
+    first_hour, last_hour = window_hours(window_start, window_end)
+    if first_hour > last_hour:
+        return [(window_start, window_end)]
+    return [(window_start, first_hour * SECONDS_PER_HOUR - 1), ((last_hour + 1) * SECONDS_PER_HOUR, window_end)]
+
+
+def merged_ranges(ranges):
+    # Overlapping or adjacent (start, end) ranges joined, so each poll is read once
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def rollup_window_estimates(window_start, window_end, rollups, epochs, minutes_of_week, active, hours, unit_minutes):
+    # (uptime, downtime) over [window_start, window_end] with the semantics of active_window_estimates,
+    # from the rollups of the whole hours inside the window and the business-hours polls of the partial
+    # hours at its two edges. Rollups and polls outside those ranges are ignored.
+    first_hour, last_hour = window_hours(window_start, window_end)
+    end_hour = last_hour + 1
+    if first_hour > last_hour:
+        # No whole hour inside: the polls cover the window
+        inside = (epochs >= window_start) & (epochs <= window_end)
+        return active_window_estimates(epochs[inside], minutes_of_week[inside], active[inside], window_start, window_end, hours, unit_minutes)
+
+    head = (epochs >= window_start) & (epochs < first_hour * SECONDS_PER_HOUR)
+    tail = (epochs >= end_hour * SECONDS_PER_HOUR) & (epochs <= window_end)
+    head_epochs, head_minutes, head_active = epochs[head], minutes_of_week[head], active[head]
+    tail_epochs, tail_minutes, tail_active = epochs[tail], minutes_of_week[tail], active[tail]
+    middle = [rollup for rollup in rollups if first_hour <= rollup["hour"] < end_hour and rollup["polls"]]
+
+    # The first and last polls inside the window, as (epoch, minute_of_week, active)
+    if len(head_epochs):
+        first = (head_epochs[0], head_minutes[0], head_active[0])
+    elif middle:
+        first = (middle[0]["first_epoch"], middle[0]["first_minute_of_week"], middle[0]["first_active"])
+    elif len(tail_epochs):
+        first = (tail_epochs[0], tail_minutes[0], tail_active[0])
+    else:
+        return 0, 0
+    if len(tail_epochs):
+        last = (tail_epochs[-1], tail_minutes[-1], tail_active[-1])
+    elif middle:
+        last = (middle[-1]["last_epoch"], middle[-1]["last_minute_of_week"], middle[-1]["last_active"])
+    else:
+        last = (head_epochs[-1], head_minutes[-1], head_active[-1])
+
+    uptime = downtime = 0.0
+
+    # Intervals starting in the head: between its polls, then from its last poll to the next one
+    if len(head_epochs):
+        next_epoch = middle[0]["first_epoch"] if middle else (tail_epochs[0] if len(tail_epochs) else None)
+        interval_ends = head_epochs[1:] if next_epoch is None else np.append(head_epochs[1:], next_epoch)
+        starts = len(interval_ends)
+        open_minutes = hours.overlap(head_minutes[:starts], (interval_ends - head_epochs[:starts]) / 60)
+        uptime += float(open_minutes[head_active[:starts]].sum())
+        downtime += float(open_minutes[~head_active[:starts]].sum())
+
+    # Whole hours; without polls in the tail, the last interval of the last hour runs past the window
+    for rollup in middle:
+        uptime += rollup["up_minutes"]
+        downtime += rollup["down_minutes"]
+    if middle and not len(tail_epochs):
+        uptime -= middle[-1]["last_up_minutes"]
+        downtime -= middle[-1]["last_down_minutes"]
+
+    # Intervals between the tail's polls
+    if len(tail_epochs) > 1:
+        open_minutes = hours.overlap(tail_minutes[:-1], np.diff(tail_epochs) / 60)
+        uptime += float(open_minutes[tail_active[:-1]].sum())
+        downtime += float(open_minutes[~tail_active[:-1]].sum())
+
+    # The last status holds until the window end, the first is extrapolated back to its start
+    last_open = float(hours.overlap([last[1]], [(window_end - last[0]) / 60])[0])
+    lead = (first[0] - window_start) / 60
+    lead_open = float(hours.overlap([first[1] - lead], [lead])[0])
+    uptime += (last_open if last[2] else 0.0) + (lead_open if first[2] else 0.0)
+    downtime += (0.0 if last[2] else last_open) + (0.0 if first[2] else lead_open)
+    return uptime / unit_minutes, downtime / unit_minutes
+
+
+def stored_store_polls(storage, store_id, since_epoch, store_timezones):
+    # A store's stored polls from since_epoch on, with minute_of_week derived like the columnar engine
+    chunks = list(storage.iter_poll_columns(since_epoch, [store_id]))
+    epochs = np.concatenate([chunk_epochs for _, chunk_epochs, _ in chunks]) if chunks else np.zeros(0, dtype=np.int64)
+    active = np.concatenate([chunk_active for _, _, chunk_active in chunks]) if chunks else np.zeros(0, dtype=bool)
+    return epochs, local_minute_of_week(epochs, store_timezones.get(store_id, DEFAULT_TIMEZONE)), active
+
+
+def update_rollups(storage, store_ids, epochs, minutes_of_week, active, business_hours, store_timezones):
+    # Fold newly stored polls into the rollups. Polls after a store's last rolled up poll extend its
+    # rollups; earlier ones (late or re-ingested polls) recompute the store from the hour they fall in.
+    rollups, stores = [], 0
+    groups = list(sorted_store_polls(np.asarray(store_ids), np.asarray(epochs, dtype=np.int64), np.asarray(minutes_of_week, dtype=np.float64), np.asarray(active, dtype=bool)))
+    latest = {}
+    for start in range(0, len(groups), ROLLUP_LOOKUP_BATCH):
+        latest.update(storage.last_rollups([store_id for store_id, _, _, _ in groups[start:start + ROLLUP_LOOKUP_BATCH]]))
+
+    for store_id, store_epochs, store_minutes, store_active in groups:
+        hours = business_hours.hours_for(store_id)
+        inside = hours.contains(store_minutes)
+        store_epochs, store_minutes, store_active = store_epochs[inside], store_minutes[inside], store_active[inside]
+        if not len(store_epochs):
+            continue
+        stores += 1
+
+        carry = latest.get(store_id)
+        if carry is None or store_epochs[0] > carry["last_epoch"]:
+            rollups.extend(store_rollups(store_id, store_epochs, store_minutes, store_active, hours, carry))
+            continue
+
+        from_hour = int(store_epochs[0]) // SECONDS_PER_HOUR
+        carry = storage.last_rollups([store_id], before_hour=from_hour).get(store_id)
+        polls_epochs, polls_minutes, polls_active = stored_store_polls(storage, store_id, from_hour * SECONDS_PER_HOUR, store_timezones)
+        inside = hours.contains(polls_minutes)
+        storage.delete_rollups(store_id, from_hour)
+        rollups.extend(store_rollups(
+            store_id, polls_epochs[inside], polls_minutes[inside], polls_active[inside], hours,
+            reopen_last_interval(carry) if carry is not None else None
+        ))
+
+    storage.upsert_rollups(rollups)
+    return stores
+
+
+def rebuild_rollups(storage, business_hours, store_timezones):
+    # Recompute every rollup from the stored polls, one store at a time in store order. They replace the
+    # live rollups in one step once all are written, so a report reading meanwhile sees the old ones.
+    stores = 0
+
+    def roll_up(store_id, epochs, active):
+        nonlocal stores
+        minutes_of_week = local_minute_of_week(epochs, store_timezones.get(store_id, DEFAULT_TIMEZONE))
+        hours = business_hours.hours_for(store_id)
+        inside = hours.contains(minutes_of_week)
+        stores += 1
+        return store_rollups(store_id, epochs[inside], minutes_of_week[inside], active[inside], hours)
+
+    def batches():
+        rollups, pending = [], None
+        for chunk_store_ids, epochs, active in storage.iter_poll_columns(0):
+            boundaries = np.flatnonzero(chunk_store_ids[1:] != chunk_store_ids[:-1]) + 1
+            starts = np.concatenate(([0], boundaries)).astype(np.int64)
+            ends = np.append(boundaries, len(epochs))
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                store_id = chunk_store_ids[start].item()
+                # A store continued from the previous chunk is joined up first
+                if pending is not None and pending[0] == store_id:
+                    pending = (store_id, np.concatenate((pending[1], epochs[start:end])), np.concatenate((pending[2], active[start:end])))
+                    continue
+                if pending is not None:
+                    rollups.extend(roll_up(*pending))
+                pending = (store_id, epochs[start:end], active[start:end])
+            if len(rollups) >= settings.insert_batch_size:
+                yield rollups
+                rollups = []
+
+        if pending is not None:
+            rollups.extend(roll_up(*pending))
+        yield rollups
+
+    storage.replace_rollups(batches())
+    return stores
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+from app.services.report_pipeline import SECONDS_PER_WEEK, WINDOWS, active_window_estimates
+from app.utils.time_conversion import DEFAULT_TIMEZONE, local_minute_of_week
+
+
+class PollStore:
+    # Every store's trailing window of polls as flat columns grouped by store (CSR layout): the polls of
+    # store position p are rows offsets[p]:offsets[p + 1], oldest first. A poll costs 13 bytes: an int32
+    # store position, an int64 epoch and a one-byte status. Per-store slices are views, never copies.
+
+    def __init__(self, store_ids, latest_epochs, offsets, store_index, epochs, active):
+        self.store_ids = store_ids
+        self.latest_epochs = latest_epochs
+        self.offsets = offsets
+        self.store_index = store_index
+        self.epochs = epochs
+        self.active = active
+        self.positions = {store_id: position for position, store_id in enumerate(store_ids.tolist())}
+
+    @classmethod
+    def load(cls, storage, window_seconds: int = SECONDS_PER_WEEK, store_ids=None, chunk_size: int = 100000):
+        # One ordered read of the polls inside any store's window; chunks are trimmed to each store's own
+        # [latest - window_seconds, latest] as they arrive, so older history is never held
+        latest = storage.latest_poll_epochs(store_ids)
+        catalog = pd.Index(list(latest))
+        latest_epochs = np.array([latest[store_id] for store_id in catalog], dtype=np.int64)
+        window_starts = latest_epochs - window_seconds
+
+        positions, epochs, active = [], [], []
+        if len(catalog):
+            for chunk_store_ids, chunk_epochs, chunk_active in storage.iter_poll_columns(
+                int(window_starts.min()), store_ids, chunk_size
+            ):
+                chunk_positions = catalog.get_indexer(chunk_store_ids)
+                keep = (chunk_positions >= 0) & (chunk_epochs >= window_starts[chunk_positions])
+                positions.append(chunk_positions[keep].astype(np.int32))
+                epochs.append(chunk_epochs[keep])
+                active.append(chunk_active[keep])
+
+        store_index = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int32)
+        epochs = np.concatenate(epochs) if epochs else np.zeros(0, dtype=np.int64)
+        active = np.concatenate(active) if active else np.zeros(0, dtype=bool)
+
+        # Backends order stores their own way; a stable sort groups them by position and keeps time order
+        if len(store_index) and np.any(np.diff(store_index) < 0):
+            order = np.argsort(store_index, kind='stable')
+            store_index, epochs, active = store_index[order], epochs[order], active[order]
+
+        offsets = np.zeros(len(catalog) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(store_index, minlength=len(catalog)), out=offsets[1:])
+        return cls(catalog.to_numpy(), latest_epochs, offsets, store_index, epochs, active)
+
+    @classmethod
+    def from_segment(cls, segment):
+        # A segment already has this layout, so its mapped columns are used as they are: nothing is read
+        # or copied up front, and each store's slice is trimmed to its windows when it is computed
+        return cls(segment.store_ids, segment.latest_epochs(), segment.offsets, segment.store_index, segment.epochs, segment.active)
+
+    @classmethod
+    def load_segments(cls, segment_store, window_seconds: int = SECONDS_PER_WEEK, store_ids=None):
+        # Views of a single segment; several are merged into arrays like a storage read
+        segments = segment_store.segments()
+        if len(segments) == 1:
+            return cls.from_segment(segments[0])
+        return cls.load(segment_store, window_seconds, store_ids)
+
+    def __len__(self):
+        return len(self.epochs)
+
+    @property
+    def nbytes(self):
+        return self.store_index.nbytes + self.epochs.nbytes + self.active.nbytes + self.offsets.nbytes + self.latest_epochs.nbytes
+
+    def position(self, store_id):
+        return self.positions.get(store_id)
+
+    def polls(self, position: int):
+        # (epochs, active) views of one store's polls
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.epochs[start:end], self.active[start:end]
+
+
+def empty_report_entry(store_id):
+    return {
+        "store_id": store_id,
+        "uptime_last_hour": 0,
+        "uptime_last_day": 0,
+        "uptime_last_week": 0,
+        "downtime_last_hour": 0,
+        "downtime_last_day": 0,
+        "downtime_last_week": 0
+    }
+
+
+def columnar_report_entry(store_id, poll_store: PollStore, business_hours, store_timezones):
+    # The fused engine's computation on a PollStore slice; minute_of_week is derived from the epoch
+    # and the store's timezone instead of being stored per poll
+    entry = empty_report_entry(store_id)
+    position = poll_store.position(store_id)
+    if position is None:
+        return entry
+
+    latest_epoch = int(poll_store.latest_epochs[position])
+    epochs, active = poll_store.polls(position)
+    recent = np.searchsorted(epochs, latest_epoch - SECONDS_PER_WEEK, side='left')
+    epochs, active = epochs[recent:], active[recent:]
+    minutes_of_week = local_minute_of_week(epochs, store_timezones.get(store_id, DEFAULT_TIMEZONE))
+
+    # Apply business hours once; every window keeps the filtered, epoch-sorted polls
+    hours = business_hours.hours_for(store_id)
+    inside = hours.contains(minutes_of_week)
+    epochs, minutes_of_week, active = epochs[inside], minutes_of_week[inside], active[inside]
+
+    for name, length, unit_minutes in WINDOWS:
+        window_start = latest_epoch - length
+        first = np.searchsorted(epochs, window_start, side='left')
+        uptime, downtime = active_window_estimates(
+            epochs[first:], minutes_of_week[first:], active[first:], window_start, latest_epoch, hours, unit_minutes
+        )
+        entry[f"uptime_last_{name}"] = uptime
+        entry[f"downtime_last_{name}"] = downtime
+
+    return entry
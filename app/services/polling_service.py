@@ -1,285 +1,648 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime,timedelta
-import pytz
+import asyncio
+import contextvars
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+import time
+import numpy as np
 import pandas as pd
 from fastapi import HTTPException
-from app.db import db
+from app.config import settings
+from app.services.aggregation_pipeline import compute_store_report_entry_aggregation
+from app.services.constants import ADHOC_RUN_ID
+from app.services.online_aggregates import OnlineAggregates, online_aggregates
+from app.services.poll_rollups import (
+    merged_ranges, rebuild_rollups, rollup_lock, rollup_window_estimates, update_rollups, window_edges, window_hours
+)
+from app.services.poll_store import PollStore, columnar_report_entry, empty_report_entry
+from app.services.report_pipeline import (
+    SECONDS_PER_DAY, SECONDS_PER_HOUR, SECONDS_PER_WEEK, WINDOWS, active_window_estimates, compute_store_report_entry_fused,
+    latest_poll_epoch, window_estimates
+)
+from app.services.uptime_cache import uptime_cache
+from app.storage import get_storage
+from app.storage.segments import SEGMENT_RECORD, SegmentStore, get_segment_store, reset_segment_store
+from app.utils.metrics import collect_stages, record_bytes, record_rows, rounded, stage, timed
+from app.utils.business_hours import BUSINESS_HOURS_CSV, MINUTES_PER_DAY, get_business_hours_index
+from app.utils.time_conversion import DEFAULT_TIMEZONE, epoch_seconds, local_seconds, local_weekday, time_of_day_strings
 from bson import ObjectId
+from pymongo.errors import PyMongoError
 import random
 import string
 
 
 
-async def process_all_polling_data():
+STORE_STATUS_CSV = "data/store_status.csv"
+STORE_TIMEZONES_CSV = "data/store_timezones.csv"
+
+# Watermark document describing how much of store_status.csv has already been ingested
+WATERMARK_ID = "store_status"
+
+# Stored next to the ingest watermark: the inputs the hourly rollups were last brought up to date with
+ROLLUP_VERSION_ID = "poll_rollups"
+
+# Bytes hashed from the start of the file to detect that it was replaced rather than appended to
+HEAD_DIGEST_BYTES = 64 * 1024
+
+_END_OF_STREAM = object()
+
+
+@timed
+def localize_polling_data(polling_data, timezones):
+    record_rows(len(polling_data))
+
+    # Join every poll with its store's timezone once instead of scanning the timezone table per row
+    store_timezones = timezones[['store_id', 'timezone_str']].drop_duplicates('store_id')
+    polling_data = polling_data.merge(store_timezones, on='store_id', how='left')
+
+    # Stores missing from store_timezones.csv are assumed to be in America/Chicago
+    polling_data['timezone_str'] = polling_data['timezone_str'].fillna(DEFAULT_TIMEZONE)
+
+    # Shift each timezone group by its precomputed UTC offsets in one vectorized step
+    epochs = epoch_seconds(polling_data['timestamp_utc'])
+    local = np.empty_like(epochs)
+    for timezone_str, positions in polling_data.groupby('timezone_str', sort=False).indices.items():
+        local[positions] = local_seconds(epochs[positions], timezone_str)
+
+    day_of_week = local_weekday(local)
+    return pd.DataFrame({
+        "store_id": polling_data['store_id'].to_numpy(),
+        "timestamp_utc": polling_data['timestamp_utc'].to_numpy(),
+        "timestamp_epoch": epochs,  # UTC epoch seconds, the key for window range queries
+        "timestamp_local": time_of_day_strings(local),  # Only time up to seconds
+        "day_of_week": day_of_week,  # Day of the week (0=Monday, 6=Sunday)
+        "minute_of_week": day_of_week * MINUTES_PER_DAY + np.mod(local, SECONDS_PER_DAY) / 60,  # Local, 0 = Monday 00:00
+        "status": polling_data['status'].to_numpy()
+    })
+
+
+def parse_polling_timestamps(polling_data):
+    # MongoDB keeps millisecond precision, so truncate before using the timestamp as an upsert key
+    polling_data['timestamp_utc'] = pd.to_datetime(polling_data['timestamp_utc'], utc=True).dt.floor('ms')
+    return polling_data
+
+
+@timed
+def upsert_polling_data(processed_data):
+    # Upserts keyed on (store_id, timestamp_utc): re-ingesting a poll is a no-op
+    record_rows(len(processed_data))
+    get_storage().upsert_polls(processed_data)
+
+
+@timed
+def upsert_latest_polling_data(processed_data):
+    # One row per store, overwritten whenever a newer poll arrives
+    record_rows(len(processed_data))
+    get_storage().upsert_latest(processed_data)
+
+
+@timed
+def append_poll_segment(processed_data):
+    # The same polls as a segment file, for the columnar engine to map
+    record_rows(len(processed_data))
+    record_bytes(get_segment_store().append(
+        processed_data['store_id'].to_numpy(), processed_data['timestamp_epoch'].to_numpy(),
+        processed_data['status'].to_numpy() == "active"
+    ) * SEGMENT_RECORD.itemsize)
+
+
+@timed
+def update_online_aggregates():
+    # Fold the ingested polls into the running state, which then reflects the new watermark
+    record_rows(online_aggregates.flush())
+    online_aggregates.version = watermark_version(get_storage().load_watermark(WATERMARK_ID))
+
+
+@timed
+def update_poll_rollups(store_ids, epochs, minutes_of_week, active):
+    # Fold one chunk of ingested polls into the hourly rollups of the stores they belong to
+    with rollup_lock:
+        record_rows(update_rollups(get_storage(), store_ids, epochs, minutes_of_week, active, get_business_hours_index(), get_store_timezones()))
+
+
+@timed
+def compact_poll_segments():
+    return get_segment_store().compact()
+
+
+def latest_per_store(polling_data):
+    # Keep only the latest timestamp for each store
+    return polling_data.sort_values('timestamp_utc', kind='stable').groupby('store_id').tail(1)
+
+
+def ingest_stats(rows, started_at, **extra):
+    elapsed = time.perf_counter() - started_at
+    return {
+        "rows": rows,
+        **extra,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else None
+    }
+
+
+def read_store_status_chunks(usecols=None):
+    # Iterate over store_status.csv in fixed-size chunks so memory does not grow with the file
+    return pd.read_csv(STORE_STATUS_CSV, usecols=usecols, chunksize=settings.ingest_chunk_size)
+
+
+def stream_chunks(chunks, convert_chunk, write_chunk):
+    # A reader thread converts chunks and hands them to this thread through a bounded queue,
+    # so at most ingest_queue_depth converted chunks are held in memory at any time
+    chunk_queue = queue.Queue(maxsize=settings.ingest_queue_depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunk_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put(convert_chunk(chunk)):
+                    return
+        except Exception as e:
+            put(e)
+        else:
+            put(_END_OF_STREAM)
+
+    # The reader runs in a copy of this context so its conversion time is credited to the current stage
+    reader = threading.Thread(target=contextvars.copy_context().run, args=(produce,), name="store-status-reader", daemon=True)
+    reader.start()
+
     try:
-        # Load CSV files
-        polling_data = pd.read_csv("data/store_status.csv")
-        timezones = pd.read_csv("data/store_timezones.csv")
-
-        # Convert timestamps
-        polling_data['timestamp_utc'] = pd.to_datetime(polling_data['timestamp_utc'])
-
-        # Function to convert UTC to local time and extract the required fields
-        def convert_utc_to_local_time(utc_time, timezone_str):
-            local_tz = pytz.timezone(timezone_str)
-            local_time = utc_time.tz_convert(local_tz)
-            return local_time.strftime('%H:%M:%S'), local_time.weekday()  # Return time up to seconds and day of week
-
-        # Process data and add local time and day of week
-        def process_row(row):
-            local_time, day_of_week = convert_utc_to_local_time(
-                row['timestamp_utc'],
-                timezones.loc[timezones['store_id'] == row['store_id'], 'timezone_str'].values[0]
+        while True:
+            item = chunk_queue.get()
+            if item is _END_OF_STREAM:
+                break
+            if isinstance(item, Exception):
+                raise item
+            write_chunk(item)
+    finally:
+        stop.set()
+        reader.join()
+
+
+def process_chunks(chunks, convert_chunk, write_chunk):
+    if settings.ingest_streaming:
+        stream_chunks(chunks, convert_chunk, write_chunk)
+    else:
+        for chunk in chunks:
+            write_chunk(convert_chunk(chunk))
+
+
+@timed
+def read_store_ids():
+    # Only the store_id column is needed, read chunk by chunk keeping first-seen order
+    columns = pd.read_csv(STORE_STATUS_CSV, nrows=0).columns
+    if 'store_id' not in columns:
+        raise ValueError("CSV file must contain a 'store_id' column.")
+
+    store_ids = {}
+    for chunk in read_store_status_chunks(usecols=['store_id']):
+        store_ids.update(dict.fromkeys(chunk['store_id'].unique().tolist()))
+
+    return list(store_ids)
+
+
+class BoundedReader(io.RawIOBase):
+    # Binary file view that stops at a byte offset, so rows past the last complete line are left for the next run
+    def __init__(self, raw, limit):
+        self.raw = raw
+        self.limit = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        remaining = self.limit - self.raw.tell()
+        if remaining <= 0:
+            return 0
+        data = self.raw.read(min(len(buffer), remaining))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def head_digest(csv_file, length):
+    csv_file.seek(0)
+    return hashlib.sha1(csv_file.read(length)).hexdigest()
+
+
+def last_line_end(csv_file, size):
+    # Offset just past the last complete line, so a partially written row is picked up next time
+    position = size
+    while position > 0:
+        start = max(0, position - 4096)
+        csv_file.seek(start)
+        block = csv_file.read(position - start)
+        newline = block.rfind(b"\n")
+        if newline != -1:
+            return start + newline + 1
+        position = start
+    return 0
+
+
+def load_watermark():
+    watermark = get_storage().load_watermark(WATERMARK_ID)
+    store_max = watermark.get("store_max", {})
+    # Store ids are persisted as document keys, which MongoDB requires to be strings
+    store_max = pd.Series(list(store_max.values()), index=[
+        int(store_id) if store_id.lstrip('-').isdigit() else store_id for store_id in store_max
+    ], dtype=object)
+    return watermark, pd.to_datetime(store_max, utc=True)
+
+
+def save_watermark(offset, size, head_length, digest, store_max):
+    get_storage().save_watermark(WATERMARK_ID, {
+        "offset": offset,
+        "size": size,
+        "head_length": head_length,
+        "head_digest": digest,
+        "store_max": {str(store_id): timestamp.to_pydatetime() for store_id, timestamp in store_max.items()},
+        "updated_at": datetime.utcnow()
+    })
+
+
+# One ingest at a time in this process. The API's ingest endpoints and every report job start one; run
+# together, both would resume from the same watermark and feed the same polls twice into the online
+# aggregates, the segments and the rollups before racing to save the watermark.
+ingest_lock = threading.Lock()
+
+
+@timed
+def ingest_new_polling_data(timezones):
+    with ingest_lock:
+        # Cached per-store uptimes of the stores that get new polls are dropped and the others carried over
+        # to the new data version, also when the ingest fails after some of its polls were written
+        version = cache_version()
+        updated_stores = {}
+        try:
+            return ingest_after_watermark(timezones, updated_stores)
+        finally:
+            advance_uptime_cache(version, updated_stores)
+            add_to_store_catalog(updated_stores)
+
+
+def advance_uptime_cache(version, updated_stores):
+    try:
+        uptime_cache.advance(version, cache_version(), updated_stores)
+    except Exception as e:
+        # Without the new version no cached result can be matched to the data it came from
+        print(f"Error: {e}")
+        uptime_cache.clear()
+
+
+def ingest_after_watermark(timezones, updated_stores):
+    # Ingest only the polls that are newer than the persisted watermark and keep
+    # all_polling_data and latest_polling_data in step from the same pass over the file;
+    # updated_stores collects the stores that polls were written for, as they are written
+    incremental = settings.ingest_incremental
+    watermark, store_max = load_watermark() if incremental else ({}, pd.Series(dtype='datetime64[ns, UTC]'))
+
+    # The online engine's state is fed only while it reflects everything stored before this ingest;
+    # otherwise the next report rebuilds it
+    maintain_online = settings.report_engine == "online" and online_aggregates.is_current(
+        watermark_version(watermark), get_business_hours_index(), get_store_timezones()
+    )
+    # Likewise the rollups and the segments, which are rebuilt after the ingest instead when they had fallen behind
+    maintain_rollups = settings.poll_rollups and rollups_current()
+    maintain_segments = settings.poll_segments and segments_current()
+
+    with open(STORE_STATUS_CSV, "rb") as csv_file:
+        size = os.fstat(csv_file.fileno()).st_size
+        offset = last_line_end(csv_file, size)
+        csv_file.seek(0)
+        columns = csv_file.readline().decode().strip().split(",")
+
+        # The file was only appended to since the last run when the bytes hashed last time are unchanged
+        head_length = watermark.get("head_length", 0)
+        appended = (
+            incremental and "offset" in watermark and watermark["offset"] <= offset
+            and head_digest(csv_file, head_length) == watermark.get("head_digest")
+        )
+        start = watermark["offset"] if appended else 0
+        previous_max = store_max
+
+        if start >= offset:
+            return {"rows": 0, "new_rows": 0, "stores_updated": 0}
+
+        csv_file.seek(start)
+        header = {"header": 0} if start == 0 else {"header": None, "names": columns}
+        chunks = pd.read_csv(io.BufferedReader(BoundedReader(csv_file, offset)), chunksize=settings.ingest_chunk_size, **header)
+
+        counts = {"rows": 0, "new_rows": 0}
+        latest_polling_data = None
+
+        def after_watermark(polling_data):
+            # Polls at or before the store's watermark (NaT for unseen stores keeps the row)
+            seen = polling_data['timestamp_utc'] <= polling_data['store_id'].map(previous_max)
+            return ~seen.fillna(False).astype(bool)
+
+        def convert_chunk(polling_data):
+            nonlocal store_max, latest_polling_data
+            counts["rows"] += len(polling_data)
+            polling_data = parse_polling_timestamps(polling_data)
+
+            # Bytes past the offset are new by definition; a replaced file is filtered by the per-store watermark
+            if not appended and not previous_max.empty:
+                polling_data = polling_data[after_watermark(polling_data)]
+
+            chunk_latest = latest_per_store(polling_data)
+            latest_polling_data = chunk_latest if latest_polling_data is None else latest_per_store(pd.concat([latest_polling_data, chunk_latest]))
+            chunk_max = chunk_latest.set_index('store_id')['timestamp_utc']
+            store_max = pd.concat([store_max, chunk_max]).groupby(level=0).max()
+
+            return localize_polling_data(polling_data, timezones)
+
+        def write_chunk(processed_data):
+            counts["new_rows"] += len(processed_data)
+            upsert_polling_data(processed_data)
+            updated_stores.update(dict.fromkeys(processed_data['store_id'].unique().tolist()))
+            if maintain_segments:
+                append_poll_segment(processed_data)
+            columns = (
+                processed_data['store_id'].to_numpy(), processed_data['timestamp_epoch'].to_numpy(),
+                processed_data['minute_of_week'].to_numpy(), processed_data['status'].to_numpy() == "active"
             )
-            return {
-                "store_id": row['store_id'],
-                "timestamp_local": local_time,  # Only time up to seconds
-                "day_of_week": day_of_week,  # Day of the week (0=Monday, 6=Sunday)
-                "status": row['status']
-            }
+            if maintain_online:
+                online_aggregates.add_polls(*columns)
+            if maintain_rollups:
+                update_poll_rollups(*columns)
+
+        process_chunks(chunks, convert_chunk, write_chunk)
 
-        # Convert all polling data
-        processed_data = polling_data.apply(process_row, axis=1)
+    if maintain_segments:
+        compact_poll_segments()
 
-        # Insert data into MongoDB
-        for data_to_insert in processed_data:
-            result = db.all_polling_data.insert_one(data_to_insert)
-            if not result.inserted_id:
-                raise HTTPException(status_code=500, detail="Failed to insert data")
+    if latest_polling_data is not None and not previous_max.empty:
+        # Late polls appended out of order must not replace a newer latest status
+        latest_polling_data = latest_polling_data[after_watermark(latest_polling_data)]
 
-        return {"message": "All data processed and stored in all_polling_data collection in MongoDB"}
+    if latest_polling_data is not None and not latest_polling_data.empty:
+        upsert_latest_polling_data(localize_polling_data(latest_polling_data, timezones))
+
+    # Rollups are written chunk by chunk before the watermark that covers their polls, and their version after it
+    with rollup_lock:
+        if incremental:
+            head_length = min(offset, HEAD_DIGEST_BYTES)
+            with open(STORE_STATUS_CSV, "rb") as csv_file:
+                digest = head_digest(csv_file, head_length)
+            save_watermark(offset, size, head_length, digest, store_max)
+
+        if maintain_rollups:
+            save_rollup_version()
+        elif settings.poll_rollups:
+            rebuild_poll_rollups()
+
+    # Segments are stamped with the watermark that covers their polls once it is saved
+    if maintain_segments:
+        save_segment_version()
+    elif settings.poll_segments:
+        build_poll_segments()
+
+    if maintain_online:
+        update_online_aggregates()
+
+    return {**counts, "stores_updated": 0 if latest_polling_data is None else len(latest_polling_data)}
+
+
+@timed
+async def process_all_polling_data():
+    try:
+        started_at = time.perf_counter()
+
+        # Load CSV files
+        timezones = pd.read_csv(STORE_TIMEZONES_CSV)
+
+        # Convert new polling data and upsert it into all_polling_data and latest_polling_data,
+        # on a worker thread so the event loop keeps serving requests
+        counts = await asyncio.to_thread(ingest_new_polling_data, timezones)
+        record_rows(counts["rows"])
+
+        return {
+            "message": "All data processed and stored in all_polling_data collection in MongoDB",
+            **ingest_stats(counts.pop("rows"), started_at, **counts)
+        }
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+@timed
+def ingest_latest_polling_data(timezones):
+    # Keep a running latest row per store, so memory is bounded by the number of stores
+    latest_polling_data = None
+    for chunk in read_store_status_chunks():
+        candidates = latest_per_store(parse_polling_timestamps(chunk))
+        if latest_polling_data is not None:
+            candidates = pd.concat([latest_polling_data, candidates])
+        latest_polling_data = latest_per_store(candidates)
+
+    # Convert only the latest polling data
+    processed_data = localize_polling_data(latest_polling_data, timezones)
+
+    # Upsert data into storage
+    upsert_latest_polling_data(processed_data)
+    return len(processed_data)
+
+
+@timed
 async def process_latest_polling_data():
     try:
-        # Load CSV files
-        polling_data = pd.read_csv("data/store_status.csv")
-        timezones = pd.read_csv("data/store_timezones.csv")
-
-        # Convert timestamps
-        polling_data['timestamp_utc'] = pd.to_datetime(polling_data['timestamp_utc'])
-
-        # Ensure only the latest timestamp is kept for each store
-        latest_polling_data = polling_data.sort_values('timestamp_utc').groupby('store_id').tail(1)
-
-        # Function to convert UTC to local time and extract the required fields
-        def convert_utc_to_local_time(utc_time, timezone_str):
-            local_tz = pytz.timezone(timezone_str)
-            local_time = utc_time.tz_convert(local_tz)
-            return local_time.strftime('%H:%M:%S'), local_time.weekday()  # Return time up to seconds and day of week
-
-        # Process data and add local time and day of week
-        def process_row(row):
-            local_time, day_of_week = convert_utc_to_local_time(
-                row['timestamp_utc'],
-                timezones.loc[timezones['store_id'] == row['store_id'], 'timezone_str'].values[0]
-            )
-            return {
-                "store_id": row['store_id'],
-                "timestamp_local": local_time,  # Only time up to seconds
-                "day_of_week": day_of_week,  # Day of the week (0=Monday, 6=Sunday)
-                "status": row['status']
-            }
+        started_at = time.perf_counter()
 
-        # Convert only the latest polling data
-        processed_data = latest_polling_data.apply(process_row, axis=1)
+        # Load CSV files
+        timezones = pd.read_csv(STORE_TIMEZONES_CSV)
 
-        # Insert data into MongoDB
-        for data_to_insert in processed_data:
-            result = db.latest_polling_data.insert_one(data_to_insert)
-            if not result.inserted_id:
-                raise HTTPException(status_code=500, detail="Failed to insert data")
+        if settings.ingest_incremental:
+            # latest_polling_data is maintained by the same incremental pass as all_polling_data
+            counts = await asyncio.to_thread(ingest_new_polling_data, timezones)
+            rows = counts.pop("rows")
+        else:
+            rows = await asyncio.to_thread(ingest_latest_polling_data, timezones)
+            counts = {}
 
-        return {"message": "Latest data processed and stored in latest_polling_data collection in MongoDB"}
+        return {
+            "message": "Latest data processed and stored in latest_polling_data collection in MongoDB",
+            **ingest_stats(rows, started_at, **counts)
+        }
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-async def generate_filtered_data_table_last_hour(store_id: int):
-    try:
-        # Load business hours for the store
-        business_hours = pd.read_csv("data/business_hours.csv")
-        
-        # Fetch the latest polling data for the store
-        latest_polling_record = db.latest_polling_data.find_one({"store_id": store_id})
-
-        # If no latest polling record is found, return an empty result
-        if not latest_polling_record:
-            return {
-                "store_id": store_id,
-                "filtered_data_table": []
-            }
 
-        # Extract the latest timestamp local time and convert to datetime object
-        latest_time_str = latest_polling_record['timestamp_local']
-        latest_day_of_week = int(latest_polling_record['day_of_week'])
-        latest_timestamp_local = datetime.strptime(latest_time_str, '%H:%M:%S').time()
-        one_hour_ago = (datetime.combine(datetime.today(), latest_timestamp_local) - timedelta(hours=1)).time()
+# Marker recorded once existing polls carry timestamp_epoch and minute_of_week
+EPOCH_MIGRATION_ID = "polling_epochs"
 
-        # Fetch all polling data for the store from all_polling_data within the last hour and specific day
-        data_cursor = db.all_polling_data.find({
-            "store_id": store_id,
-            "day_of_week": latest_day_of_week,
-            "timestamp_local": {"$gte": one_hour_ago.strftime('%H:%M:%S'), "$lte": latest_timestamp_local.strftime('%H:%M:%S')}
-        }).sort("timestamp_local", 1)
-
-        # Convert cursor to list and exclude ObjectId for debugging/logging
-        polling_data = [{k: v for k, v in record.items() if k != '_id'} for record in data_cursor]
-        
-        # If no polling data found within the last hour, return an empty result
-        if not polling_data:
-            return {
-                "store_id": store_id,
-                "filtered_data_table": []
-            }
 
-        # Get the business hours for the specific day of the week
-        store_business_hours = business_hours.loc[
-            (business_hours['store_id'] == store_id) &
-            (business_hours['day_of_week'] == latest_day_of_week)
-        ]
-        
-        # If no business hours found for this store on the specified day, return an empty result
-        if store_business_hours.empty:
-            return {
-                "store_id": store_id,
-                "filtered_data_table": []
-            }
+@timed
+def migrate_polling_epochs():
+    # One-time backfill of timestamp_epoch and minute_of_week for polls ingested before they were stored
+    # Timezones are only read when there is something to backfill
+    def localize(polling_data):
+        return localize_polling_data(polling_data, pd.read_csv(STORE_TIMEZONES_CSV))
 
-        # Extract business hours start and end time
-        business_start = datetime.strptime(store_business_hours.iloc[0]['start_time_local'], '%H:%M:%S').time()
-        business_end = datetime.strptime(store_business_hours.iloc[0]['end_time_local'], '%H:%M:%S').time()
+    return get_storage().backfill_poll_epochs(EPOCH_MIGRATION_ID, localize)
 
-        # Filter polling data within business hours
-        polling_data_in_business_hours = [
-            record for record in polling_data
-            if business_start <= datetime.strptime(record['timestamp_local'], '%H:%M:%S').time() <= business_end
-        ]
 
-        # Prepare the records to be inserted into MongoDB
-        last_hour_records = [
-            {
-                "store_id": store_id,
-                "day_of_week": latest_day_of_week,
-                "timestamp_local": record['timestamp_local'],
-                "status": record.get('status', 'unknown')  # Assuming 'status' field is present; default to 'unknown'
-            }
-            for record in polling_data_in_business_hours
-        ]
+async def migrate_polling_epochs_on_startup():
+    try:
+        result = await asyncio.to_thread(migrate_polling_epochs)
+        if result["migrated"]:
+            print(f"Backfilled timestamp_epoch on {result['migrated']} polls")
+        if result["archived"]:
+            print(f"Archived {result['archived']} undated polls to legacy_polling_data")
+    except PyMongoError as e:
+        print(f"Error: could not migrate polls: {e}")
+
+
+def segments_current():
+    # Segments hold every stored poll only when their manifest names the current ingest watermark
+    manifest = get_segment_store().load_manifest()
+    return manifest.get("watermark") == watermark_version(get_storage().load_watermark(WATERMARK_ID))
+
+
+def save_segment_version():
+    get_segment_store().save_manifest({
+        "watermark": watermark_version(get_storage().load_watermark(WATERMARK_ID)), "updated_at": datetime.utcnow()
+    })
+
+
+@timed
+def build_poll_segments():
+    # Segments start from the polls already stored when they are first enabled, and start over when they
+    # miss polls ingested with POLL_SEGMENTS off; later ingests append to them. They are built in a scratch
+    # directory that then replaces the old one, so an interrupted build starts over. Callers hold ingest_lock.
+    watermark = watermark_version(get_storage().load_watermark(WATERMARK_ID))
+    building = f"{settings.segment_dir}.building"
+    shutil.rmtree(building, ignore_errors=True)
+    segment_store = SegmentStore(building, settings.segment_compaction_bytes, settings.segment_compaction_fanin)
+    polls = 0
+    for store_ids, epochs, active in get_storage().iter_poll_columns(0):
+        polls += segment_store.append(store_ids, epochs, active)
+        segment_store.compact()
+    segment_store.save_manifest({"watermark": watermark, "updated_at": datetime.utcnow()})
+
+    # Reports that already mapped the old segments keep reading them; the files go once they are unmapped
+    replaced = f"{settings.segment_dir}.replaced"
+    shutil.rmtree(replaced, ignore_errors=True)
+    if os.path.isdir(settings.segment_dir):
+        os.rename(settings.segment_dir, replaced)
+    os.rename(building, settings.segment_dir)
+    shutil.rmtree(replaced, ignore_errors=True)
+    reset_segment_store()
+    return {"polls": polls}
+
+
+def ensure_poll_segments():
+    # Rebuild segments that are missing or miss polls; the number of polls written to them
+    if not settings.poll_segments:
+        return 0
+    with ingest_lock:
+        if segments_current():
+            return 0
+        return build_poll_segments()["polls"]
+
+
+def data_version():
+    # The ingested polls, business hours and timezones that rollups and cached uptimes are computed from
+    return {
+        "polls": watermark_version(get_storage().load_watermark(WATERMARK_ID)),
+        "business_hours": file_signature(BUSINESS_HOURS_CSV),
+        "timezones": file_signature(STORE_TIMEZONES_CSV)
+    }
+
+
+def cache_version():
+    # data_version as a hashable cache key
+    return json.dumps(data_version(), default=str)
+
+
+def rollups_current():
+    return get_storage().load_watermark(ROLLUP_VERSION_ID).get("version") == data_version()
+
+
+def save_rollup_version():
+    get_storage().save_watermark(ROLLUP_VERSION_ID, {"version": data_version(), "updated_at": datetime.utcnow()})
+
+
+@timed
+def rebuild_poll_rollups():
+    # Every store's rollups again from its stored polls
+    record_rows(rebuild_rollups(get_storage(), get_business_hours_index(), get_store_timezones()))
+    save_rollup_version()
+
+
+def ensure_poll_rollups():
+    # Rebuild rollups that miss polls ingested with POLL_ROLLUPS off or that predate the current
+    # business hours or timezones; True when they had to be rebuilt
+    with rollup_lock:
+        if rollups_current():
+            return False
+        rebuild_poll_rollups()
+        return True
 
-        # Store only records that meet all conditions in MongoDB
-        if last_hour_records:
-            db.last_hour_records.insert_many(last_hour_records)
 
-        return {
-            "store_id": store_id,
-            "filtered_data_table": polling_data_in_business_hours
-        }
+async def build_poll_segments_on_startup():
+    try:
+        polls = await asyncio.to_thread(ensure_poll_segments)
+        if polls:
+            print(f"Wrote {polls} stored polls to segments")
+    except (PyMongoError, OSError) as e:
+        print(f"Error: could not build poll segments: {e}")
 
-    except Exception as e:
-        # Print error message and raise HTTPException with a generic internal server error
-        print(f"Error: {e}")
-        raise HTTPException(status_code=500, detail="Internal Server Error")
 
-async def generate_filtered_data_table_last_day(store_id: int):
+async def generate_filtered_window(store_id: int, window_length: int, window: str, run_id: str):
     try:
-        # Load business hours for the store
-        business_hours = pd.read_csv("data/business_hours.csv")
-        # print("Loaded business hours:\n", business_hours)
-        
-        # Fetch the latest polling data for the store
-        latest_polling_record = db.latest_polling_data.find_one({"store_id": store_id})
-
-        # If no latest polling record is found, return an empty result
-        if not latest_polling_record:
-            # print(f"No latest polling record found for store_id: {store_id}")
-            return {
-                "store_id": store_id,
-                "filtered_data_table": []
-            }
+        # The window closes at the store's newest poll
+        latest_epoch = await latest_poll_epoch(store_id)
 
-        # Extract the latest timestamp local time and convert to datetime object
-        latest_time_str = latest_polling_record['timestamp_local']
-        latest_day_of_week = int(latest_polling_record['day_of_week'])
-        latest_timestamp_local = datetime.strptime(latest_time_str, '%H:%M:%S').time()
-        # print(f"Latest timestamp: {latest_time_str}, Day of Week: {latest_day_of_week}")
-
-        # Calculate the start time 24 hours earlier
-        previous_day_of_week = (latest_day_of_week - 1) % 7
-        latest_datetime = datetime.combine(datetime.today(), latest_timestamp_local)
-        start_datetime = latest_datetime - timedelta(days=1)
-        start_time_local = start_datetime.time()
-        # print(f"Start time: {start_time_local.strftime('%H:%M:%S')}, Previous Day of Week: {previous_day_of_week}")
-
-        # Fetch all polling data for the store from all_polling_data within the calculated time range
-        data_cursor = db.all_polling_data.find({
-            "store_id": store_id,
-            "$or": [
-                {
-                    "day_of_week": latest_day_of_week,
-                    "timestamp_local": {"$lte": latest_timestamp_local.strftime('%H:%M:%S')}
-                },
-                {
-                    "day_of_week": previous_day_of_week,
-                    "timestamp_local": {"$gte": start_time_local.strftime('%H:%M:%S')}
-                }
-            ]
-        }).sort("timestamp_local", 1)
-
-        # Convert cursor to list and exclude ObjectId for debugging/logging
-        polling_data = [{k: v for k, v in record.items() if k != '_id'} for record in data_cursor]
-        # print("Fetched polling data:\n", polling_data)
-        
-        # If no polling data found within the calculated range, return an empty result
-        if not polling_data:
-            print("No polling data found within the calculated range.")
+        # If the store has no polls, return an empty result
+        if latest_epoch is None:
             return {
                 "store_id": store_id,
                 "filtered_data_table": []
             }
 
-        # Get business hours for the specific days of the week
-        store_business_hours = business_hours[
-            (business_hours['store_id'] == store_id) &
-            (business_hours['day_of_week'].isin([previous_day_of_week, latest_day_of_week]))
-        ]
-        # print("Business hours for the store:\n", store_business_hours)
-        
-        # If no business hours found for this store on the specified days, return an empty result
-        if store_business_hours.empty:
-            print("No business hours found for the specified days.")
+        # Fetch the store's polls in [latest - window, latest] with an indexed range query
+        polling_data = await get_storage().window_polls(store_id, latest_epoch - window_length, latest_epoch)
+
+        # If no polling data found within the window, return an empty result
+        if not polling_data:
             return {
                 "store_id": store_id,
                 "filtered_data_table": []
             }
 
-        # Extract business hours for the two days
-        business_hours_dict = store_business_hours.set_index('day_of_week').to_dict(orient='index')
-        # print("Business hours dictionary:\n", business_hours_dict)
-        
-        def is_within_business_hours(record):
-            record_time = datetime.strptime(record['timestamp_local'], '%H:%M:%S').time()
-            record_day = int(record['day_of_week'])
-            if record_day in business_hours_dict:
-                business_start = datetime.strptime(business_hours_dict[record_day]['start_time_local'], '%H:%M:%S').time()
-                business_end = datetime.strptime(business_hours_dict[record_day]['end_time_local'], '%H:%M:%S').time()
-                # Check if record_time is within the business hours
-                within_hours = business_start <= record_time <= business_end
-                # print(f"Checking {record_time} within hours ({business_start} to {business_end}): {within_hours}")
-                return within_hours
-            return False
-        
         # Filter polling data within business hours
-        polling_data_in_business_hours = [record for record in polling_data if is_within_business_hours(record)]
-        # print("Filtered polling data within business hours:\n", polling_data_in_business_hours)
+        in_business_hours = get_business_hours_index().contains(store_id, [record['minute_of_week'] for record in polling_data])
+        polling_data_in_business_hours = [record for record, inside in zip(polling_data, in_business_hours) if inside]
 
-        # Prepare the records to be inserted into MongoDB
-        last_day_records = [
+        # Prepare the records to be stored, tagged with the run that reads them back
+        created_at = datetime.utcnow()
+        window_records = [
             {
+                "run_id": run_id,
+                "created_at": created_at,
                 "store_id": store_id,
+                "timestamp_epoch": record['timestamp_epoch'],
+                "minute_of_week": record['minute_of_week'],
                 "day_of_week": int(record['day_of_week']),
                 "timestamp_local": record['timestamp_local'],
                 "status": record.get('status', 'unknown')  # Assuming 'status' field is present; default to 'unknown'
@@ -287,10 +650,8 @@ async def generate_filtered_data_table_last_day(store_id: int):
             for record in polling_data_in_business_hours
         ]
 
-        # Store only records that meet all conditions in MongoDB
-        if last_day_records:
-            db.last_day_records.insert_many(last_day_records)
-            # print("Inserted records into MongoDB:\n", last_day_records)
+        # Store only records that meet all conditions, replacing this run's earlier records for the store
+        await get_storage().replace_window_records(window, run_id, store_id, window_records)
 
         return {
             "store_id": store_id,
@@ -301,579 +662,544 @@ async def generate_filtered_data_table_last_day(store_id: int):
         # Print error message and raise HTTPException with a generic internal server error
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
-    
-async def generate_filtered_data_table_last_week(store_id: int):
-    try:
-        # Load business hours for the store
-        business_hours = pd.read_csv("data/business_hours.csv")
-        
-        # Calculate the start time 7 days earlier
-        latest_day_of_week = datetime.now().weekday()
-        start_datetime = datetime.now() - timedelta(days=7)
-        start_day_of_week = start_datetime.weekday()
-        
-        # Fetch all polling data for the store within the last 7 days
-        data_cursor = db.all_polling_data.find({
-            "store_id": store_id,
-            # "$or": [
-            #     {
-            #         "day_of_week": {"$gte": start_day_of_week, "$lte": latest_day_of_week},
-            #     }
-            # ]
-        }).sort("timestamp_local", 1)
-
-        # Convert cursor to list and exclude ObjectId
-        polling_data = [{k: v for k, v in record.items() if k != '_id'} for record in data_cursor]
-        
-        # If no polling data found within the calculated range, return an empty result
-        if not polling_data:
-            return {
-                "store_id": store_id,
-                "filtered_data_table": []
-            }
 
-        # Get business hours for the specific days of the week
-        store_business_hours = business_hours[
-            (business_hours['store_id'] == store_id)
-        ]
-        
-        # If no business hours found for this store on the specified days, return an empty result
-        if store_business_hours.empty:
-            return {
-                "store_id": store_id,
-                "filtered_data_table": []
-            }
 
-        # Extract business hours for the week
-        business_hours_dict = store_business_hours.set_index('day_of_week').to_dict(orient='index')
-        
-        def is_within_business_hours(record):
-            record_time = datetime.strptime(record['timestamp_local'], '%H:%M:%S').time()
-            record_day = int(record['day_of_week'])
-            if record_day in business_hours_dict:
-                business_start = datetime.strptime(business_hours_dict[record_day]['start_time_local'], '%H:%M:%S').time()
-                business_end = datetime.strptime(business_hours_dict[record_day]['end_time_local'], '%H:%M:%S').time()
-                # Check if record_time is within the business hours
-                return business_start <= record_time <= business_end
-            return False
-        
-        # Filter polling data within business hours
-        polling_data_in_business_hours = [record for record in polling_data if is_within_business_hours(record)]
+@timed
+async def generate_filtered_data_table_last_hour(store_id: int, run_id: str = ADHOC_RUN_ID):
+    return await generate_filtered_window(store_id, SECONDS_PER_HOUR, "hour", run_id)
 
-        # Prepare the records to be returned
-        last_week_records = [
-            {
-                "store_id": store_id,
-                "day_of_week": int(record['day_of_week']),
-                "timestamp_local": record['timestamp_local'],
-                "status": record.get('status', 'unknown')  # Assuming 'status' field is present; default to 'unknown'
-            }
-            for record in polling_data_in_business_hours
-        ]
-        if last_week_records:
-            db.last_week_records.insert_many(last_week_records)
-        return {
+
+@timed
+async def generate_filtered_data_table_last_day(store_id: int, run_id: str = ADHOC_RUN_ID):
+    return await generate_filtered_window(store_id, SECONDS_PER_DAY, "day", run_id)
+
+
+@timed
+async def generate_filtered_data_table_last_week(store_id: int, run_id: str = ADHOC_RUN_ID):
+    return await generate_filtered_window(store_id, SECONDS_PER_WEEK, "week", run_id)
+
+
+async def calculate_window_uptime(store_id: int, window_length: int, window: str, unit: str, unit_minutes: int, run_id: str):
+    try:
+        result = {
             "store_id": store_id,
-            "filtered_data_table": polling_data_in_business_hours
+            f"uptime_{unit}": 0,
+            f"downtime_{unit}": 0,
+            f"estimated_uptime_{unit}": 0,
+            f"estimated_downtime_{unit}": 0,
+            "full_data": []
         }
 
+        # Fetch the filtered data this run stored for the same window the filter step used
+        latest_epoch = await latest_poll_epoch(store_id)
+        filtered_data = []
+        if latest_epoch is not None:
+            window_start = latest_epoch - window_length
+            filtered_data = await get_storage().window_records(window, run_id, store_id, window_start, latest_epoch)
+
+        if filtered_data:
+            hours = get_business_hours_index().hours_for(store_id)
+            epochs = [record['timestamp_epoch'] for record in filtered_data]
+            minutes_of_week = [record['minute_of_week'] for record in filtered_data]
+            statuses = [record['status'] for record in filtered_data]
+
+            # Observed time runs between the first and last poll; the estimate extends it to the whole window
+            uptime, downtime = window_estimates(epochs, minutes_of_week, statuses, epochs[0], epochs[-1], hours, unit_minutes)
+            estimated_uptime, estimated_downtime = window_estimates(
+                epochs, minutes_of_week, statuses, window_start, latest_epoch, hours, unit_minutes
+            )
+
+            # Window start, the polls and the window end, each with the status in effect
+            full_data = [{'timestamp_epoch': window_start, 'status': statuses[0]}]
+            full_data.extend({'timestamp_epoch': epoch, 'status': status} for epoch, status in zip(epochs, statuses))
+            full_data.append({'timestamp_epoch': latest_epoch, 'status': statuses[-1]})
+
+            result.update({
+                f"uptime_{unit}": uptime,
+                f"downtime_{unit}": downtime,
+                f"estimated_uptime_{unit}": estimated_uptime,
+                f"estimated_downtime_{unit}": estimated_downtime,
+                "full_data": full_data
+            })
+
+        # One result per store and run, overwritten if the run computes the store again
+        await get_storage().save_window_result(
+            window, run_id, store_id, {**result, "run_id": run_id, "created_at": datetime.utcnow()}
+        )
+
+        return result
+
     except Exception as e:
-        # Print error message and raise HTTPException with a generic internal server error
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-   
-
 
+@timed
+async def calculate_uptime_downtime_last_hour(store_id: int, run_id: str = ADHOC_RUN_ID):
+    return await calculate_window_uptime(store_id, SECONDS_PER_HOUR, "hour", "minutes", 1, run_id)
 
-async def calculate_uptime_downtime_last_hour(store_id: int):
-    try:
-        # Fetch the filtered data from MongoDB for the last hour
-        filtered_data_cursor = db.last_hour_records.find({"store_id": store_id}).sort("timestamp_local", 1)
-        filtered_data = [{k: v for k, v in record.items() if k != '_id'} for record in filtered_data_cursor]
 
-        if not filtered_data:
-            last_hour_records =[ {
-                "store_id": store_id,
-                "uptime_minutes": 0,
-                "downtime_minutes": 0,
-                "estimated_uptime_minutes": 0,
-                "estimated_downtime_minutes": 0,
-                "full_data": []
-            }]
+@timed
+async def calculate_uptime_downtime_last_day(store_id: int, run_id: str = ADHOC_RUN_ID):
+    return await calculate_window_uptime(store_id, SECONDS_PER_DAY, "day", "hours", 60, run_id)
 
-            if last_hour_records:
-                db.up_down_hour.insert_many(last_hour_records)
 
+@timed
+async def calculate_uptime_downtime_last_week(store_id: int, run_id: str = ADHOC_RUN_ID):
+    return await calculate_window_uptime(store_id, SECONDS_PER_WEEK, "week", "hours", 60, run_id)
 
-            return {
-                "store_id": store_id,
-                "uptime_minutes": 0,
-                "downtime_minutes": 0,
-                "estimated_uptime_minutes": 0,
-                "estimated_downtime_minutes": 0,
-                "full_data": []
-            }
 
-        # Convert filtered data to DataFrame for easier manipulation
-        df = pd.DataFrame(filtered_data)
-        df['timestamp_local'] = pd.to_datetime(df['timestamp_local'], format='%H:%M:%S').dt.time
-
-        # Define a base date for time calculations
-        base_date = datetime(2000, 1, 1)  # Arbitrary base date
-
-        # Convert time to datetime for calculations
-        df['timestamp_local'] = df['timestamp_local'].apply(lambda t: datetime.combine(base_date, t))
-
-        # Ensure data is sorted by timestamp
-        df = df.sort_values(by='timestamp_local').reset_index(drop=True)
-
-        # Define the start and end of the hour
-        start_time = datetime.combine(base_date, df['timestamp_local'].iloc[0].time())
-        end_time = start_time + timedelta(hours=1)
-
-        # Create a list to hold the full dataset with estimated records
-        full_data = []
-
-        # Add the start_time if it is not in the DataFrame
-        if df['timestamp_local'].iloc[0] > start_time:
-            full_data.append({'timestamp_local': start_time, 'status': df['status'].iloc[0]})
-        
-        # Add the actual records
-        for index, row in df.iterrows():
-            full_data.append({'timestamp_local': row['timestamp_local'], 'status': row['status']})
-        
-        # Add the end_time if it is not in the DataFrame
-        if df['timestamp_local'].iloc[-1] < end_time:
-            full_data.append({'timestamp_local': end_time, 'status': df['status'].iloc[-1]})
-
-        # Convert full_data list to DataFrame
-        full_df = pd.DataFrame(full_data)
-        full_df['timestamp_local'] = pd.to_datetime(full_df['timestamp_local']).dt.time
-
-        # Convert times back to datetime for time difference calculations
-        full_df['timestamp_local'] = full_df['timestamp_local'].apply(lambda t: datetime.combine(base_date, t))
-
-        # Calculate the time differences between consecutive records
-        full_df['time_diff'] = full_df['timestamp_local'].diff().fillna(pd.Timedelta(seconds=0)).dt.total_seconds() / 60
-
-        # Calculate uptime and downtime by summing the time differences where status is 'active' or 'inactive'
-        uptime_minutes = full_df[full_df['status'] == 'active']['time_diff'].sum()
-        downtime_minutes = full_df[full_df['status'] == 'inactive']['time_diff'].sum()
-
-        # Estimate missing data
-        estimated_uptime_minutes = 0
-        estimated_downtime_minutes = 0
-
-        # Check for gaps between the first record and the start_time
-        if full_df['timestamp_local'].iloc[0] > start_time:
-            time_gap = (full_df['timestamp_local'].iloc[0] - start_time).total_seconds() / 60
-            if full_df['status'].iloc[0] == 'active':
-                estimated_uptime_minutes += time_gap
-            else:
-                estimated_downtime_minutes += time_gap
-
-        # Check for gaps between records
-        for i in range(len(full_df) - 1):
-            gap_duration = (full_df['timestamp_local'].iloc[i + 1] - full_df['timestamp_local'].iloc[i]).total_seconds() / 60
-            if full_df['status'].iloc[i] == 'active':
-                estimated_uptime_minutes += gap_duration
-            else:
-                estimated_downtime_minutes += gap_duration
-
-        # Check for gaps between the last record and end_time
-        if full_df['timestamp_local'].iloc[-1] < end_time:
-            time_gap = (end_time - full_df['timestamp_local'].iloc[-1]).total_seconds() / 60
-            if full_df['status'].iloc[-1] == 'active':
-                estimated_uptime_minutes += time_gap
-            else:
-                estimated_downtime_minutes += time_gap
-
-        # Convert timestamps to string format for the response
-        for record in full_data:
-            record['timestamp_local'] = record['timestamp_local'].strftime('%H:%M:%S')
-        
-        last_hour_records =[ {
-                "store_id": store_id,
-                "uptime_minutes": uptime_minutes,
-                "downtime_minutes": downtime_minutes,
-                "estimated_uptime_minutes": estimated_uptime_minutes,
-                "estimated_downtime_minutes": estimated_downtime_minutes,
-                "full_data": full_data
-        }]
-          
-        
+@timed
+async def discard_run_intermediates(run_id: str):
+    # A finished run's intermediates are never read again; runs that crash first expire after intermediate_ttl_seconds
+    await get_storage().discard_run(run_id)
 
-        # Store only records that meet all conditions in MongoDB
-        if last_hour_records:
-            db.up_down_hour.insert_many(last_hour_records)
+store_ids_arr=[]
 
+@timed
+async def extract_store_ids():
+    global store_ids_arr  
+    try:
+        # A scan of the whole CSV, kept off the event loop
+        store_ids_arr = await asyncio.to_thread(read_store_ids)
 
-        return {
-            "store_id": store_id,
-            "uptime_minutes": uptime_minutes,
-            "downtime_minutes": downtime_minutes,
-            "estimated_uptime_minutes": estimated_uptime_minutes,
-            "estimated_downtime_minutes": estimated_downtime_minutes,
-            "full_data": full_data
-        }
+        return {"store_ids": store_ids_arr}
 
+    except pd.errors.EmptyDataError:
+        raise HTTPException(status_code=500, detail="CSV file is empty.")
+    except pd.errors.ParserError:
+        raise HTTPException(status_code=500, detail="Error parsing CSV file.")
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-async def calculate_uptime_downtime_last_day(store_id: int):
-    try:
-        # Fetch the filtered data from MongoDB for the last hour
-        filtered_data_cursor = db.last_day_records.find({"store_id": store_id}).sort("timestamp_local", 1)
-        filtered_data = [{k: v for k, v in record.items() if k != '_id'} for record in filtered_data_cursor]
 
-        if not filtered_data:
-            last_day_records =[ {
-                "store_id": store_id,
-                "uptime_hours": 0,
-                "downtime_hours": 0,
-                "estimated_uptime_hours": 0,
-                "estimated_downtime_hours": 0,
-                "full_data": []
-            }]
+def add_to_store_catalog(store_ids):
+    # Stores an ingest sees for the first time join a catalog that was already read, after the stores it lists
+    global store_ids_arr
+    if not store_ids_arr:
+        return
+    known = set(store_ids_arr)
+    new_store_ids = [store_id for store_id in store_ids if store_id not in known]
+    if new_store_ids:
+        store_ids_arr = store_ids_arr + new_store_ids
 
-            if last_day_records:
-                db.up_down_day.insert_many(last_day_records)
 
+async def get_store_ids():
+    # The store catalog, read from store_status.csv on first use
+    if not store_ids_arr:
+        await extract_store_ids()
+    return store_ids_arr
 
-            return {
-                "store_id": store_id,
-                "uptime_hours": 0,
-                "downtime_hours": 0,
-                "estimated_uptime_hours": 0,
-                "estimated_downtime_hours": 0,
-                "full_data": []
-            }
 
-            # Convert filtered data to DataFrame
-        df = pd.DataFrame(filtered_data)
-        df['timestamp_local'] = pd.to_datetime(df['timestamp_local'], format='%H:%M:%S').dt.time
-
-        # Define a base date for time calculations
-        base_date = datetime(2000, 1, 1)  # Arbitrary base date
-
-        # Convert time to datetime for calculations
-        df['timestamp_local'] = df['timestamp_local'].apply(lambda t: datetime.combine(base_date, t))
-
-        # Ensure data is sorted by timestamp
-        df = df.sort_values(by='timestamp_local').reset_index(drop=True)
-
-        # Define the start and end of the period
-        start_time = datetime.combine(base_date, datetime.min.time())
-        end_time = start_time + timedelta(days=1)
-
-        # Create a list to hold the full dataset with estimated records
-        full_data = []
-
-        # Add the start_time if it is not in the DataFrame
-        if df['timestamp_local'].iloc[0] > start_time:
-            full_data.append({'timestamp_local': start_time, 'status': df['status'].iloc[0]})
-        
-        # Add the actual records
-        for index, row in df.iterrows():
-            full_data.append({'timestamp_local': row['timestamp_local'], 'status': row['status']})
-        
-        # Add the end_time if it is not in the DataFrame
-        if df['timestamp_local'].iloc[-1] < end_time:
-            full_data.append({'timestamp_local': end_time, 'status': df['status'].iloc[-1]})
-
-        # Convert full_data list to DataFrame
-        full_df = pd.DataFrame(full_data)
-        full_df['timestamp_local'] = pd.to_datetime(full_df['timestamp_local'])
-
-        # Calculate the time differences between consecutive records
-        full_df['time_diff'] = full_df['timestamp_local'].diff().fillna(pd.Timedelta(seconds=0)).dt.total_seconds() / 3600
-
-        # Calculate uptime and downtime by summing the time differences where status is 'active' or 'inactive'
-        uptime_hours = full_df[full_df['status'] == 'active']['time_diff'].sum()
-        downtime_hours = full_df[full_df['status'] == 'inactive']['time_diff'].sum()
-
-        # Estimate missing data
-        estimated_uptime_hours = 0
-        estimated_downtime_hours = 0
-
-        # Check for gaps between the first record and the start_time
-        if full_df['timestamp_local'].iloc[0] > start_time:
-            time_gap = (full_df['timestamp_local'].iloc[0] - start_time).total_seconds() / 3600
-            if full_df['status'].iloc[0] == 'active':
-                estimated_uptime_hours += time_gap
-            else:
-                estimated_downtime_hours += time_gap
-
-        # Check for gaps between records
-        for i in range(len(full_df) - 1):
-            gap_duration = (full_df['timestamp_local'].iloc[i + 1] - full_df['timestamp_local'].iloc[i]).total_seconds() / 3600
-            if full_df['status'].iloc[i] == 'active':
-                estimated_uptime_hours += gap_duration
-            else:
-                estimated_downtime_hours += gap_duration
-
-        # Check for gaps between the last record and end_time
-        if full_df['timestamp_local'].iloc[-1] < end_time:
-            time_gap = (end_time - full_df['timestamp_local'].iloc[-1]).total_seconds() / 3600
-            if full_df['status'].iloc[-1] == 'active':
-                estimated_uptime_hours += time_gap
-            else:
-                estimated_downtime_hours += time_gap
-
-        # Convert timestamps to string format for the response
-        for record in full_data:
-            record['timestamp_local'] = record['timestamp_local'].strftime('%H:%M:%S')
-        
-        last_day_records =[ {
-                "store_id": store_id,
-                "uptime_hours": uptime_hours,
-                "downtime_hours": downtime_hours,
-                "estimated_uptime_hours": estimated_uptime_hours,
-                "estimated_downtime_hours": estimated_downtime_hours,
-                "full_data": full_data
-        }]
-          
-        
+def new_report_id():
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=10))
 
-        # Store only records that meet all conditions in MongoDB
-        if last_day_records:
-            db.up_down_day.insert_many(last_day_records)
 
+def file_signature(path: str):
+    stat = os.stat(path)
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+def watermark_version(watermark: dict):
+    # Identifies one state of the ingested polls; every ingest that saves a watermark changes it
+    return [watermark.get("offset"), watermark.get("size"), watermark.get("head_digest"), str(watermark.get("updated_at"))]
+
+
+@timed
+async def report_fingerprint():
+    # Everything a report's rows depend on: the three input CSVs, how much of the polls has been
+    # ingested and the engine; equal fingerprints mean the same report
+    watermark = await asyncio.to_thread(get_storage().load_watermark, WATERMARK_ID)
+    inputs = {
+        "files": [file_signature(path) for path in (STORE_STATUS_CSV, BUSINESS_HOURS_CSV, STORE_TIMEZONES_CSV)],
+        "watermark": [watermark.get("offset"), watermark.get("size"), watermark.get("head_digest")],
+        "engine": settings.report_engine
+    }
+    return hashlib.sha1(json.dumps(inputs).encode()).hexdigest()
+
+
+@timed
+async def find_cached_report(fingerprint: str):
+    # The newest complete report computed from the same inputs, if its file is still there
+    report = await get_storage().find_complete_report(fingerprint)
+    if report and report.get("file_path") and os.path.exists(report["file_path"]):
+        return report["report_id"]
+    return None
+
+
+@timed
+async def create_report(report_id: str):
+    # Record the report as Running before any work starts, so get_report can see it
+    await get_storage().create_report({
+        "report_id": report_id,
+        "status": "Running",
+        "stores_done": 0,
+        "stores_total": None,
+        "created_at": datetime.utcnow()
+    })
 
-        return {
-            "store_id": store_id,
-                "uptime_hours": uptime_hours,
-                "downtime_hours": downtime_hours,
-                "estimated_uptime_hours": estimated_uptime_hours,
-                "estimated_downtime_hours": estimated_downtime_hours,
-                "full_data": full_data
-        }
+
+_timezones_cache = {}
+_timezones_lock = threading.Lock()
+
+
+def get_store_timezones(path: str = STORE_TIMEZONES_CSV):
+    # {store_id: timezone_str}, first row per store like the ingest join; reread when the file changes
+    mtime = os.stat(path).st_mtime_ns
+    with _timezones_lock:
+        cached = _timezones_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            timezones = pd.read_csv(path).drop_duplicates('store_id')
+            cached = (mtime, dict(zip(timezones['store_id'].tolist(), timezones['timezone_str'].tolist())))
+            _timezones_cache[path] = cached
+        return cached[1]
+
+
+@timed
+async def load_poll_store(store_ids=None):
+    # Every store's week of polls in compact columns, read once from the database or mapped from segments
+    if settings.poll_segments:
+        await asyncio.to_thread(ensure_poll_segments)
+        poll_store = await asyncio.to_thread(PollStore.load_segments, get_segment_store(), SECONDS_PER_WEEK, store_ids)
+    else:
+        poll_store = await asyncio.to_thread(PollStore.load, get_storage(), SECONDS_PER_WEEK, store_ids)
+    record_rows(len(poll_store))
+    return poll_store
+
+
+async def compute_store_report_entry_columnar(store_id: int, business_hours=None, poll_store: PollStore = None):
+    try:
+        if business_hours is None:
+            business_hours = get_business_hours_index()
+        if poll_store is None:
+            poll_store = await load_poll_store([store_id])
+        return columnar_report_entry(store_id, poll_store, business_hours, get_store_timezones())
 
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
-    
 
 
-async def calculate_uptime_downtime_last_week(store_id: int):
-    try:
-        # Fetch the filtered data from MongoDB for the last week
-        filtered_data_cursor = db.last_week_records.find({"store_id": store_id}).sort("timestamp_local", 1)
-        filtered_data = [{k: v for k, v in record.items() if k != '_id'} for record in filtered_data_cursor]
+@timed
+async def current_online_aggregates(business_hours=None):
+    # The running state, rebuilt from the stored polls when another process ingested since it was
+    # last updated or the business hours or timezones changed
+    if business_hours is None:
+        business_hours = get_business_hours_index()
+    store_timezones = get_store_timezones()
+    watermark = await asyncio.to_thread(get_storage().load_watermark, WATERMARK_ID)
+    version = watermark_version(watermark)
+    if not online_aggregates.is_current(version, business_hours, store_timezones):
+        poll_store = await load_poll_store()
+        record_rows(await asyncio.to_thread(online_aggregates.rebuild, poll_store, business_hours, store_timezones, version))
+    return online_aggregates
 
-        if not filtered_data:
-            last_week_records =[ {
-                "store_id": store_id,
-                "uptime_hours": 0,
-                "downtime_hours": 0,
-                "estimated_uptime_hours": 0,
-                "estimated_downtime_hours": 0,
-                "full_data": []
-            }]
 
-            if last_week_records:
-                db.up_down_week.insert_many(last_week_records)
+async def compute_store_report_entry_online(store_id: int, business_hours=None, aggregates: OnlineAggregates = None):
+    try:
+        if aggregates is None:
+            aggregates = await current_online_aggregates(business_hours)
+        return aggregates.entry(store_id)
 
-            return {
-                "store_id": store_id,
-                "uptime_hours": 0,
-                "downtime_hours": 0,
-                "estimated_uptime_hours": 0,
-                "estimated_downtime_hours": 0,
-                "full_data": []
-            }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
 
-        # Convert filtered data to DataFrame
-        df = pd.DataFrame(filtered_data)
-        df['timestamp_local'] = pd.to_datetime(df['timestamp_local'], format='%H:%M:%S').dt.time
-
-        # Define a base date for time calculations
-        base_date = datetime(2000, 1, 1)  # Arbitrary base date
-
-        # Convert time to datetime for calculations
-        df['timestamp_local'] = df['timestamp_local'].apply(lambda t: datetime.combine(base_date, t))
-
-        # Ensure data is sorted by timestamp
-        df = df.sort_values(by='timestamp_local').reset_index(drop=True)
-
-        # Define the start and end of the period
-        start_time = datetime.combine(base_date, datetime.min.time())
-        end_time = start_time + timedelta(days=7)
-
-        # Create a list to hold the full dataset with estimated records
-        full_data = []
-
-        # Add the start_time if it is not in the DataFrame
-        if df['timestamp_local'].iloc[0] > start_time:
-            full_data.append({'timestamp_local': start_time, 'status': df['status'].iloc[0]})
-
-        # Add the actual records
-        for index, row in df.iterrows():
-            full_data.append({'timestamp_local': row['timestamp_local'], 'status': row['status']})
-
-        # Add the end_time if it is not in the DataFrame
-        if df['timestamp_local'].iloc[-1] < end_time:
-            full_data.append({'timestamp_local': end_time, 'status': df['status'].iloc[-1]})
-
-        # Convert full_data list to DataFrame
-        full_df = pd.DataFrame(full_data)
-        full_df['timestamp_local'] = pd.to_datetime(full_df['timestamp_local'])
-
-        # Calculate the time differences between consecutive records
-        full_df['time_diff'] = full_df['timestamp_local'].diff().fillna(pd.Timedelta(seconds=0)).dt.total_seconds() / 3600
-
-        # Calculate uptime and downtime by summing the time differences where status is 'active' or 'inactive'
-        uptime_hours = full_df[full_df['status'] == 'active']['time_diff'].sum()
-        downtime_hours = full_df[full_df['status'] == 'inactive']['time_diff'].sum()
-
-        # Estimate missing data
-        estimated_uptime_hours = 0
-        estimated_downtime_hours = 0
-
-        # Check for gaps between the first record and the start_time
-        if full_df['timestamp_local'].iloc[0] > start_time:
-            time_gap = (full_df['timestamp_local'].iloc[0] - start_time).total_seconds() / 3600
-            if full_df['status'].iloc[0] == 'active':
-                estimated_uptime_hours += time_gap
-            else:
-                estimated_downtime_hours += time_gap
-
-        # Check for gaps between records
-        for i in range(len(full_df) - 1):
-            gap_duration = (full_df['timestamp_local'].iloc[i + 1] - full_df['timestamp_local'].iloc[i]).total_seconds() / 3600
-            if full_df['status'].iloc[i] == 'active':
-                estimated_uptime_hours += gap_duration
-            else:
-                estimated_downtime_hours += gap_duration
-
-        # Check for gaps between the last record and end_time
-        if full_df['timestamp_local'].iloc[-1] < end_time:
-            time_gap = (end_time - full_df['timestamp_local'].iloc[-1]).total_seconds() / 3600
-            if full_df['status'].iloc[-1] == 'active':
-                estimated_uptime_hours += time_gap
-            else:
-                estimated_downtime_hours += time_gap
-
-        # Convert timestamps to string format for the response
-        for record in full_data:
-            record['timestamp_local'] = record['timestamp_local'].strftime('%H:%M:%S')
-
-        last_week_records =[ {
-                "store_id": store_id,
-                "uptime_hours": uptime_hours,
-                "downtime_hours": downtime_hours,
-                "estimated_uptime_hours": estimated_uptime_hours,
-                "estimated_downtime_hours": estimated_downtime_hours,
-                "full_data": full_data
-        }]
 
-        # Store only records that meet all conditions in MongoDB
-        if last_week_records:
-            db.up_down_week.insert_many(last_week_records)
+async def rollup_edge_polls(store_id: int, ranges, hours):
+    # The store's business-hours polls in the given epoch ranges, oldest first
+    records = []
+    for range_start, range_end in merged_ranges(ranges):
+        records.extend(await get_storage().window_polls(store_id, range_start, range_end, ["timestamp_epoch", "minute_of_week", "status"]))
+    epochs = np.array([record['timestamp_epoch'] for record in records], dtype=np.int64)
+    minutes_of_week = np.array([record['minute_of_week'] for record in records], dtype=np.float64)
+    active = np.array([record.get('status') == "active" for record in records], dtype=bool)
+    inside = hours.contains(minutes_of_week)
+    return epochs[inside], minutes_of_week[inside], active[inside]
+
+
+@timed
+async def store_window_uptime(store_id: int, window_start: int, window_end: int, business_hours=None, unit_minutes: int = 1):
+    # (uptime, downtime) of one store over any [window_start, window_end]: one read of the rollups of the
+    # whole hours inside it and one of the polls of each partial hour at its edges
+    if business_hours is None:
+        business_hours = get_business_hours_index()
+    hours = business_hours.hours_for(store_id)
+    first_hour, last_hour = window_hours(window_start, window_end)
+    rollups = await get_storage().rollups(store_id, first_hour, last_hour) if first_hour <= last_hour else []
+    epochs, minutes_of_week, active = await rollup_edge_polls(store_id, window_edges(window_start, window_end), hours)
+    return rollup_window_estimates(window_start, window_end, rollups, epochs, minutes_of_week, active, hours, unit_minutes)
+
+
+@timed
+async def compute_store_window_uptime(store_id: int, window_start: int, window_end: int, business_hours=None):
+    # (uptime, downtime) in minutes over one window: from the hourly rollups when they are kept,
+    # otherwise from one range read of the store's polls
+    if business_hours is None:
+        business_hours = get_business_hours_index()
+    if settings.poll_rollups:
+        await asyncio.to_thread(ensure_poll_rollups)
+        return await store_window_uptime(store_id, window_start, window_end, business_hours)
+
+    hours = business_hours.hours_for(store_id)
+    epochs, minutes_of_week, active = await rollup_edge_polls(store_id, [(window_start, window_end)], hours)
+    return active_window_estimates(epochs, minutes_of_week, active, window_start, window_end, hours, 1)
+
+
+@timed
+async def get_store_uptime(store_id: int, window_start: int = None, window_end: int = None):
+    # One store's uptime over [window_start, window_end], by default the day up to its latest poll;
+    # results are cached per store, window and data version
+    try:
+        if window_end is None:
+            window_end = await latest_poll_epoch(store_id)
+            if window_end is None:
+                raise HTTPException(status_code=404, detail="No polls for this store")
+        if window_start is None:
+            window_start = window_end - SECONDS_PER_DAY
+        if window_start > window_end:
+            raise HTTPException(status_code=400, detail="start must not be after end")
+
+        key = (store_id, window_start, window_end, await asyncio.to_thread(cache_version))
+        cached = uptime_cache.get(key)
+        if cached is None:
+            uptime, downtime = await compute_store_window_uptime(store_id, window_start, window_end)
+            cached = {"uptime_minutes": uptime, "downtime_minutes": downtime}
+            uptime_cache.put(key, cached)
+            cache = "miss"
+        else:
+            cache = "hit"
 
         return {
             "store_id": store_id,
-            "uptime_hours": uptime_hours,
-            "downtime_hours": downtime_hours,
-            "estimated_uptime_hours": estimated_uptime_hours,
-            "estimated_downtime_hours": estimated_downtime_hours,
-            "full_data": full_data
+            "window_start": datetime.utcfromtimestamp(window_start),
+            "window_end": datetime.utcfromtimestamp(window_end),
+            **cached,
+            "cache": cache
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-store_ids_arr=[]
 
-async def extract_store_ids():
-    global store_ids_arr  
+async def compute_store_report_entry_rollup(store_id: int, business_hours=None, rollups_checked: bool = False):
     try:
-        
-        df = pd.read_csv("data/store_status.csv")
+        if business_hours is None:
+            business_hours = get_business_hours_index()
+        if not rollups_checked:
+            await asyncio.to_thread(ensure_poll_rollups)
+
+        entry = empty_report_entry(store_id)
+        latest_epoch = await latest_poll_epoch(store_id)
+        if latest_epoch is None:
+            return entry
+
+        # The week's whole hours hold the day's, and the hour window's polls the end edge of the other two
+        hours = business_hours.hours_for(store_id)
+        first_hour, last_hour = window_hours(latest_epoch - SECONDS_PER_WEEK, latest_epoch)
+        rollups = await get_storage().rollups(store_id, first_hour, last_hour)
+        edges = [edge for _, length, _ in WINDOWS for edge in window_edges(latest_epoch - length, latest_epoch)]
+        epochs, minutes_of_week, active = await rollup_edge_polls(store_id, edges, hours)
+
+        for name, length, unit_minutes in WINDOWS:
+            uptime, downtime = rollup_window_estimates(
+                latest_epoch - length, latest_epoch, rollups, epochs, minutes_of_week, active, hours, unit_minutes
+            )
+            entry[f"uptime_last_{name}"] = uptime
+            entry[f"downtime_last_{name}"] = downtime
+        return entry
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
-        if 'store_id' not in df.columns:
-            raise ValueError("CSV file must contain a 'store_id' column.")
+@timed
+async def compute_store_report_entry(store_id: int, business_hours=None, run_id: str = ADHOC_RUN_ID, engine: str = None, poll_store: PollStore = None, aggregates: OnlineAggregates = None, rollups_checked: bool = False):
+    engine = engine or settings.report_engine
+    if engine == "fused":
+        return await compute_store_report_entry_fused(store_id, business_hours)
+    if engine == "aggregation":
+        return await compute_store_report_entry_aggregation(store_id, business_hours)
+    if engine == "columnar":
+        return await compute_store_report_entry_columnar(store_id, business_hours, poll_store)
+    if engine == "online":
+        return await compute_store_report_entry_online(store_id, business_hours, aggregates)
+    if engine == "rollup":
+        return await compute_store_report_entry_rollup(store_id, business_hours, rollups_checked)
+
+    await generate_filtered_data_table_last_hour(store_id, run_id)
+    hour_data = await calculate_uptime_downtime_last_hour(store_id, run_id)
+    
 
-        
-        store_ids = df['store_id'].unique()
+    await generate_filtered_data_table_last_day(store_id, run_id)
+    day_data = await calculate_uptime_downtime_last_day(store_id, run_id)
 
+    await generate_filtered_data_table_last_week(store_id, run_id)
+    week_data = await calculate_uptime_downtime_last_week(store_id, run_id)
+    
     
-        store_ids_arr = store_ids.tolist()  
+    return {
+        "store_id": store_id,
+        "uptime_last_hour": hour_data['estimated_uptime_minutes'],
+        "uptime_last_day": day_data['estimated_uptime_hours'],
+        "uptime_last_week": week_data['estimated_uptime_hours'],
+        "downtime_last_hour": hour_data['estimated_downtime_minutes'],
+        "downtime_last_day": day_data['estimated_downtime_hours'],
+        "downtime_last_week": week_data['estimated_downtime_hours']
+    }
+
+
+def compute_report_shard(store_ids, run_id):
+    # Runs inside a worker process, which opens its own storage connection and loads its own stores
+    async def compute():
+        business_hours = get_business_hours_index() if settings.report_engine != "legacy" else None
+        # The rollups were brought up to date before the report was split into shards
+        return [await compute_store_report_entry(store_id, business_hours, run_id, rollups_checked=True) for store_id in store_ids]
+
+    return asyncio.run(compute())
+
+
+report_process_pool = None
+report_process_pool_lock = threading.Lock()
+
+
+def get_report_process_pool():
+    global report_process_pool
+    with report_process_pool_lock:
+        if report_process_pool is None:
+            # spawn, because a forked MongoClient is not safe to use in the child
+            report_process_pool = ProcessPoolExecutor(
+                max_workers=settings.report_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return report_process_pool
 
-        return {"store_ids": store_ids_arr}
 
-    except pd.errors.EmptyDataError:
-        raise HTTPException(status_code=500, detail="CSV file is empty.")
-    except pd.errors.ParserError:
-        raise HTTPException(status_code=500, detail="Error parsing CSV file.")
-    except ValueError as ve:
-        raise HTTPException(status_code=400, detail=str(ve))
-    except Exception as e:
-        print(f"Error: {e}")
-        raise HTTPException(status_code=500, detail="Internal Server Error")
+def split_into_shards(store_ids, shard_count):
+    shard_size = max(1, -(-len(store_ids) // shard_count))
+    return [store_ids[start:start + shard_size] for start in range(0, len(store_ids), shard_size)]
 
 
-async def generate_report():
+async def build_report(report_id: str):
     # Ensure all data is processed
     await process_all_polling_data()
     await process_latest_polling_data()
+
+    # Taken after ingest, so it describes the data this report is computed from
+    fingerprint = await report_fingerprint()
     
     
-    if not store_ids_arr:
-        await extract_store_ids()
-    final_results = []
-
-    for store_id in store_ids_arr:
-        
-        await generate_filtered_data_table_last_hour(store_id)
-        hour_data = await calculate_uptime_downtime_last_hour(store_id)
-        
-
-        await generate_filtered_data_table_last_day(store_id)
-        day_data = await calculate_uptime_downtime_last_day(store_id)
-
-        await generate_filtered_data_table_last_week(store_id)
-        week_data = await calculate_uptime_downtime_last_week(store_id)
-        
-        
-        report_entry = {
-            "store_id": store_id,
-            "uptime_last_hour": hour_data['estimated_uptime_minutes'],
-            "uptime_last_day": day_data['estimated_uptime_hours'],
-            "uptime_last_week": week_data['estimated_uptime_hours'],
-            "downtime_last_hour": hour_data['estimated_downtime_minutes'],
-            "downtime_last_day": day_data['estimated_downtime_hours'],
-            "downtime_last_week": week_data['estimated_downtime_hours']
-        }
-        
-        final_results.append(report_entry)
-    
+    store_ids = list(await get_store_ids())
+    report_entries = {}
+
+    stores_total = len(store_ids)
+    await get_storage().update_report(report_id, {"stores_total": stores_total})
+
+    # Persist progress roughly every 1% of stores instead of once per store
+    progress_every = max(1, stores_total // 100)
+    last_progress = 0
+
+    async def record_progress():
+        nonlocal last_progress
+        if len(report_entries) - last_progress >= progress_every:
+            last_progress = len(report_entries)
+            await get_storage().update_report(report_id, {"stores_done": last_progress})
+
+    try:
+        with stage("compute_stores"):
+            await compute_stores(store_ids, report_id, report_entries, record_progress)
+    finally:
+        if settings.report_engine == "legacy":
+            await discard_run_intermediates(report_id)
+
+    # Rows are written in store order whichever way they were computed
+    final_results = [report_entries[store_id] for store_id in store_ids]
 
     final_report_df = pd.DataFrame(final_results)
-    
-    
-    report_id = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
-    
-    
-    file_path = f"{report_id}.csv"
-    
-    
-    final_report_df.to_csv(file_path, index=False)
-    
-    
-    db.reports.insert_one({"report_id": report_id, "status": "Complete", "file_path": file_path})
+
+    # Written under a temporary name and renamed, so a download never sees a partial file
+    with stage("write_csv"):
+        os.makedirs(settings.report_dir, exist_ok=True)
+        file_path = os.path.join(settings.report_dir, f"{report_id}.csv")
+        final_report_df.to_csv(f"{file_path}.tmp", index=False)
+        os.replace(f"{file_path}.tmp", file_path)
+        record_bytes(os.path.getsize(file_path))
+
+    return {"file_path": file_path, "fingerprint": fingerprint, "stores_done": stores_total}
+
+
+async def compute_stores(store_ids, report_id, report_entries, record_progress):
+    # Stages inside worker processes are not seen here; the report records the shards' total under compute_stores
+    # The columnar and online engines hold every store in memory at once, so they are not sharded
+    if settings.report_engine == "rollup":
+        await asyncio.to_thread(ensure_poll_rollups)
+    if settings.report_workers > 1 and len(store_ids) > 1 and settings.report_engine not in ("columnar", "online"):
+        # Several shards per worker so a slow shard does not leave the other cores idle
+        loop = asyncio.get_running_loop()
+        pool = get_report_process_pool()
+        shards = [
+            loop.run_in_executor(pool, compute_report_shard, shard, report_id)
+            for shard in split_into_shards(store_ids, settings.report_workers * 4)
+        ]
+        for shard in asyncio.as_completed(shards):
+            for report_entry in await shard:
+                report_entries[report_entry["store_id"]] = report_entry
+            await record_progress()
+    else:
+        # The other engines use one business hours index for the whole report, the columnar one a single poll read
+        # and the online one its running state
+        business_hours = get_business_hours_index() if settings.report_engine != "legacy" else None
+        poll_store = await load_poll_store() if settings.report_engine == "columnar" else None
+        aggregates = await current_online_aggregates(business_hours) if settings.report_engine == "online" else None
+        for store_id in store_ids:
+            report_entries[store_id] = await compute_store_report_entry(
+                store_id, business_hours, report_id, poll_store=poll_store, aggregates=aggregates, rollups_checked=True
+            )
+            await record_progress()
+
+
+@timed
+async def generate_report(report_id: str = None):
+    if report_id is None:
+        report_id = new_report_id()
+        await create_report(report_id)
+
+    # Time, DB commands, rows and bytes of every stage this report runs, kept on the report for diagnosis
+    with collect_stages() as stages:
+        try:
+            result = await build_report(report_id)
+        except Exception:
+            await get_storage().update_report(report_id, {"stages": rounded(stages)})
+            raise
+
+    await get_storage().update_report(report_id, {
+        "status": "Complete",
+        **result,
+        "stages": rounded(stages),
+        "finished_at": datetime.utcnow()
+    })
     
     return report_id
 
+@timed
 async def get_report(report_id: str):
-    report = db.reports.find_one({"report_id": report_id})
+    report = await get_storage().find_report(report_id)
     if report:
         if report["status"] == "Running":
-            return {"status": "Running"}
+            return {"status": "Running", "stores_done": report.get("stores_done", 0), "stores_total": report.get("stores_total")}
         elif report["status"] == "Complete":
-            return {"status": "Complete", "file_path": report.get("file_path")}
+            return {"status": "Complete", "file_path": report.get("file_path"), "stages": report.get("stages")}
+        elif report["status"] == "Failed":
+            return {"status": "Failed", "error": report.get("error")}
     return {"status": "Report not found"}
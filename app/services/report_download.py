@@ -0,0 +1,128 @@
+import os
+import re
+import zlib
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+from app.config import settings
+from app.storage import get_storage
+
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+async def find_report_file(report_id: str):
+    report = await get_storage().find_report(report_id)
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if report["status"] != "Complete":
+        raise HTTPException(status_code=409, detail=f"Report is {report['status']}")
+    file_path = report.get("file_path")
+    if not file_path or not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return file_path
+
+
+def report_etag(report_id: str, stat, encoding: str):
+    # Reports are never rewritten, so size and mtime identify the bytes; each encoding is its own representation
+    suffix = f"-{encoding}" if encoding != "identity" else ""
+    return f'"{report_id}-{stat.st_size:x}-{stat.st_mtime_ns:x}{suffix}"'
+
+
+def etag_matches(header: str, etag: str):
+    # Weak comparison, as If-None-Match requires
+    if header is None:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+
+def accepts_gzip(header: str):
+    for coding in (header or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() == "gzip":
+            quality = params.strip().lower()
+            try:
+                return not quality.startswith("q=") or float(quality[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def parse_range(header: str, size: int):
+    # (start, end) inclusive for a single satisfiable byte range, None to send the whole file;
+    # multiple ranges are answered with the whole file, which the spec allows
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Range Not Satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def iter_file(file_path: str, start: int, end: int):
+    # Reads at most download_chunk_size bytes at a time, so memory does not grow with the report
+    with open(file_path, "rb") as report_file:
+        report_file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = report_file.read(min(settings.download_chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def iter_gzip(file_path: str):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in iter_file(file_path, 0, os.path.getsize(file_path) - 1):
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def report_download_response(report_id: str, headers):
+    file_path = await find_report_file(report_id)
+    stat = os.stat(file_path)
+    size = stat.st_size
+
+    # gzip is produced on the fly, so ranges are served from the uncompressed body only
+    range_header = headers.get("range")
+    encoding = "gzip" if accepts_gzip(headers.get("accept-encoding")) and not range_header else "identity"
+    etag = report_etag(report_id, stat, encoding)
+    response_headers = {
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        "Content-Disposition": f'attachment; filename="{report_id}.csv"',
+        "Accept-Ranges": "bytes"
+    }
+
+    if etag_matches(headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=response_headers)
+
+    if encoding == "gzip":
+        return StreamingResponse(
+            iter_gzip(file_path), media_type="text/csv", headers={**response_headers, "Content-Encoding": "gzip"}
+        )
+
+    byte_range = None
+    # If-Range: resume only when the client still has the same version, otherwise send it all again
+    if range_header and size and headers.get("if-range", etag) == etag:
+        byte_range = parse_range(range_header, size)
+
+    if byte_range is None:
+        return StreamingResponse(
+            iter_file(file_path, 0, size - 1), media_type="text/csv",
+            headers={**response_headers, "Content-Length": str(size)}
+        )
+
+    start, end = byte_range
+    return StreamingResponse(
+        iter_file(file_path, start, end), status_code=206, media_type="text/csv",
+        headers={**response_headers, "Content-Length": str(end - start + 1), "Content-Range": f"bytes {start}-{end}/{size}"}
+    )
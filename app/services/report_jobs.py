@@ -0,0 +1,71 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fastapi import HTTPException
+from app.config import settings
+from app.services.polling_service import create_report, find_cached_report, generate_report, new_report_id, report_fingerprint
+from app.storage import get_storage
+
+
+# Each job runs generate_report on its own event loop in a worker thread,
+# so the request that triggered it returns as soon as the job is recorded
+executor = ThreadPoolExecutor(max_workers=settings.report_max_concurrent_jobs, thread_name_prefix="report-job")
+
+active_jobs = set()
+active_jobs_lock = threading.Lock()
+
+# Fingerprint of the inputs -> report_id of the job computing it, so identical triggers share one run
+running_fingerprints = {}
+
+
+def run_report_job(report_id: str, fingerprint: str = None):
+    try:
+        asyncio.run(generate_report(report_id))
+    except Exception as e:
+        print(f"Error: {e}")
+        asyncio.run(get_storage().update_report(report_id, {
+            "status": "Failed",
+            "error": getattr(e, "detail", None) or str(e) or type(e).__name__,
+            "finished_at": datetime.utcnow()
+        }))
+    finally:
+        with active_jobs_lock:
+            active_jobs.discard(report_id)
+            if running_fingerprints.get(fingerprint) == report_id:
+                del running_fingerprints[fingerprint]
+
+
+async def submit_report_job():
+    fingerprint = None
+    if settings.report_cache:
+        # A finished report over the same inputs is returned as is
+        fingerprint = await report_fingerprint()
+        cached_report_id = await find_cached_report(fingerprint)
+        if cached_report_id:
+            return {"report_id": cached_report_id, "cache": "hit"}
+
+    with active_jobs_lock:
+        # A trigger for inputs that are already being computed attaches to that run
+        if fingerprint in running_fingerprints:
+            return {"report_id": running_fingerprints[fingerprint], "cache": "joined"}
+
+        if len(active_jobs) >= settings.report_max_concurrent_jobs:
+            raise HTTPException(status_code=429, detail="Too many reports are running, try again later")
+
+        # Reserve the slot before awaiting so concurrent triggers cannot overshoot the cap
+        report_id = new_report_id()
+        active_jobs.add(report_id)
+        if fingerprint:
+            running_fingerprints[fingerprint] = report_id
+
+    try:
+        await create_report(report_id)
+    except BaseException:
+        with active_jobs_lock:
+            active_jobs.discard(report_id)
+            running_fingerprints.pop(fingerprint, None)
+        raise
+
+    executor.submit(run_report_job, report_id, fingerprint)
+    return {"report_id": report_id, "cache": "miss"}
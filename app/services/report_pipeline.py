@@ -0,0 +1,102 @@
+import numpy as np
+from fastapi import HTTPException
+from app.storage import get_storage
+from app.utils.metrics import timed
+from app.utils.business_hours import get_business_hours_index
+
+
+SECONDS_PER_HOUR = 60 * 60
+SECONDS_PER_DAY = 24 * SECONDS_PER_HOUR
+SECONDS_PER_WEEK = 7 * SECONDS_PER_DAY
+
+# (name, length in seconds, result unit in minutes) for the three report windows
+WINDOWS = [
+    ("hour", SECONDS_PER_HOUR, 1),
+    ("day", SECONDS_PER_DAY, 60),
+    ("week", SECONDS_PER_WEEK, 60),
+]
+
+
+async def latest_poll_epoch(store_id: int):
+    # The newest poll closes every window; served from the (store_id, timestamp_epoch) index
+    return await get_storage().latest_poll_epoch(store_id)
+
+
+def window_estimates(epochs, minutes_of_week, statuses, window_start, window_end, hours, unit_minutes):
+    # Polls are sorted, inside [window_start, window_end] and already within business hours.
+    # Each status holds until the next poll and the last one until the window end; the first
+    # status is extrapolated back to the window start. Only open business minutes are counted.
+    if not len(epochs):
+        return 0, 0
+    return active_window_estimates(epochs, minutes_of_week, np.asarray(statuses) == 'active', window_start, window_end, hours, unit_minutes)
+
+
+def active_window_estimates(epochs, minutes_of_week, active, window_start, window_end, hours, unit_minutes):
+    # window_estimates with the statuses already reduced to a boolean array
+    if not len(epochs):
+        return 0, 0
+
+    epochs = np.asarray(epochs, dtype=np.int64)
+    minutes_of_week = np.asarray(minutes_of_week, dtype=np.float64)
+
+    durations = np.diff(np.append(epochs, window_end)) / 60
+    open_minutes = hours.overlap(minutes_of_week, durations)
+
+    lead = (epochs[0] - window_start) / 60
+    lead_open = float(hours.overlap(minutes_of_week[:1] - lead, [lead])[0])
+
+    uptime = float(open_minutes[active].sum()) + (lead_open if active[0] else 0.0)
+    downtime = float(open_minutes[~active].sum()) + (0.0 if active[0] else lead_open)
+    return uptime / unit_minutes, downtime / unit_minutes
+
+
+@timed
+async def compute_store_report_entry_fused(store_id: int, business_hours=None):
+    try:
+        if business_hours is None:
+            business_hours = get_business_hours_index()
+
+        entry = {
+            "store_id": store_id,
+            "uptime_last_hour": 0,
+            "uptime_last_day": 0,
+            "uptime_last_week": 0,
+            "downtime_last_hour": 0,
+            "downtime_last_day": 0,
+            "downtime_last_week": 0
+        }
+
+        latest_epoch = await latest_poll_epoch(store_id)
+        if latest_epoch is None:
+            return entry
+
+        # One range read of the week covers the day and hour windows as well
+        records = await get_storage().window_polls(
+            store_id, latest_epoch - SECONDS_PER_WEEK, latest_epoch, ["timestamp_epoch", "minute_of_week", "status"]
+        )
+
+        hours = business_hours.hours_for(store_id)
+        epochs = np.array([record['timestamp_epoch'] for record in records], dtype=np.int64)
+        minutes_of_week = np.array([record['minute_of_week'] for record in records], dtype=np.float64)
+        statuses = np.array([record.get('status', 'unknown') for record in records], dtype=object)
+
+        # Apply business hours once; every window keeps the filtered, epoch-sorted polls
+        inside = hours.contains(minutes_of_week)
+        epochs, minutes_of_week, statuses = epochs[inside], minutes_of_week[inside], statuses[inside]
+
+        for name, length, unit_minutes in WINDOWS:
+            window_start = latest_epoch - length
+            first = np.searchsorted(epochs, window_start, side='left')
+            uptime, downtime = window_estimates(
+                epochs[first:], minutes_of_week[first:], statuses[first:], window_start, latest_epoch, hours, unit_minutes
+            )
+            entry[f"uptime_last_{name}"] = uptime
+            entry[f"downtime_last_{name}"] = downtime
+
+        return entry
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+from app.config import settings
+from app.utils.metrics import UPTIME_CACHE_ENTRIES, UPTIME_CACHE_LOOKUPS
+
+
+class UptimeCache:
+    # Least recently used per-store window results, keyed on (store_id, window_start, window_end, version)
+    # where version identifies the data they were computed from. An ingest in this process drops the
+    # entries of the stores it wrote polls for and carries the others over to the new version; any
+    # other change of version (another process ingested, new business hours) simply stops them matching.
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Exported from the start, so a dashboard sees zeros instead of no series
+        UPTIME_CACHE_LOOKUPS.inc(0, "hit")
+        UPTIME_CACHE_LOOKUPS.inc(0, "miss")
+        UPTIME_CACHE_ENTRIES.set(0)
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+        UPTIME_CACHE_LOOKUPS.inc(1, "miss" if result is None else "hit")
+        return result
+
+    def put(self, key, result):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            UPTIME_CACHE_ENTRIES.set(len(self.entries))
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            UPTIME_CACHE_ENTRIES.set(0)
+
+    def advance(self, version, new_version, store_ids):
+        # After an ingest: results of the given stores are stale, those of every other store still hold
+        store_ids = set(store_ids)
+        with self.lock:
+            entries = OrderedDict()
+            for key, result in self.entries.items():
+                store_id, window_start, window_end, key_version = key
+                if store_id in store_ids:
+                    continue
+                entries[(store_id, window_start, window_end, new_version if key_version == version else key_version)] = result
+            self.entries = entries
+            UPTIME_CACHE_ENTRIES.set(len(self.entries))
+
+
+uptime_cache = UptimeCache(settings.uptime_cache_size)
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from app.config import settings
+from app.services.polling_service import ensure_poll_rollups, get_store_ids, get_store_timezones
+from app.storage import get_storage
+from app.storage.segments import get_segment_store
+from app.utils.business_hours import get_business_hours_index
+from app.utils.metrics import STARTUP_SECONDS
+from app.utils.time_conversion import get_timezone
+
+
+# Seconds per startup phase, and whether the caches are warm
+startup_timings = {}
+startup_state = {"ready": False}
+
+
+def record_startup(phase: str, seconds: float):
+    startup_timings[phase] = round(seconds, 3)
+    STARTUP_SECONDS.set(seconds, phase)
+
+
+def warm_timezones():
+    # The store -> timezone map and every zone it names
+    for timezone_str in set(get_store_timezones().values()):
+        get_timezone(timezone_str)
+
+
+async def warm_caches():
+    # Fill what the first requests would otherwise read from disk or the database; a cache that
+    # cannot be filled is left for the request that needs it
+    steps = [
+        ("warm_storage", lambda: get_storage().ping()),
+        ("warm_store_catalog", get_store_ids),
+        ("warm_timezones", lambda: asyncio.to_thread(warm_timezones)),
+        ("warm_business_hours", lambda: asyncio.to_thread(get_business_hours_index)),
+    ]
+    if settings.poll_segments:
+        steps.append(("warm_poll_segments", lambda: asyncio.to_thread(get_segment_store().segments)))
+    if settings.poll_rollups:
+        steps.append(("warm_poll_rollups", lambda: asyncio.to_thread(ensure_poll_rollups)))
+
+    for phase, warm in steps:
+        started_at = time.perf_counter()
+        try:
+            await warm()
+        except Exception as e:
+            print(f"Error: could not {phase.replace('_', ' ')}: {getattr(e, 'detail', None) or e}")
+        record_startup(phase, time.perf_counter() - started_at)
+
+
+async def warm_up(import_started_at: float):
+    # Readiness is measured from the start of the app import
+    await warm_caches()
+    record_startup("ready", time.perf_counter() - import_started_at)
+    startup_state["ready"] = True
+    print("Ready in {ready:.2f}s (import {import:.2f}s, startup {startup:.2f}s)".format(**startup_timings))
+
+
+def start_warmup(import_started_at: float):
+    # Requests are served while the caches fill; GET /ready answers 503 until they are warm
+    return asyncio.get_running_loop().create_task(warm_up(import_started_at))
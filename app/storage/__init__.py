@@ -0,0 +1,33 @@
+from app.config import settings
+from app.storage.base import WINDOW_NAMES, Storage
+
+
+STORAGE_BACKENDS = ("mongodb", "sqlite")
+
+_storage = None
+
+
+def create_storage(backend: str):
+    # Backends are imported on demand, so the sqlite backend never loads the MongoDB client
+    if backend == "mongodb":
+        from app.db import adb
+        from app.storage.mongodb import MongoStorage
+        return MongoStorage(adb)
+    if backend == "sqlite":
+        from app.storage.sqlite import SQLiteStorage
+        return SQLiteStorage(settings.sqlite_path)
+    raise ValueError(f"storage_backend must be one of {', '.join(STORAGE_BACKENDS)}, not {backend!r}")
+
+
+def get_storage() -> Storage:
+    # The backend named by settings.storage_backend, created on first use
+    global _storage
+    if _storage is None:
+        _storage = create_storage(settings.storage_backend)
+    return _storage
+
+
+def set_storage(storage: Storage):
+    # Swap the backend every service uses, e.g. for benchmarks
+    global _storage
+    _storage = storage
@@ -0,0 +1,144 @@
+from abc import ABC, abstractmethod
+import numpy as np
+
+
+# Legacy engine windows and the intermediates each one keeps per run
+WINDOW_NAMES = ("hour", "day", "week")
+
+
+def poll_column_chunks(rows, chunk_size: int):
+    # (store_id, timestamp_epoch, status) rows as (store_ids, epochs, active) arrays of at most chunk_size polls
+    rows = iter(rows)
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            return
+        store_ids, epochs, statuses = zip(*chunk)
+        yield np.array(store_ids), np.array(epochs, dtype=np.int64), np.array(statuses, dtype=object) == "active"
+
+
+class Storage(ABC):
+    # Everything the services persist: polls, the latest status per store, the ingest watermark,
+    # the legacy engine's per-run intermediates and report metadata. Ingest methods block and are
+    # called from worker threads; the report path awaits the rest. Backends implement every abstract method.
+    name = None
+
+    # Whether the aggregation report engine can run its pipeline here
+    supports_aggregation = False
+
+    async def ping(self):
+        # Open a connection ahead of the first request that needs one
+        pass
+
+    # Polls
+
+    @abstractmethod
+    def upsert_polls(self, processed_data):
+        # Insert polls keyed on (store_id, timestamp_utc); polls already stored are left as they are
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert_latest(self, processed_data):
+        # Replace each store's latest poll
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_watermark(self, watermark_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_watermark(self, watermark_id: str, document: dict):
+        raise NotImplementedError
+
+    def backfill_poll_epochs(self, migration_id: str, localize):
+        # Polls stored before timestamp_epoch existed get it once, and polls too old to carry a date are archived;
+        # backends that always stored it have nothing to do
+        return {"migrated": 0, "archived": 0}
+
+    @abstractmethod
+    async def latest_poll_epoch(self, store_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def latest_poll_epochs(self, store_ids=None):
+        # {store_id: newest timestamp_epoch} for every store, or for the given stores
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_poll_columns(self, since_epoch: int, store_ids=None, chunk_size: int = 100000):
+        # Polls at or after since_epoch ordered by store then time, as poll_column_chunks arrays
+        raise NotImplementedError
+
+    @abstractmethod
+    async def window_polls(self, store_id, window_start: int, window_end: int, fields=None):
+        # The store's polls with window_start <= timestamp_epoch <= window_end, oldest first
+        raise NotImplementedError
+
+    async def aggregate_polls(self, pipeline):
+        raise NotImplementedError(f"{self.name} storage cannot run aggregation pipelines")
+
+    # Hourly rollups of business-hours uptime per store (see app/services/poll_rollups.py). Maintained
+    # by ingest threads; reports read them back a window at a time.
+
+    @abstractmethod
+    def upsert_rollups(self, rollups):
+        # Insert or replace rollups keyed on (store_id, hour)
+        raise NotImplementedError
+
+    @abstractmethod
+    def replace_rollups(self, batches):
+        # Every rollup at once from an iterable of lists of rollups: they are written aside and take the
+        # place of the current ones in one step, so readers see either the old or the new rollups
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_rollups(self, store_id=None, from_hour: int = 0):
+        # The store's rollups from from_hour on, or every store's
+        raise NotImplementedError
+
+    @abstractmethod
+    def last_rollups(self, store_ids, before_hour: int = None):
+        # {store_id: newest rollup} for the given stores, only counting hours before before_hour
+        raise NotImplementedError
+
+    @abstractmethod
+    async def rollups(self, store_id, first_hour: int, last_hour: int):
+        # The store's rollups with first_hour <= hour <= last_hour, oldest first
+        raise NotImplementedError
+
+    # Legacy engine intermediates, tagged with the run that wrote them
+
+    @abstractmethod
+    async def replace_window_records(self, window: str, run_id: str, store_id, records):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def window_records(self, window: str, run_id: str, store_id, window_start: int, window_end: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_window_result(self, window: str, run_id: str, store_id, result: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def discard_run(self, run_id: str):
+        raise NotImplementedError
+
+    # Report metadata
+
+    @abstractmethod
+    async def create_report(self, document: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_report(self, report_id: str, fields: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_report(self, report_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_complete_report(self, fingerprint: str):
+        # The newest complete report with this fingerprint
+        raise NotImplementedError
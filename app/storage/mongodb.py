@@ -0,0 +1,234 @@
+from datetime import datetime
+import pandas as pd
+from pymongo import ASCENDING, ReplaceOne, UpdateMany, UpdateOne
+from app.config import settings
+from app.storage.base import Storage, poll_column_chunks
+
+
+# (records collection, results collection) per legacy window
+WINDOW_COLLECTIONS = {
+    "hour": ("last_hour_records", "up_down_hour"),
+    "day": ("last_day_records", "up_down_day"),
+    "week": ("last_week_records", "up_down_week"),
+}
+
+# Per-run intermediates of the legacy engine, tagged with run_id and expired by a TTL index on created_at
+INTERMEDIATE_COLLECTIONS = [collection for collections in WINDOW_COLLECTIONS.values() for collection in collections]
+
+
+class MongoStorage(Storage):
+    name = "mongodb"
+    supports_aggregation = True
+
+    def __init__(self, database):
+        # An AsyncDatabase; database.sync is the pymongo database the ingest threads write to
+        self.database = database
+
+    async def ping(self):
+        await self.database.run(lambda: self.database.sync.command("ping"))
+
+    def upsert_polls(self, processed_data):
+        # Unordered bulk upserts keyed on (store_id, timestamp_utc): re-ingesting a poll is a no-op
+        batch_size = settings.insert_batch_size
+        for start in range(0, len(processed_data), batch_size):
+            batch = processed_data.iloc[start:start + batch_size].to_dict('records')
+            self.database.sync.all_polling_data.bulk_write([
+                UpdateOne(
+                    {"store_id": record['store_id'], "timestamp_utc": record['timestamp_utc']},
+                    {"$setOnInsert": record},
+                    upsert=True
+                )
+                for record in batch
+            ], ordered=False)
+
+    def upsert_latest(self, processed_data):
+        # One document per store, overwritten whenever a newer poll arrives
+        batch_size = settings.insert_batch_size
+        for start in range(0, len(processed_data), batch_size):
+            batch = processed_data.iloc[start:start + batch_size].to_dict('records')
+            self.database.sync.latest_polling_data.bulk_write([
+                UpdateMany({"store_id": record['store_id']}, {"$set": record}, upsert=True)
+                for record in batch
+            ], ordered=False)
+
+    def load_watermark(self, watermark_id: str):
+        return self.database.sync.ingest_watermarks.find_one({"_id": watermark_id}) or {}
+
+    def save_watermark(self, watermark_id: str, document: dict):
+        self.database.sync.ingest_watermarks.replace_one({"_id": watermark_id}, {"_id": watermark_id, **document}, upsert=True)
+
+    def backfill_poll_epochs(self, migration_id: str, localize):
+        if self.database.sync.migrations.find_one({"_id": migration_id}):
+            return {"migrated": 0, "archived": 0}
+
+        migrated = archived = 0
+        collections = (self.database.sync.all_polling_data, self.database.sync.latest_polling_data)
+
+        # Polls from before timestamp_utc was stored only carry timestamp_local and day_of_week. Without a
+        # date they cannot be given an epoch, and the CSV holds them all again, so they are moved out to
+        # legacy_polling_data; left in place they would block the unique (store_id, timestamp_utc) index.
+        undated = {"timestamp_epoch": {"$exists": False}, "timestamp_utc": {"$exists": False}}
+        for collection in collections:
+            while True:
+                batch = list(collection.find(undated).limit(settings.insert_batch_size))
+                if not batch:
+                    break
+                self.database.sync.legacy_polling_data.insert_many([
+                    {"collection": collection.name, "document": document, "archived_at": datetime.utcnow()} for document in batch
+                ])
+                collection.delete_many({"_id": {"$in": [document["_id"] for document in batch]}})
+                archived += len(batch)
+
+        missing = {"timestamp_epoch": {"$exists": False}, "timestamp_utc": {"$exists": True}}
+        for collection in collections:
+            while True:
+                batch = list(collection.find(missing, {"store_id": 1, "timestamp_utc": 1, "status": 1}).limit(settings.insert_batch_size))
+                if not batch:
+                    break
+
+                polling_data = pd.DataFrame(batch)
+                polling_data['timestamp_utc'] = pd.to_datetime(polling_data['timestamp_utc'], utc=True)
+                processed_data = localize(polling_data)
+
+                collection.bulk_write([
+                    UpdateOne({"_id": document_id}, {"$set": {"timestamp_epoch": int(epoch), "minute_of_week": float(minute)}})
+                    for document_id, epoch, minute in zip(
+                        polling_data['_id'], processed_data['timestamp_epoch'], processed_data['minute_of_week']
+                    )
+                ], ordered=False)
+                migrated += len(batch)
+
+        # Polls written without an epoch while this ran are picked up by the next run
+        if not any(collection.find_one({"timestamp_epoch": {"$exists": False}}, {"_id": 1}) for collection in collections):
+            self.database.sync.migrations.insert_one({
+                "_id": migration_id, "migrated": migrated, "archived": archived, "finished_at": datetime.utcnow()
+            })
+        return {"migrated": migrated, "archived": archived}
+
+    async def latest_poll_epoch(self, store_id):
+        # The newest poll closes every window; served from the (store_id, timestamp_epoch) index
+        latest = await self.database.all_polling_data.find(
+            {"store_id": store_id, "timestamp_epoch": {"$exists": True}},
+            {"_id": 0, "timestamp_epoch": 1},
+            sort=[("timestamp_epoch", -1)],
+            limit=1
+        )
+        return int(latest[0]['timestamp_epoch']) if latest else None
+
+    def latest_poll_epochs(self, store_ids=None):
+        # Walking the (store_id, timestamp_epoch) index backwards, the first poll of each store is its newest
+        match = {"timestamp_epoch": {"$exists": True}}
+        if store_ids is not None:
+            match["store_id"] = {"$in": list(store_ids)}
+        return {
+            latest["_id"]: int(latest["timestamp_epoch"])
+            for latest in self.database.sync.all_polling_data.aggregate([
+                {"$match": match},
+                {"$sort": {"store_id": -1, "timestamp_epoch": -1}},
+                {"$group": {"_id": "$store_id", "timestamp_epoch": {"$first": "$timestamp_epoch"}}}
+            ])
+        }
+
+    def iter_poll_columns(self, since_epoch: int, store_ids=None, chunk_size: int = 100000):
+        query = {"timestamp_epoch": {"$gte": since_epoch}}
+        if store_ids is not None:
+            query["store_id"] = {"$in": list(store_ids)}
+        cursor = self.database.sync.all_polling_data.find(
+            query, {"_id": 0, "store_id": 1, "timestamp_epoch": 1, "status": 1}
+        ).sort([("store_id", 1), ("timestamp_epoch", 1)]).batch_size(chunk_size)
+        rows = ((poll["store_id"], poll["timestamp_epoch"], poll.get("status")) for poll in cursor)
+        return poll_column_chunks(rows, chunk_size)
+
+    async def find_window(self, collection: str, query: dict, projection=None):
+        # Bounded range scan: cost follows the window length, not the store's history
+        return await self.database[collection].find(query, projection or {"_id": 0}, sort=[("timestamp_epoch", 1)])
+
+    async def window_polls(self, store_id, window_start: int, window_end: int, fields=None):
+        projection = {"_id": 0, **{field: 1 for field in fields}} if fields else None
+        query = {"store_id": store_id, "timestamp_epoch": {"$gte": window_start, "$lte": window_end}}
+        return await self.find_window("all_polling_data", query, projection)
+
+    async def aggregate_polls(self, pipeline):
+        return await self.database.all_polling_data.aggregate(pipeline)
+
+    def upsert_rollups(self, rollups):
+        batch_size = settings.insert_batch_size
+        for start in range(0, len(rollups), batch_size):
+            self.database.sync.poll_rollups.bulk_write([
+                ReplaceOne({"store_id": rollup["store_id"], "hour": rollup["hour"]}, rollup, upsert=True)
+                for rollup in rollups[start:start + batch_size]
+            ], ordered=False)
+
+    def replace_rollups(self, batches):
+        # Written to a staging collection with the same unique index, then renamed over poll_rollups, which
+        # swaps the two atomically
+        staging = self.database.sync.poll_rollups_staging
+        staging.drop()
+        staging.create_index([("store_id", ASCENDING), ("hour", ASCENDING)], name="store_id_hour", unique=True)
+        for rollups in batches:
+            if rollups:
+                staging.insert_many(rollups, ordered=False)
+        staging.rename("poll_rollups", dropTarget=True)
+
+    def delete_rollups(self, store_id=None, from_hour: int = 0):
+        query = {"hour": {"$gte": from_hour}}
+        if store_id is not None:
+            query["store_id"] = store_id
+        self.database.sync.poll_rollups.delete_many(query)
+
+    def last_rollups(self, store_ids, before_hour: int = None):
+        # Walking the (store_id, hour) index backwards, the first rollup of each store is its newest
+        match = {"store_id": {"$in": list(store_ids)}}
+        if before_hour is not None:
+            match["hour"] = {"$lt": before_hour}
+        return {
+            latest["_id"]: {field: value for field, value in latest["rollup"].items() if field != "_id"}
+            for latest in self.database.sync.poll_rollups.aggregate([
+                {"$match": match},
+                {"$sort": {"store_id": -1, "hour": -1}},
+                {"$group": {"_id": "$store_id", "rollup": {"$first": "$$ROOT"}}}
+            ])
+        }
+
+    async def rollups(self, store_id, first_hour: int, last_hour: int):
+        return await self.database.poll_rollups.find(
+            {"store_id": store_id, "hour": {"$gte": first_hour, "$lte": last_hour}}, {"_id": 0}, sort=[("hour", 1)]
+        )
+
+    async def replace_window_records(self, window: str, run_id: str, store_id, records):
+        # Replaces this run's earlier records for the store
+        records_collection = self.database[WINDOW_COLLECTIONS[window][0]]
+        await records_collection.delete_many({"run_id": run_id, "store_id": store_id})
+        if records:
+            await records_collection.insert_many(records)
+
+    async def window_records(self, window: str, run_id: str, store_id, window_start: int, window_end: int):
+        query = {"run_id": run_id, "store_id": store_id, "timestamp_epoch": {"$gte": window_start, "$lte": window_end}}
+        return await self.find_window(WINDOW_COLLECTIONS[window][0], query)
+
+    async def save_window_result(self, window: str, run_id: str, store_id, result: dict):
+        # One result per store and run, overwritten if the run computes the store again
+        await self.database[WINDOW_COLLECTIONS[window][1]].replace_one(
+            {"run_id": run_id, "store_id": store_id}, result, upsert=True
+        )
+
+    async def discard_run(self, run_id: str):
+        # A finished run's intermediates are never read again; the TTL index covers runs that crash first
+        for collection in INTERMEDIATE_COLLECTIONS:
+            await self.database[collection].delete_many({"run_id": run_id})
+
+    async def create_report(self, document: dict):
+        await self.database.reports.insert_one(dict(document))
+
+    async def update_report(self, report_id: str, fields: dict):
+        await self.database.reports.update_one({"report_id": report_id}, {"$set": fields})
+
+    async def find_report(self, report_id: str):
+        return await self.database.reports.find_one({"report_id": report_id}, {"_id": 0})
+
+    async def find_complete_report(self, fingerprint: str):
+        reports = await self.database.reports.find(
+            {"fingerprint": fingerprint, "status": "Complete"}, {"_id": 0},
+            sort=[("created_at", -1)], limit=1
+        )
+        return reports[0] if reports else None
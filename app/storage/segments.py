@@ -0,0 +1,264 @@
+import json
+import math
+import mmap
+import os
+import threading
+import numpy as np
+import pandas as pd
+from app.config import settings
+
+
+# A segment file is a fixed header, fixed-width poll records sorted by store then time, and a footer
+# with the segment's store ids and each store's record offsets:
+#   header  magic, record count, store count, footer offset
+#   records (store position int32, timestamp_epoch int64, status uint8, 1 = active), 13 bytes each, unpadded
+#   footer  store_id int64 x stores, offsets int64 x (stores + 1), 8-byte aligned
+SEGMENT_MAGIC = b"SDPOLLS1"
+SEGMENT_HEADER = np.dtype([('magic', 'S8'), ('records', '<u8'), ('stores', '<u8'), ('footer', '<u8')])
+SEGMENT_RECORD = np.dtype([('store', '<i4'), ('epoch', '<i8'), ('status', 'u1')])
+SEGMENT_SUFFIX = ".seg"
+
+# Next to the segments: the ingest watermark they were last brought up to date with
+MANIFEST_NAME = "manifest.json"
+
+
+def sorted_polls(store_ids, epochs, active):
+    # Sort by store then time and keep the first of any repeated (store_id, timestamp_epoch), like the poll upserts
+    store_ids, epochs, active = np.asarray(store_ids, dtype=np.int64), np.asarray(epochs, dtype=np.int64), np.asarray(active, dtype=bool)
+    order = np.lexsort((epochs, store_ids))
+    store_ids, epochs, active = store_ids[order], epochs[order], active[order]
+    keep = np.ones(len(epochs), dtype=bool)
+    keep[1:] = (store_ids[1:] != store_ids[:-1]) | (epochs[1:] != epochs[:-1])
+    return store_ids[keep], epochs[keep], active[keep]
+
+
+def write_segment(path: str, parts):
+    # parts: (store_ids, epochs, active) arrays from sorted_polls, each starting at a store after the previous
+    # part's last one. Written under a temporary name and renamed, so readers never map a partial segment.
+    temporary = f"{path}.tmp"
+    store_ids, counts, records = [], [], 0
+    with open(temporary, "wb") as segment_file:
+        segment_file.write(bytes(SEGMENT_HEADER.itemsize))
+        for part_store_ids, epochs, active in parts:
+            if not len(epochs):
+                continue
+            part_stores, part_counts = np.unique(part_store_ids, return_counts=True)
+            part = np.empty(len(epochs), dtype=SEGMENT_RECORD)
+            part['store'] = np.repeat(np.arange(len(store_ids), len(store_ids) + len(part_stores), dtype=np.int32), part_counts)
+            part['epoch'] = epochs
+            part['status'] = active
+            segment_file.write(part.tobytes())
+            store_ids.extend(part_stores.tolist())
+            counts.append(part_counts)
+            records += len(part)
+
+        footer = SEGMENT_HEADER.itemsize + records * SEGMENT_RECORD.itemsize
+        padding = -footer % 8
+        offsets = np.zeros(len(store_ids) + 1, dtype='<i8')
+        if counts:
+            np.cumsum(np.concatenate(counts), out=offsets[1:])
+        segment_file.write(bytes(padding))
+        segment_file.write(np.array(store_ids, dtype='<i8').tobytes())
+        segment_file.write(offsets.tobytes())
+
+        header = np.array([(SEGMENT_MAGIC, records, len(store_ids), footer + padding)], dtype=SEGMENT_HEADER)
+        segment_file.seek(0)
+        segment_file.write(header.tobytes())
+        segment_file.flush()
+        os.fsync(segment_file.fileno())
+    os.replace(temporary, path)
+    return records
+
+
+class Segment:
+    # A read-only memory map of one segment file; every array is a view of the mapped bytes, so opening
+    # a segment parses nothing and copies nothing. The map stays valid after compaction unlinks the file.
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as segment_file:
+            self.size = os.fstat(segment_file.fileno()).st_size
+            self.buffer = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = np.frombuffer(self.buffer, SEGMENT_HEADER, count=1)[0]
+        if header['magic'] != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a poll segment")
+        records, stores, footer = int(header['records']), int(header['stores']), int(header['footer'])
+
+        self.records = np.frombuffer(self.buffer, SEGMENT_RECORD, count=records, offset=SEGMENT_HEADER.itemsize)
+        self.store_ids = np.frombuffer(self.buffer, '<i8', count=stores, offset=footer)
+        self.offsets = np.frombuffer(self.buffer, '<i8', count=stores + 1, offset=footer + 8 * stores)
+        self.store_index = self.records['store']
+        self.epochs = self.records['epoch']
+        self.active = self.records['status'].view(bool)
+
+    def __len__(self):
+        return len(self.records)
+
+    def latest_epochs(self):
+        # Each store's records end with its newest poll
+        return self.epochs[self.offsets[1:] - 1]
+
+    def store_range(self, low, high):
+        # Records of the stores with low <= store_id < high, which are contiguous
+        first, last = np.searchsorted(self.store_ids, [low, high])
+        start, end = int(self.offsets[first]), int(self.offsets[last])
+        return self.store_ids[self.store_index[start:end]], self.epochs[start:end], self.active[start:end]
+
+    def polls(self, store_id):
+        # (epochs, active) views of one store's polls, oldest first
+        position = np.searchsorted(self.store_ids, store_id)
+        if position == len(self.store_ids) or self.store_ids[position] != store_id:
+            return self.epochs[:0], self.active[:0]
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.epochs[start:end], self.active[start:end]
+
+
+class SegmentStore:
+    # Poll history as immutable segment files in one directory. Every ingested batch becomes a segment;
+    # compaction merges segments of a similar size, so a directory holds a few segments per size tier
+    # and history that stopped changing settles into one large segment.
+
+    def __init__(self, directory: str, compaction_bytes: int = 8 * 1024 * 1024, compaction_fanin: int = 4):
+        self.directory = directory
+        self.compaction_bytes = compaction_bytes
+        self.compaction_fanin = compaction_fanin
+        self.lock = threading.RLock()
+        self.opened = {}
+
+    def names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+
+    def segments(self):
+        # Open segments, oldest first; each file is mapped once and reused until compaction replaces it
+        with self.lock:
+            names = self.names()
+            self.opened = {
+                name: self.opened[name] if name in self.opened else Segment(os.path.join(self.directory, name))
+                for name in names
+            }
+            return [self.opened[name] for name in names]
+
+    def load_manifest(self):
+        # {} before the first manifest is written
+        try:
+            with open(os.path.join(self.directory, MANIFEST_NAME)) as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return {}
+
+    def save_manifest(self, manifest: dict):
+        # Written under a temporary name and renamed, like the segments
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(f"{path}.tmp", "w") as manifest_file:
+                json.dump(manifest, manifest_file, default=str)
+            os.replace(f"{path}.tmp", path)
+
+    def next_path(self):
+        names = self.names()
+        sequence = int(names[-1][:-len(SEGMENT_SUFFIX)]) + 1 if names else 1
+        return os.path.join(self.directory, f"{sequence:012d}{SEGMENT_SUFFIX}")
+
+    def append(self, store_ids, epochs, active):
+        # One new segment holding a batch of polls
+        store_ids, epochs, active = sorted_polls(store_ids, epochs, active)
+        if not len(epochs):
+            return 0
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            return write_segment(self.next_path(), [(store_ids, epochs, active)])
+
+    def tier(self, segment: Segment):
+        # Segments below compaction_bytes are tier 0; each further tier is compaction_fanin times larger
+        if segment.size < self.compaction_bytes:
+            return 0
+        return 1 + int(math.log(segment.size / self.compaction_bytes, self.compaction_fanin))
+
+    def compact(self):
+        # Merge compaction_fanin or more segments of one tier until no tier is that crowded
+        merged = 0
+        with self.lock:
+            while True:
+                tiers = {}
+                for segment in self.segments():
+                    tiers.setdefault(self.tier(segment), []).append(segment)
+                crowded = [segments for segments in tiers.values() if len(segments) >= self.compaction_fanin]
+                if not crowded:
+                    return merged
+                self.merge(crowded[0])
+                merged += len(crowded[0])
+
+    def merge(self, segments):
+        # The merged segment is written before its inputs are removed; a crash in between leaves
+        # duplicate polls, which every read drops
+        with self.lock:
+            write_segment(self.next_path(), self.merged_parts(segments))
+            for segment in segments:
+                os.remove(segment.path)
+            self.segments()
+
+    def merged_parts(self, segments, since_epoch: int = None, store_ids=None, chunk_size: int = 100000):
+        # All polls of the given segments in store then time order, a range of store ids at a time,
+        # so merging never holds more than about chunk_size polls
+        catalog = np.unique(np.concatenate([segment.store_ids for segment in segments])) if segments else np.zeros(0, dtype=np.int64)
+        if store_ids is not None:
+            catalog = catalog[np.isin(catalog, np.asarray(list(store_ids), dtype=np.int64))]
+        if not len(catalog):
+            return
+
+        total = sum(len(segment) for segment in segments)
+        stores_per_part = max(1, len(catalog) * chunk_size // max(total, 1))
+        for first in range(0, len(catalog), stores_per_part):
+            low = catalog[first]
+            high = catalog[first + stores_per_part] if first + stores_per_part < len(catalog) else catalog[-1] + 1
+            ranges = [segment.store_range(low, high) for segment in segments]
+            part_store_ids, epochs, active = sorted_polls(*(np.concatenate(column) for column in zip(*ranges)))
+
+            keep = np.ones(len(epochs), dtype=bool)
+            if since_epoch is not None:
+                keep &= epochs >= since_epoch
+            if store_ids is not None:
+                keep &= np.isin(part_store_ids, catalog)
+            yield part_store_ids[keep], epochs[keep], active[keep]
+
+    # The Storage poll reads the columnar report engine loads from
+
+    def latest_poll_epochs(self, store_ids=None):
+        segments = self.segments()
+        if not segments:
+            return {}
+        latest = pd.Series(
+            np.concatenate([segment.latest_epochs() for segment in segments]),
+            index=np.concatenate([segment.store_ids for segment in segments])
+        ).groupby(level=0).max()
+        if store_ids is not None:
+            latest = latest[latest.index.isin(list(store_ids))]
+        return {store_id: int(epoch) for store_id, epoch in latest.items()}
+
+    def iter_poll_columns(self, since_epoch: int, store_ids=None, chunk_size: int = 100000):
+        return self.merged_parts(self.segments(), since_epoch, store_ids, chunk_size)
+
+
+_segment_store = None
+_segment_store_lock = threading.Lock()
+
+
+def get_segment_store() -> SegmentStore:
+    # The segment directory named by settings.segment_dir, created on first use
+    global _segment_store
+    with _segment_store_lock:
+        if _segment_store is None:
+            _segment_store = SegmentStore(settings.segment_dir, settings.segment_compaction_bytes, settings.segment_compaction_fanin)
+        return _segment_store
+
+
+def reset_segment_store():
+    # After the directory was replaced the next use opens a new store: segment names are reused, and the
+    # mappings the old store cached by name are of the replaced files
+    global _segment_store
+    with _segment_store_lock:
+        _segment_store = None
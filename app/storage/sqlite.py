@@ -0,0 +1,384 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+from app.config import settings
+from app.storage.base import Storage, poll_column_chunks
+from app.utils.metrics import record_db_call
+
+
+POLL_COLUMNS = ["store_id", "timestamp_utc", "timestamp_epoch", "timestamp_local", "day_of_week", "minute_of_week", "status"]
+ROLLUP_COLUMNS = [
+    "store_id", "hour", "up_minutes", "down_minutes", "polls",
+    "first_epoch", "first_minute_of_week", "first_active",
+    "last_epoch", "last_minute_of_week", "last_active", "last_up_minutes", "last_down_minutes"
+]
+RECORD_COLUMNS = ["run_id", "created_at", "store_id", "timestamp_epoch", "minute_of_week", "day_of_week", "timestamp_local", "status"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS all_polling_data (
+    store_id INTEGER NOT NULL,
+    timestamp_utc TEXT NOT NULL,
+    timestamp_epoch INTEGER NOT NULL,
+    timestamp_local TEXT,
+    day_of_week INTEGER,
+    minute_of_week REAL,
+    status TEXT,
+    PRIMARY KEY (store_id, timestamp_utc)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS all_polling_data_store_id_timestamp_epoch ON all_polling_data (store_id, timestamp_epoch);
+
+CREATE TABLE IF NOT EXISTS latest_polling_data (
+    store_id INTEGER PRIMARY KEY,
+    timestamp_utc TEXT NOT NULL,
+    timestamp_epoch INTEGER NOT NULL,
+    timestamp_local TEXT,
+    day_of_week INTEGER,
+    minute_of_week REAL,
+    status TEXT
+);
+
+CREATE TABLE IF NOT EXISTS poll_rollups (
+    store_id INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    up_minutes REAL NOT NULL,
+    down_minutes REAL NOT NULL,
+    polls INTEGER NOT NULL,
+    first_epoch INTEGER NOT NULL,
+    first_minute_of_week REAL NOT NULL,
+    first_active INTEGER NOT NULL,
+    last_epoch INTEGER NOT NULL,
+    last_minute_of_week REAL NOT NULL,
+    last_active INTEGER NOT NULL,
+    last_up_minutes REAL NOT NULL,
+    last_down_minutes REAL NOT NULL,
+    PRIMARY KEY (store_id, hour)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS documents (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    document TEXT NOT NULL,
+    PRIMARY KEY (kind, id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS window_records (
+    window_name TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    store_id INTEGER NOT NULL,
+    timestamp_epoch INTEGER NOT NULL,
+    minute_of_week REAL,
+    day_of_week INTEGER,
+    timestamp_local TEXT,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS window_records_run_store_epoch ON window_records (window_name, run_id, store_id, timestamp_epoch);
+CREATE INDEX IF NOT EXISTS window_records_created_at ON window_records (created_at);
+
+CREATE TABLE IF NOT EXISTS window_results (
+    window_name TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    store_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    document TEXT NOT NULL,
+    PRIMARY KEY (window_name, run_id, store_id)
+);
+CREATE INDEX IF NOT EXISTS window_results_created_at ON window_results (created_at);
+
+CREATE TABLE IF NOT EXISTS reports (
+    report_id TEXT PRIMARY KEY,
+    status TEXT,
+    fingerprint TEXT,
+    created_at TEXT,
+    document TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_fingerprint_created_at ON reports (fingerprint, created_at);
+"""
+
+
+def encode_value(value):
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def as_text(value):
+    # Documents read back from JSON already hold their datetimes as text
+    return value if isinstance(value, str) else encode_value(value)
+
+
+def dumps(document):
+    return json.dumps(document, default=encode_value)
+
+
+def poll_rows(processed_data):
+    # Plain Python values column by column; timestamps become sortable UTC text with milliseconds
+    columns = {column: processed_data[column] for column in POLL_COLUMNS}
+    columns["timestamp_utc"] = pd.to_datetime(columns["timestamp_utc"], utc=True).dt.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3] + "Z"
+    return list(zip(*(columns[column].tolist() for column in POLL_COLUMNS)))
+
+
+def rollup_document(row):
+    # Statuses are stored as 0 and 1
+    return {**row, "first_active": bool(row["first_active"]), "last_active": bool(row["last_active"])}
+
+
+class SQLiteStorage(Storage):
+    # Embedded storage in one local file: no server and no network round trips. Every thread has
+    # its own connection; WAL lets readers run alongside the single writer, and report worker
+    # processes open the same file.
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        self.schema_lock = threading.Lock()
+        self.schema_ready = False
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self.schema_lock:
+                if not self.schema_ready:
+                    connection.executescript(SCHEMA)
+                    self.schema_ready = True
+            self.local.connection = connection
+        return connection
+
+    def execute(self, statement: str, parameters=()):
+        record_db_call(statement.split(None, 1)[0].lower())
+        return self.connection.execute(statement, parameters)
+
+    def execute_many(self, statement: str, rows):
+        # One transaction per batch, like an unordered bulk write
+        record_db_call(statement.split(None, 1)[0].lower())
+        connection = self.connection
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(statement, rows)
+
+    def query(self, statement: str, parameters=()):
+        return [dict(row) for row in self.execute(statement, parameters).fetchall()]
+
+    async def run(self, function, *args):
+        return await asyncio.to_thread(function, *args)
+
+    async def ping(self):
+        # Also creates the schema on a new file
+        await self.run(self.query, "SELECT 1")
+
+    def upsert_polls(self, processed_data):
+        placeholders = ", ".join("?" * len(POLL_COLUMNS))
+        rows = poll_rows(processed_data)
+        batch_size = settings.insert_batch_size
+        for start in range(0, len(rows), batch_size):
+            self.execute_many(
+                f"INSERT OR IGNORE INTO all_polling_data ({', '.join(POLL_COLUMNS)}) VALUES ({placeholders})",
+                rows[start:start + batch_size]
+            )
+
+    def upsert_latest(self, processed_data):
+        placeholders = ", ".join("?" * len(POLL_COLUMNS))
+        rows = poll_rows(processed_data)
+        batch_size = settings.insert_batch_size
+        for start in range(0, len(rows), batch_size):
+            self.execute_many(
+                f"INSERT OR REPLACE INTO latest_polling_data ({', '.join(POLL_COLUMNS)}) VALUES ({placeholders})",
+                rows[start:start + batch_size]
+            )
+
+    def load_document(self, kind: str, document_id: str):
+        rows = self.query("SELECT document FROM documents WHERE kind = ? AND id = ?", (kind, document_id))
+        return json.loads(rows[0]["document"]) if rows else None
+
+    def save_document(self, kind: str, document_id: str, document: dict):
+        self.execute("INSERT OR REPLACE INTO documents (kind, id, document) VALUES (?, ?, ?)", (kind, document_id, dumps(document)))
+
+    def load_watermark(self, watermark_id: str):
+        return self.load_document("ingest_watermark", watermark_id) or {}
+
+    def save_watermark(self, watermark_id: str, document: dict):
+        self.save_document("ingest_watermark", watermark_id, document)
+
+    async def latest_poll_epoch(self, store_id):
+        rows = await self.run(
+            self.query, "SELECT MAX(timestamp_epoch) AS timestamp_epoch FROM all_polling_data WHERE store_id = ?", (store_id,)
+        )
+        return int(rows[0]["timestamp_epoch"]) if rows and rows[0]["timestamp_epoch"] is not None else None
+
+    def store_filter(self, store_ids):
+        # SQL fragment and parameters restricting a query to the given stores
+        if store_ids is None:
+            return "", ()
+        store_ids = list(store_ids)
+        return f" AND store_id IN ({', '.join('?' * len(store_ids))})", tuple(store_ids)
+
+    def latest_poll_epochs(self, store_ids=None):
+        condition, parameters = self.store_filter(store_ids)
+        rows = self.query(
+            f"SELECT store_id, MAX(timestamp_epoch) AS timestamp_epoch FROM all_polling_data WHERE 1 = 1{condition} GROUP BY store_id",
+            parameters
+        )
+        return {row["store_id"]: int(row["timestamp_epoch"]) for row in rows}
+
+    def iter_poll_columns(self, since_epoch: int, store_ids=None, chunk_size: int = 100000):
+        condition, parameters = self.store_filter(store_ids)
+        cursor = self.execute(
+            "SELECT store_id, timestamp_epoch, status FROM all_polling_data"
+            f" WHERE timestamp_epoch >= ?{condition} ORDER BY store_id, timestamp_epoch",
+            (since_epoch, *parameters)
+        )
+        return poll_column_chunks(cursor, chunk_size)
+
+    async def window_polls(self, store_id, window_start: int, window_end: int, fields=None):
+        columns = ", ".join(fields or POLL_COLUMNS)
+        return await self.run(
+            self.query,
+            f"SELECT {columns} FROM all_polling_data WHERE store_id = ? AND timestamp_epoch BETWEEN ? AND ? ORDER BY timestamp_epoch",
+            (store_id, window_start, window_end)
+        )
+
+    def upsert_rollups(self, rollups):
+        placeholders = ", ".join("?" * len(ROLLUP_COLUMNS))
+        batch_size = settings.insert_batch_size
+        for start in range(0, len(rollups), batch_size):
+            self.execute_many(
+                f"INSERT OR REPLACE INTO poll_rollups ({', '.join(ROLLUP_COLUMNS)}) VALUES ({placeholders})",
+                [tuple(rollup[column] for column in ROLLUP_COLUMNS) for rollup in rollups[start:start + batch_size]]
+            )
+
+    def replace_rollups(self, batches):
+        # Staged in a table of their own, then swapped in by one transaction that WAL readers never see half of
+        self.execute("DROP TABLE IF EXISTS poll_rollups_staging")
+        self.execute("CREATE TABLE poll_rollups_staging AS SELECT * FROM poll_rollups WHERE 0")
+        placeholders = ", ".join("?" * len(ROLLUP_COLUMNS))
+        for rollups in batches:
+            if rollups:
+                self.execute_many(
+                    f"INSERT INTO poll_rollups_staging ({', '.join(ROLLUP_COLUMNS)}) VALUES ({placeholders})",
+                    [tuple(rollup[column] for column in ROLLUP_COLUMNS) for rollup in rollups]
+                )
+
+        connection = self.connection
+        record_db_call("delete")
+        record_db_call("insert")
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM poll_rollups")
+            connection.execute(f"INSERT INTO poll_rollups ({', '.join(ROLLUP_COLUMNS)}) SELECT {', '.join(ROLLUP_COLUMNS)} FROM poll_rollups_staging")
+        self.execute("DROP TABLE poll_rollups_staging")
+
+    def delete_rollups(self, store_id=None, from_hour: int = 0):
+        if store_id is None:
+            self.execute("DELETE FROM poll_rollups WHERE hour >= ?", (from_hour,))
+        else:
+            self.execute("DELETE FROM poll_rollups WHERE store_id = ? AND hour >= ?", (store_id, from_hour))
+
+    def last_rollups(self, store_ids, before_hour: int = None):
+        condition, parameters = self.store_filter(store_ids)
+        if before_hour is not None:
+            condition, parameters = f"{condition} AND hour < ?", (*parameters, before_hour)
+        rows = self.query(
+            f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM poll_rollups"
+            f" JOIN (SELECT store_id, MAX(hour) AS hour FROM poll_rollups WHERE 1 = 1{condition} GROUP BY store_id) USING (store_id, hour)",
+            parameters
+        )
+        return {row["store_id"]: rollup_document(row) for row in rows}
+
+    async def rollups(self, store_id, first_hour: int, last_hour: int):
+        rows = await self.run(
+            self.query,
+            f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM poll_rollups WHERE store_id = ? AND hour BETWEEN ? AND ? ORDER BY hour",
+            (store_id, first_hour, last_hour)
+        )
+        return [rollup_document(row) for row in rows]
+
+    def replace_window_records_sync(self, window: str, run_id: str, store_id, records):
+        # created_at is kept as epoch seconds, which the expiry in discard_run compares against
+        created_at = time.time()
+        connection = self.connection
+        record_db_call("delete")
+        record_db_call("insert")
+        with connection:
+            connection.execute("BEGIN")
+            connection.execute("DELETE FROM window_records WHERE window_name = ? AND run_id = ? AND store_id = ?", (window, run_id, store_id))
+            connection.executemany(
+                f"INSERT INTO window_records (window_name, {', '.join(RECORD_COLUMNS)}) VALUES (?, {', '.join('?' * len(RECORD_COLUMNS))})",
+                [
+                    (window, *(created_at if column == "created_at" else record[column] for column in RECORD_COLUMNS))
+                    for record in records
+                ]
+            )
+
+    async def replace_window_records(self, window: str, run_id: str, store_id, records):
+        await self.run(self.replace_window_records_sync, window, run_id, store_id, records)
+
+    async def window_records(self, window: str, run_id: str, store_id, window_start: int, window_end: int):
+        return await self.run(
+            self.query,
+            f"SELECT {', '.join(RECORD_COLUMNS)} FROM window_records"
+            " WHERE window_name = ? AND run_id = ? AND store_id = ? AND timestamp_epoch BETWEEN ? AND ? ORDER BY timestamp_epoch",
+            (window, run_id, store_id, window_start, window_end)
+        )
+
+    async def save_window_result(self, window: str, run_id: str, store_id, result: dict):
+        await self.run(
+            self.execute,
+            "INSERT OR REPLACE INTO window_results (window_name, run_id, store_id, created_at, document) VALUES (?, ?, ?, ?, ?)",
+            (window, run_id, store_id, time.time(), dumps(result))
+        )
+
+    def discard_run_sync(self, run_id: str):
+        # There is no TTL index here, so intermediates of runs that crashed are expired with every discard
+        expired = time.time() - settings.intermediate_ttl_seconds
+        for table in ("window_records", "window_results"):
+            self.execute(f"DELETE FROM {table} WHERE run_id = ? OR created_at < ?", (run_id, expired))
+
+    async def discard_run(self, run_id: str):
+        await self.run(self.discard_run_sync, run_id)
+
+    def save_report(self, report_id: str, document: dict):
+        self.execute(
+            "INSERT OR REPLACE INTO reports (report_id, status, fingerprint, created_at, document) VALUES (?, ?, ?, ?, ?)",
+            (report_id, document.get("status"), document.get("fingerprint"), as_text(document["created_at"]), dumps(document))
+        )
+
+    def find_report_sync(self, report_id: str):
+        rows = self.query("SELECT document FROM reports WHERE report_id = ?", (report_id,))
+        return json.loads(rows[0]["document"]) if rows else None
+
+    def update_report_sync(self, report_id: str, fields: dict):
+        # Read and write in one write transaction so concurrent updates do not drop each other's fields
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            document = self.find_report_sync(report_id)
+            if document is not None:
+                self.save_report(report_id, {**document, **fields})
+
+    async def create_report(self, document: dict):
+        await self.run(self.save_report, document["report_id"], document)
+
+    async def update_report(self, report_id: str, fields: dict):
+        await self.run(self.update_report_sync, report_id, fields)
+
+    async def find_report(self, report_id: str):
+        return await self.run(self.find_report_sync, report_id)
+
+    async def find_complete_report(self, fingerprint: str):
+        rows = await self.run(
+            self.query,
+            "SELECT document FROM reports WHERE fingerprint = ? AND status = 'Complete' ORDER BY created_at DESC LIMIT 1",
+            (fingerprint,)
+        )
+        return json.loads(rows[0]["document"]) if rows else None
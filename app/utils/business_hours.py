@@ -0,0 +1,128 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+
+BUSINESS_HOURS_CSV = "data/business_hours.csv"
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def time_to_minutes(time_str: str):
+    hours, minutes, seconds = time_str.split(':')
+    return int(hours) * 60 + int(minutes) + int(seconds) / 60
+
+
+def minute_of_week(day_of_week, time_str: str):
+    return int(day_of_week) * MINUTES_PER_DAY + time_to_minutes(time_str)
+
+
+class StoreHours:
+    # Sorted, non-overlapping open intervals [start, end] in minutes of the week (0 = Monday 00:00 local)
+
+    def __init__(self, intervals):
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        self.starts = np.array([start for start, _ in merged], dtype=np.float64)
+        self.ends = np.array([end for _, end in merged], dtype=np.float64)
+
+        # Open minutes before each interval starts, for overlap lengths
+        lengths = self.ends - self.starts
+        self.open_before = np.concatenate(([0.0], np.cumsum(lengths)[:-1])) if len(lengths) else np.zeros(0)
+        self.open_per_week = float(lengths.sum())
+
+    def contains(self, minutes):
+        # Vectorized membership test, inclusive at both ends like the original filters
+        minutes = np.asarray(minutes, dtype=np.float64)
+        if not len(self.starts):
+            return np.zeros(minutes.shape, dtype=bool)
+        position = np.searchsorted(self.starts, minutes, side='right') - 1
+        clipped = np.clip(position, 0, None)
+        return (position >= 0) & (minutes <= self.ends[clipped])
+
+    def open_minutes_before(self, minutes):
+        # Open minutes in [0, minutes) for minutes within [0, MINUTES_PER_WEEK]
+        minutes = np.asarray(minutes, dtype=np.float64)
+        if not len(self.starts):
+            return np.zeros(minutes.shape)
+        position = np.searchsorted(self.starts, minutes, side='right') - 1
+        clipped = np.clip(position, 0, None)
+        inside = np.clip(minutes - self.starts[clipped], 0, self.ends[clipped] - self.starts[clipped])
+        return np.where(position >= 0, self.open_before[clipped] + inside, 0.0)
+
+    def overlap(self, start_minutes, length_minutes):
+        # Open minutes within [start, start + length) for whole arrays of spans; spans may wrap past
+        # Sunday midnight and may be longer than a week
+        start_minutes = np.mod(np.asarray(start_minutes, dtype=np.float64), MINUTES_PER_WEEK)
+        length_minutes = np.asarray(length_minutes, dtype=np.float64)
+
+        full_weeks, remainder = np.divmod(length_minutes, MINUTES_PER_WEEK)
+        end_minutes = start_minutes + remainder
+        wraps = end_minutes > MINUTES_PER_WEEK
+
+        open_until_end = np.where(
+            wraps,
+            self.open_per_week + self.open_minutes_before(np.where(wraps, end_minutes - MINUTES_PER_WEEK, 0)),
+            self.open_minutes_before(np.minimum(end_minutes, MINUTES_PER_WEEK))
+        )
+        return full_weeks * self.open_per_week + open_until_end - self.open_minutes_before(start_minutes)
+
+
+# Stores without any business hours are open 24x7
+ALWAYS_OPEN = StoreHours([(0.0, float(MINUTES_PER_WEEK))])
+
+
+class BusinessHoursIndex:
+
+    def __init__(self, business_hours):
+        intervals = {}
+        for store_id, day_of_week, start_time, end_time in business_hours[
+            ['store_id', 'day_of_week', 'start_time_local', 'end_time_local']
+        ].itertuples(index=False):
+            start = minute_of_week(day_of_week, start_time)
+            end = minute_of_week(day_of_week, end_time)
+
+            # Hours that end at or before they start run past midnight into the next day
+            if end <= start:
+                end += MINUTES_PER_DAY
+
+            store_intervals = intervals.setdefault(store_id, [])
+            if end > MINUTES_PER_WEEK:
+                # Sunday night into Monday morning wraps to the start of the week
+                store_intervals.append((start, float(MINUTES_PER_WEEK)))
+                store_intervals.append((0.0, end - MINUTES_PER_WEEK))
+            else:
+                store_intervals.append((start, end))
+
+        self.stores = {store_id: StoreHours(store_intervals) for store_id, store_intervals in intervals.items()}
+
+    def hours_for(self, store_id):
+        return self.stores.get(store_id, ALWAYS_OPEN)
+
+    def contains(self, store_id, minutes):
+        return self.hours_for(store_id).contains(minutes)
+
+    def overlap(self, store_id, start_minutes, length_minutes):
+        return self.hours_for(store_id).overlap(start_minutes, length_minutes)
+
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+def get_business_hours_index(path: str = BUSINESS_HOURS_CSV):
+    # Parsed once and reused until the file's mtime changes
+    mtime = os.stat(path).st_mtime_ns
+    with _index_lock:
+        cached = _index_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, BusinessHoursIndex(pd.read_csv(path)))
+            _index_cache[path] = cached
+        return cached[1]
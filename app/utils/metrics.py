@@ -0,0 +1,207 @@
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pymongo import monitoring
+
+
+# Latency buckets in seconds, from a single DB round trip up to a full report
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        # Bucket counts are cumulative, as the exposition format expects
+        with self.lock:
+            counts, total, count = self.series.get(label_values, ([0] * len(self.buckets), 0.0, 0))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+            self.series[label_values] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_values, (counts, total, count) in sorted(self.series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = format_labels(self.labels + ("le",), label_values + (repr(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), label_values + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("storedash_http_request_duration_seconds", "Time to respond to an HTTP request", ["method", "route", "status"])
+STAGE_SECONDS = Histogram("storedash_stage_duration_seconds", "Time spent in a service stage", ["stage"])
+STAGE_ROWS = Counter("storedash_stage_rows_total", "Rows processed by a service stage", ["stage"])
+STAGE_BYTES = Counter("storedash_stage_bytes_written_total", "Bytes written by a service stage", ["stage"])
+DB_COMMANDS = Counter("storedash_db_commands_total", "Database commands sent, by command name", ["command"])
+STARTUP_SECONDS = Gauge("storedash_startup_seconds", "Seconds taken by each startup phase; ready is the total from import to warm caches", ["phase"])
+UPTIME_CACHE_LOOKUPS = Counter("storedash_uptime_cache_lookups_total", "Per-store uptime queries answered from the cache (hit) or computed (miss)", ["result"])
+UPTIME_CACHE_ENTRIES = Gauge("storedash_uptime_cache_entries", "Results held by the per-store uptime cache")
+
+METRICS = [REQUEST_SECONDS, STAGE_SECONDS, STAGE_ROWS, STAGE_BYTES, DB_COMMANDS, STARTUP_SECONDS, UPTIME_CACHE_LOOKUPS, UPTIME_CACHE_ENTRIES]
+
+
+def render_metrics():
+    # Prometheus text exposition format 0.0.4
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Per-report breakdown being collected, and the stages currently running in this context
+_report_stages = ContextVar("report_stages", default=None)
+_active_stages = ContextVar("active_stages", default=())
+_breakdown_lock = threading.Lock()
+
+
+def _update_active(field, amount, innermost_only=False):
+    stages = _report_stages.get()
+    active = _active_stages.get()
+    if stages is None or not active:
+        return
+    with _breakdown_lock:
+        # Stages entered before collection started (the caller of collect_stages) are not in the breakdown
+        for name in active[-1:] if innermost_only else active:
+            if name in stages:
+                stages[name][field] += amount
+
+
+@contextmanager
+def collect_stages():
+    # Stages run inside this block, including on executor threads, are summed into the yielded dict
+    stages = {}
+    token = _report_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _report_stages.reset(token)
+
+
+def rounded(stages):
+    return {name: {**entry, "seconds": round(entry["seconds"], 4)} for name, entry in stages.items()}
+
+
+@contextmanager
+def stage(name):
+    stages = _report_stages.get()
+    if stages is not None:
+        with _breakdown_lock:
+            stages.setdefault(name, {"seconds": 0.0, "calls": 0, "db_calls": 0, "rows": 0, "bytes": 0})
+    token = _active_stages.set(_active_stages.get() + (name,))
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started_at
+        _active_stages.reset(token)
+        STAGE_SECONDS.observe(elapsed, name)
+        if stages is not None:
+            with _breakdown_lock:
+                stages[name]["seconds"] += elapsed
+                stages[name]["calls"] += 1
+
+
+def timed(function):
+    # Times every call of a service function as a stage named after it
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with stage(function.__name__):
+                return await function(*args, **kwargs)
+    else:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(function.__name__):
+                return function(*args, **kwargs)
+    return wrapper
+
+
+def record_rows(rows):
+    # Rows are credited to the innermost stage so nested stages do not count them twice
+    active = _active_stages.get()
+    if active:
+        STAGE_ROWS.inc(rows, active[-1])
+    _update_active("rows", rows, innermost_only=True)
+
+
+def record_bytes(written):
+    active = _active_stages.get()
+    if active:
+        STAGE_BYTES.inc(written, active[-1])
+    _update_active("bytes", written, innermost_only=True)
+
+
+def record_db_call(command):
+    DB_COMMANDS.inc(1, command)
+    _update_active("db_calls", 1)
+
+
+class CommandCounter(monitoring.CommandListener):
+    # pymongo calls this on the thread that sends the command, where the caller's context is current
+
+    def started(self, event):
+        record_db_call(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
@@ -1,8 +1,121 @@
 from datetime import datetime
+import threading
+import numpy as np
+import pytz
 from pytz import timezone
 
+
+# Stores without a known timezone are assumed to be in America/Chicago
+DEFAULT_TIMEZONE = "America/Chicago"
+
+SECONDS_PER_DAY = 24 * 60 * 60
+SECONDS_PER_WEEK = 7 * SECONDS_PER_DAY
+
+# 1970-01-01 was a Thursday (weekday 3, with 0 = Monday)
+EPOCH_WEEKDAY = 3
+
+EPOCH = datetime(1970, 1, 1)
+
+_zones = {}
+_tables = {}
+_lock = threading.Lock()
+
+
+def get_timezone(timezone_str):
+    # pytz zones are cached; unknown or missing zones fall back to America/Chicago
+    zone = _zones.get(timezone_str)
+    if zone is None:
+        try:
+            zone = timezone(timezone_str)
+        except (pytz.UnknownTimeZoneError, AttributeError, TypeError, ValueError):
+            zone = timezone(DEFAULT_TIMEZONE)
+        _zones[timezone_str] = zone
+    return zone
+
+
 def convert_to_local_time(utc_time_str, timezone_str):
-    utc_time = datetime.strptime(utc_time_str, "%d-%m-%Y %H:%M")
-    local_tz = timezone(timezone_str)
-    local_time = utc_time.astimezone(local_tz)
+    utc_time = pytz.utc.localize(datetime.strptime(utc_time_str, "%d-%m-%Y %H:%M"))
+    local_time = utc_time.astimezone(get_timezone(timezone_str))
     return local_time
+
+
+class TransitionTable:
+    # UTC instants (epoch seconds) at which a zone's UTC offset changes, with the offset in effect from each
+
+    def __init__(self, zone, start, end):
+        self.start = start
+        self.end = end
+
+        transition_times = getattr(zone, '_utc_transition_times', None)
+        if not transition_times:
+            # Fixed-offset zones such as UTC have a single entry
+            offset = zone.utcoffset(EPOCH)
+            self.transitions = np.array([np.iinfo(np.int64).min], dtype=np.int64)
+            self.offsets = np.array([int(offset.total_seconds()) if offset else 0], dtype=np.int64)
+            return
+
+        transitions = np.array([int((moment - EPOCH).total_seconds()) for moment in transition_times], dtype=np.int64)
+        offsets = np.array([int(info[0].total_seconds()) for info in zone._transition_info], dtype=np.int64)
+
+        # Keep the transition in effect at start and every transition up to end
+        first = max(0, np.searchsorted(transitions, start, side='right') - 1)
+        last = np.searchsorted(transitions, end, side='right')
+        self.transitions = transitions[first:last].copy()
+        self.transitions[0] = np.iinfo(np.int64).min
+        self.offsets = offsets[first:last]
+
+    def covers(self, start, end):
+        return self.start <= start and end <= self.end
+
+    def local_seconds(self, epochs):
+        # One searchsorted finds the offset in effect for every instant, then one add
+        epochs = np.asarray(epochs, dtype=np.int64)
+        return epochs + self.offsets[np.searchsorted(self.transitions, epochs, side='right') - 1]
+
+
+def transition_table(timezone_str, start, end):
+    # Tables are cached per zone and rebuilt wider when a later call needs a larger time range
+    with _lock:
+        table = _tables.get(timezone_str)
+        if table is None or not table.covers(start, end):
+            if table is not None:
+                start, end = min(start, table.start), max(end, table.end)
+            table = TransitionTable(get_timezone(timezone_str), start, end)
+            _tables[timezone_str] = table
+        return table
+
+
+def local_seconds(epochs, timezone_str):
+    # Local wall-clock time as seconds since 1970-01-01 00:00 local, for an int64 array of UTC epoch seconds
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if not len(epochs):
+        return epochs
+    return transition_table(timezone_str, int(epochs.min()), int(epochs.max())).local_seconds(epochs)
+
+
+def local_weekday(local):
+    # Day of the week (0=Monday, 6=Sunday)
+    return (np.floor_divide(local, SECONDS_PER_DAY) + EPOCH_WEEKDAY) % 7
+
+
+def local_minute_of_week(epochs, timezone_str):
+    local = local_seconds(epochs, timezone_str)
+    return local_weekday(local) * 1440 + np.mod(local, SECONDS_PER_DAY) / 60
+
+
+_time_strings = None
+
+
+def time_of_day_strings(local):
+    # "%H:%M:%S" strings looked up from a table of every second of the day instead of strftime per value
+    global _time_strings
+    if _time_strings is None:
+        _time_strings = np.array([
+            f"{second // 3600:02d}:{second % 3600 // 60:02d}:{second % 60:02d}" for second in range(SECONDS_PER_DAY)
+        ], dtype=object)
+    return _time_strings[np.mod(local, SECONDS_PER_DAY)]
+
+
+def epoch_seconds(timestamps):
+    # int64 UTC epoch seconds for a Series of timezone-aware timestamps
+    return timestamps.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[s]').astype(np.int64)
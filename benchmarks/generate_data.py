@@ -0,0 +1,118 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+
+# Zones with and without daylight saving time; the default period crosses the US spring change
+TIMEZONES = [
+    "America/New_York", "America/Chicago", "America/Denver", "America/Los_Angeles",
+    "America/Phoenix", "Europe/London", "Australia/Sydney", "Asia/Kolkata"
+]
+
+DEFAULT_END = "2024-03-14T00:00:00Z"
+
+
+def generate_timezones(rng, store_ids, missing_rate):
+    # Some stores have no row and fall back to America/Chicago
+    known = store_ids[rng.random(len(store_ids)) >= missing_rate]
+    return pd.DataFrame({"store_id": known, "timezone_str": rng.choice(TIMEZONES, size=len(known))})
+
+
+def format_times(seconds):
+    seconds = np.asarray(seconds) % 86400
+    return [f"{second // 3600:02d}:{second % 3600 // 60:02d}:{second % 60:02d}" for second in seconds]
+
+
+def generate_business_hours(rng, store_ids, always_open_rate, overnight_rate, closed_day_rate):
+    # Stores without rows are open 24x7; overnight stores close after midnight (end before start)
+    rows = []
+    for store_id in store_ids[rng.random(len(store_ids)) >= always_open_rate]:
+        overnight = rng.random() < overnight_rate
+        open_at = int(rng.integers(15, 20) if overnight else rng.integers(6, 11)) * 3600
+        close_at = int(rng.integers(1, 4) if overnight else rng.integers(17, 23)) * 3600
+        for day in range(7):
+            if rng.random() < closed_day_rate:
+                continue
+            jitter = int(rng.choice([0, 1800]))
+            rows.append((store_id, day, open_at + jitter, close_at))
+    hours = pd.DataFrame(rows, columns=["store_id", "day_of_week", "start", "end"])
+    return pd.DataFrame({
+        "store_id": hours["store_id"],
+        "day_of_week": hours["day_of_week"],
+        "start_time_local": format_times(hours["start"].to_numpy()),
+        "end_time_local": format_times(hours["end"].to_numpy())
+    })
+
+
+def generate_store_status(rng, store_ids, weeks, end, jitter_minutes, missed_rate, outages_per_week, outage_hours):
+    # Roughly hourly polls with jitter and missed polls; outages are runs of inactive polls
+    end_epoch = int(pd.Timestamp(end).timestamp())
+    start_epoch = end_epoch - weeks * 7 * 86400
+    hours = np.arange(start_epoch, end_epoch, 3600, dtype=np.int64)
+
+    frames = []
+    for store_id in store_ids:
+        epochs = hours + rng.integers(-jitter_minutes * 60, jitter_minutes * 60 + 1, size=len(hours))
+        epochs = np.clip(epochs, start_epoch, end_epoch - 1)
+        kept = rng.random(len(epochs)) >= missed_rate
+        epochs = np.unique(epochs[kept])
+
+        inactive = rng.random(len(epochs)) < 0.01
+        for outage_start in rng.uniform(start_epoch, end_epoch, size=rng.poisson(outages_per_week * weeks)):
+            outage_end = outage_start + rng.exponential(outage_hours) * 3600
+            inactive |= (epochs >= outage_start) & (epochs < outage_end)
+
+        frames.append(pd.DataFrame({
+            "store_id": store_id,
+            "timestamp_utc": epochs,
+            "status": np.where(inactive, "inactive", "active")
+        }))
+
+    # Polls arrive interleaved across stores, in time order
+    status = pd.concat(frames, ignore_index=True).sort_values("timestamp_utc", kind="stable")
+    status["timestamp_utc"] = pd.to_datetime(status["timestamp_utc"], unit="s").dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return status
+
+
+def generate(out_dir, stores, weeks, seed=0, end=DEFAULT_END, jitter_minutes=10, missed_rate=0.05,
+             outages_per_week=1.0, outage_hours=2.0, always_open_rate=0.1, overnight_rate=0.15,
+             closed_day_rate=0.1, missing_timezone_rate=0.05):
+    rng = np.random.default_rng(seed)
+    store_ids = np.arange(1, stores + 1)
+    data_dir = os.path.join(out_dir, "data")
+    os.makedirs(data_dir, exist_ok=True)
+
+    generate_store_status(rng, store_ids, weeks, end, jitter_minutes, missed_rate, outages_per_week, outage_hours) \
+        .to_csv(os.path.join(data_dir, "store_status.csv"), index=False)
+    generate_business_hours(rng, store_ids, always_open_rate, overnight_rate, closed_day_rate) \
+        .to_csv(os.path.join(data_dir, "business_hours.csv"), index=False)
+    generate_timezones(rng, store_ids, missing_timezone_rate) \
+        .to_csv(os.path.join(data_dir, "store_timezones.csv"), index=False)
+    return data_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic store_status, business_hours and store_timezones CSVs")
+    parser.add_argument("--out", default="bench_data", help="directory that gets a data/ folder with the three CSVs")
+    parser.add_argument("--stores", type=int, default=100)
+    parser.add_argument("--weeks", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end", default=DEFAULT_END, help="UTC end of the polling period")
+    parser.add_argument("--jitter-minutes", type=int, default=10)
+    parser.add_argument("--missed-rate", type=float, default=0.05)
+    parser.add_argument("--outages-per-week", type=float, default=1.0)
+    parser.add_argument("--outage-hours", type=float, default=2.0)
+    parser.add_argument("--always-open-rate", type=float, default=0.1)
+    parser.add_argument("--overnight-rate", type=float, default=0.15)
+    args = parser.parse_args()
+
+    data_dir = generate(
+        args.out, args.stores, args.weeks, args.seed, args.end, args.jitter_minutes, args.missed_rate,
+        args.outages_per_week, args.outage_hours, args.always_open_rate, args.overnight_rate
+    )
+    print(f"Wrote {args.stores} stores x {args.weeks} weeks to {data_dir}")
+
+
+if __name__ == "__main__":
+    main()
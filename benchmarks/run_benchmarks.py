@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.generate_data import generate
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LEGACY_STAGES = [
+    "generate_filtered_data_table_last_hour", "calculate_uptime_downtime_last_hour",
+    "generate_filtered_data_table_last_day", "calculate_uptime_downtime_last_day",
+    "generate_filtered_data_table_last_week", "calculate_uptime_downtime_last_week",
+]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(samples, items):
+    median = statistics.median(samples)
+    return {
+        "seconds": [round(sample, 4) for sample in samples],
+        "median": round(median, 4),
+        "min": round(min(samples), 4),
+        "items": items,
+        "items_per_sec": round(items / median, 1) if median > 0 and items else None
+    }
+
+
+def bind_database(mongodb_uri, storage):
+    # Settings are read when the app is first imported below. No MongoDB client is created unless storage
+    # is used, and the benchmark binds its own database; with --mongodb-uri the app's settings point at the same server
+    if mongodb_uri:
+        os.environ.setdefault("MONGODB_URI", mongodb_uri)
+    if storage == "sqlite":
+        from app.storage import set_storage
+        from app.storage.sqlite import SQLiteStorage
+        if os.path.exists("benchmark.db"):
+            os.remove("benchmark.db")
+        from app.config import settings
+        settings.storage_backend = "sqlite"
+        set_storage(SQLiteStorage("benchmark.db"))
+        return "sqlite"
+
+    from app.db import adb
+
+    if mongodb_uri:
+        from pymongo import MongoClient
+        client = MongoClient(mongodb_uri)
+        client.drop_database("restaurant_monitoring_bench")
+        database = client.restaurant_monitoring_bench
+    else:
+        import mongomock
+        database = mongomock.MongoClient().restaurant_monitoring
+    adb.bind(database)
+    return "mongodb" if mongodb_uri else "mongomock"
+
+
+def backend_name():
+    from app.storage import get_storage
+    return get_storage().name
+
+
+async def run_stages(args):
+    from app.config import settings
+    from app.services import polling_service
+    from app.services.index_service import ensure_indexes
+
+    settings.report_cache = False
+    if backend_name() != "sqlite":
+        await ensure_indexes()
+    stages = {}
+
+    async def timed(name, function, items=0, repeat=1):
+        samples = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            result = await function()
+            samples.append(time.perf_counter() - started_at)
+        stages[name] = summarize(samples, items(result) if callable(items) else items)
+        print(f"{name:45s} {stages[name]['median']:10.4f}s")
+        return result
+
+    # Ingest runs once: a second run is an incremental no-op and is timed as such
+    await timed("process_all_polling_data", polling_service.process_all_polling_data, items=lambda result: result["rows"])
+    await timed("process_all_polling_data_noop", polling_service.process_all_polling_data, repeat=args.repeat)
+    await timed("process_latest_polling_data", polling_service.process_latest_polling_data, repeat=args.repeat)
+    await timed("read_store_ids", lambda: asyncio.to_thread(polling_service.read_store_ids), repeat=args.repeat)
+
+    # Per-store legacy steps over a sample of stores, in the order a legacy report runs them
+    sample = polling_service.read_store_ids()[:args.sample_stores]
+    for stage in LEGACY_STAGES:
+        step = getattr(polling_service, stage)
+
+        async def run_sample():
+            for store_id in sample:
+                await step(store_id, "benchmark")
+
+        await timed(stage, run_sample, items=len(sample), repeat=args.repeat)
+    await polling_service.discard_run_intermediates("benchmark")
+
+    stores = len(polling_service.read_store_ids())
+    for engine in args.engines:
+        settings.report_engine = engine
+
+        async def run_report():
+            report_id = await polling_service.generate_report()
+            os.remove(os.path.join(settings.report_dir, f"{report_id}.csv"))
+
+        await timed(f"generate_report[{engine}]", run_report, items=stores, repeat=args.repeat)
+
+    return stages
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["stages"]
+    print(f"\n{'stage':45s} {'baseline':>10s} {'current':>10s} {'ratio':>7s}")
+    for name, stage in results["stages"].items():
+        if name in baseline and baseline[name]["median"] > 0:
+            ratio = stage["median"] / baseline[name]["median"]
+            print(f"{name:45s} {baseline[name]['median']:10.4f} {stage['median']:10.4f} {ratio:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each polling_service stage and the full report on synthetic data")
+    # mongomock has no indexes, so every upsert scans the collection; keep the default scale small
+    # and pass --mongodb-uri for representative numbers at larger scale
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--weeks", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sample-stores", type=int, default=10, help="stores timed through the per-store legacy steps")
+    parser.add_argument("--engines", default="fused,legacy", help="report engines to time, comma separated")
+    parser.add_argument("--work-dir", default="bench_data", help="where the synthetic data and reports are written")
+    parser.add_argument("--mongodb-uri", help="benchmark against this MongoDB instead of the in-process mongomock stand-in")
+    parser.add_argument("--storage", choices=["mongodb", "sqlite"], default="mongodb",
+                        help="sqlite benchmarks the embedded backend in a file under --work-dir")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to print the median ratio against")
+    args = parser.parse_args()
+    args.engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    started_at = time.perf_counter()
+    generate(args.work_dir, args.stores, args.weeks, args.seed)
+    generate_seconds = time.perf_counter() - started_at
+
+    # The services read data/*.csv relative to the working directory
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(args.work_dir)
+    backend = bind_database(args.mongodb_uri, args.storage)
+
+    stages = asyncio.run(run_stages(args))
+    results = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": backend,
+            "stores": args.stores,
+            "weeks": args.weeks,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "sample_stores": args.sample_stores,
+            "generate_seconds": round(generate_seconds, 3)
+        },
+        "stages": stages
+    }
+
+    with open(output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"\nResults written to {output}")
+
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
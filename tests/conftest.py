@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.generate_data import generate
+from app.config import settings
+from app.db import adb
+from app.services import polling_service
+from app.services.engine_comparison import compare_engines
+from app.services.online_aggregates import online_aggregates
+from app.services.uptime_cache import uptime_cache
+from app.storage import create_storage, segments, set_storage
+from app.storage.sqlite import SQLiteStorage
+from app.utils import business_hours
+
+
+BACKENDS = ["sqlite", "mongodb"]
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    # A small synthetic data set in a scratch working directory, with every in-process cache emptied
+    generate(str(tmp_path), stores=6, weeks=2, seed=11)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(polling_service, "store_ids_arr", [])
+    monkeypatch.setattr(segments, "_segment_store", None)
+    monkeypatch.setattr(settings, "report_cache", False)
+    polling_service._timezones_cache.clear()
+    business_hours._index_cache.clear()
+    online_aggregates.__init__()
+    uptime_cache.entries.clear()
+    return tmp_path
+
+
+def make_storage(backend, directory, monkeypatch, database=None):
+    # A fresh backend every service then uses: a SQLite file, or a MongoDB database, by default an
+    # in-process mongomock one
+    if backend == "sqlite":
+        storage = SQLiteStorage(os.path.join(directory, "storedash.db"))
+    else:
+        if database is None:
+            database = pytest.importorskip("mongomock").MongoClient().restaurant_monitoring
+        monkeypatch.setattr(adb, "database", database)
+        storage = create_storage("mongodb")
+    monkeypatch.setattr(settings, "storage_backend", backend)
+    set_storage(storage)
+    return storage
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    return request.param
+
+
+@pytest.fixture
+def storage(backend, data_dir, monkeypatch):
+    yield make_storage(backend, str(data_dir), monkeypatch)
+    set_storage(None)
+
+
+def csv_lines():
+    with open(polling_service.STORE_STATUS_CSV) as csv_file:
+        return csv_file.readlines()
+
+
+def write_csv_lines(lines):
+    with open(polling_service.STORE_STATUS_CSV, "w") as csv_file:
+        csv_file.writelines(lines)
+
+
+def ingest():
+    return asyncio.run(polling_service.process_all_polling_data())
+
+
+def ingest_in_parts(parts: int, seed: int = 0):
+    # Append store_status.csv in parts with its rows shuffled, so later parts carry late polls for
+    # hours already ingested, and ingest after each one
+    lines = csv_lines()
+    header, rows = lines[0], lines[1:]
+    rows = [rows[position] for position in np.random.default_rng(seed).permutation(len(rows))]
+    cuts = np.linspace(0, len(rows), parts + 1).astype(int)[1:]
+    for cut in cuts:
+        write_csv_lines([header] + rows[:cut])
+        ingest()
+    return [header] + rows
+
+
+def stored_polls(storage):
+    # Every stored poll as (store_id, timestamp_epoch, active) columns, in store then time order
+    chunks = list(storage.iter_poll_columns(0))
+    return tuple(np.concatenate(column) for column in zip(*chunks))
+
+
+def report():
+    report_id = asyncio.run(polling_service.generate_report())
+    return pd.read_csv(os.path.join(settings.report_dir, f"{report_id}.csv"))
+
+
+def assert_matches_fused(engine):
+    result = asyncio.run(compare_engines(["fused", engine], 100))
+    assert result["stores"] > 0
+    assert result["differences"][engine]["mismatched_stores"] == 0, result["differences"]
+
+
+@pytest.fixture
+def client(data_dir, monkeypatch):
+    # The app with its lifespan on SQLite storage, over polls ingested beforehand
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    make_storage("sqlite", str(data_dir), monkeypatch)
+    ingest()
+    with TestClient(app) as client:
+        # The caches warm in the background; wait for them so every test sees the steady state
+        for _ in range(200):
+            if client.get("/ready").status_code == 200:
+                break
+            time.sleep(0.05)
+        yield client
+    set_storage(None)
+
+
+def wait_for_report(client, report_id):
+    for _ in range(600):
+        report = client.get("/get_report", params={"report_id": report_id}).json()
+        if report["status"] != "Running":
+            return report
+        time.sleep(0.05)
+    raise AssertionError("report did not finish")
@@ -0,0 +1,37 @@
+import asyncio
+import os
+import uuid
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from app.services.index_service import ensure_indexes
+from app.storage import set_storage
+from tests.conftest import assert_matches_fused, ingest_in_parts, make_storage
+
+
+@pytest.fixture
+def server_storage(data_dir, monkeypatch):
+    # mongomock has no $setWindowFields, so this engine needs a real server; each test gets a scratch database
+    uri = os.environ.get("MONGODB_URI")
+    if not uri:
+        pytest.skip("set MONGODB_URI to a MongoDB server to test the aggregation engine")
+    client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        pytest.skip(f"MongoDB at MONGODB_URI is unreachable: {e}")
+
+    database = client[f"storedash_test_{uuid.uuid4().hex[:12]}"]
+    try:
+        yield make_storage("mongodb", str(data_dir), monkeypatch, database)
+    finally:
+        set_storage(None)
+        client.drop_database(database.name)
+        client.close()
+
+
+def test_aggregation_engine_matches_fused(server_storage):
+    asyncio.run(ensure_indexes())
+    ingest_in_parts(3)
+
+    assert_matches_fused("aggregation")
@@ -0,0 +1,27 @@
+import asyncio
+import json
+from app.config import settings
+from app.routers import polling
+from app.services import polling_service
+
+
+def test_failing_store_is_reported_in_place(client, monkeypatch):
+    store_ids = list(asyncio.run(polling_service.get_store_ids()))
+    failing = store_ids[1]
+    compute = polling.calculate_uptime_downtime_last_hour
+
+    async def compute_or_fail(store_id):
+        if store_id == failing:
+            raise RuntimeError("store computation failed")
+        return await compute(store_id)
+
+    monkeypatch.setattr(polling, "calculate_uptime_downtime_last_hour", compute_or_fail)
+    monkeypatch.setattr(settings, "store_batch_concurrency", 3)
+
+    response = client.get("/stores/uptime_downtime_last_hour")
+    assert response.status_code == 200
+    results = json.loads(response.text)
+
+    assert [result["store_id"] for result in results] == store_ids
+    assert results[1] == {"store_id": failing, "error": "Internal Server Error"}
+    assert all("error" not in result for i, result in enumerate(results) if i != 1)
@@ -0,0 +1,39 @@
+import pandas as pd
+from app.utils.business_hours import ALWAYS_OPEN, MINUTES_PER_DAY, MINUTES_PER_WEEK, BusinessHoursIndex
+
+
+def index(rows):
+    return BusinessHoursIndex(pd.DataFrame(rows, columns=['store_id', 'day_of_week', 'start_time_local', 'end_time_local']))
+
+
+def at(day, hour, minute=0):
+    return day * MINUTES_PER_DAY + hour * 60 + minute
+
+
+def test_hours_past_midnight_run_into_the_next_day():
+    hours = index([(1, 2, "22:00:00", "02:00:00")]).hours_for(1)
+
+    assert hours.contains([at(2, 22), at(2, 23, 59), at(3, 0), at(3, 2)]).all()
+    assert not hours.contains([at(2, 21, 59), at(3, 2, 1), at(2, 2)]).any()
+    assert hours.open_per_week == 4 * 60
+    assert hours.overlap(at(2, 21), 2 * 60) == 60
+    assert hours.overlap(at(3, 1), 2 * 60) == 60
+
+
+def test_sunday_night_wraps_into_monday_morning():
+    hours = index([(1, 6, "22:00:00", "02:00:00")]).hours_for(1)
+
+    assert hours.contains([at(6, 23), MINUTES_PER_WEEK - 1, 0, at(0, 1, 30)]).all()
+    assert not hours.contains([at(0, 3), at(6, 21)]).any()
+    assert hours.open_per_week == 4 * 60
+    # A span across Sunday midnight counts both sides
+    assert hours.overlap(at(6, 23), 2 * 60) == 2 * 60
+
+
+def test_store_without_hours_is_always_open():
+    business_hours = index([(1, 0, "09:00:00", "17:00:00")])
+
+    assert business_hours.hours_for(2) is ALWAYS_OPEN
+    assert business_hours.contains(2, [0, at(3, 3), MINUTES_PER_WEEK]).all()
+    assert business_hours.overlap(2, at(6, 23), 2 * 60) == 2 * 60
+    assert business_hours.overlap(2, 0, 2 * MINUTES_PER_WEEK) == 2 * MINUTES_PER_WEEK
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import numpy as np
+import pandas as pd
+from app.config import settings
+from app.services import polling_service
+from tests.conftest import assert_matches_fused, csv_lines, ingest, ingest_in_parts, make_storage, report, stored_polls, write_csv_lines
+
+
+def test_incremental_ingest_matches_full_ingest(storage, backend, data_dir, monkeypatch):
+    # Appended parts with late polls, one of them ending in half a line, against one ingest of the whole file
+    lines = ingest_in_parts(3)
+    write_csv_lines(lines[:len(lines) // 2] + [lines[len(lines) // 2][:7]])
+    ingest()
+    write_csv_lines(lines)
+    ingest()
+    incremental_polls = stored_polls(storage)
+    incremental_latest = storage.latest_poll_epochs()
+    incremental_report = report()
+
+    os.makedirs("full")
+    make_storage(backend, "full", monkeypatch)
+    monkeypatch.setattr(polling_service, "store_ids_arr", [])
+    ingest()
+
+    for incremental_column, full_column in zip(incremental_polls, stored_polls(polling_service.get_storage())):
+        np.testing.assert_array_equal(incremental_column, full_column)
+    assert incremental_latest == polling_service.get_storage().latest_poll_epochs()
+    pd.testing.assert_frame_equal(incremental_report, report())
+
+
+def test_ingest_again_without_new_rows_is_a_no_op(storage):
+    first = ingest()
+    assert first["new_rows"] == len(csv_lines()) - 1
+
+    again = ingest()
+    assert again["new_rows"] == 0
+    assert len(stored_polls(storage)[0]) == first["new_rows"]
+
+
+def test_replaced_file_only_adds_polls_after_each_store_watermark(storage):
+    ingest()
+    polls = len(stored_polls(storage)[0])
+
+    # A rewritten file (the head changed) is read again from the start; nothing is stored twice
+    lines = csv_lines()
+    write_csv_lines([lines[0]] + lines[2:] + [lines[1]])
+    ingest()
+    assert len(stored_polls(storage)[0]) == polls
+
+
+def test_store_first_seen_in_an_appended_batch_joins_the_report(storage):
+    ingest()
+    report()
+
+    last_timestamp = csv_lines()[-1].split(",")[1]
+    write_csv_lines(csv_lines() + [f"9999,{last_timestamp},active\n"])
+    ingest()
+
+    assert 9999 in report()["store_id"].tolist()
+
+
+def test_concurrent_ingests_write_each_poll_once(storage, monkeypatch):
+    # The derived state is kept up to date by the ingests, so it would see polls fed twice
+    monkeypatch.setattr(settings, "report_engine", "online")
+    monkeypatch.setattr(settings, "poll_rollups", True)
+    lines = csv_lines()
+    write_csv_lines(lines[:len(lines) // 2])
+    ingest()
+    write_csv_lines(lines)
+
+    async def ingest_twice():
+        return await asyncio.gather(polling_service.process_all_polling_data(), polling_service.process_all_polling_data())
+
+    # The second ingest waits for the first and then finds nothing after its watermark
+    counts = sorted(result["new_rows"] for result in asyncio.run(ingest_twice()))
+    assert counts == [0, len(lines) - len(lines) // 2]
+    assert len(stored_polls(storage)[0]) == len(lines) - 1
+    assert_matches_fused("online")
+    assert_matches_fused("rollup")
@@ -0,0 +1,45 @@
+from pymongo import monitoring
+from app.config import settings
+from app.utils.metrics import CommandCounter
+from tests.conftest import wait_for_report
+
+
+def samples(client):
+    # Sample name with labels -> value, from the Prometheus text
+    values = {}
+    for line in client.get("/metrics").text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value)
+    return values
+
+
+def db_commands(values):
+    return sum(value for name, value in values.items() if name.startswith("storedash_db_commands_total{"))
+
+
+def test_report_records_stages_and_db_commands(client, monkeypatch):
+    monkeypatch.setattr(settings, "report_cache", False)
+    before = samples(client)
+
+    report_id = client.post("/trigger_report").json()["report_id"]
+    assert wait_for_report(client, report_id)["status"] == "Complete"
+    after = samples(client)
+
+    for name in ("generate_report", "compute_stores", "write_csv"):
+        count = f'storedash_stage_duration_seconds_count{{stage="{name}"}}'
+        assert after[count] > before.get(count, 0)
+        assert f'storedash_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}}' in after
+    assert db_commands(after) > db_commands(before)
+
+
+def test_mongodb_commands_are_counted(client):
+    # mongomock sends no commands through pymongo, so the listener is driven with a started event directly
+    class Started:
+        command_name = "aggregate"
+
+    before = samples(client).get('storedash_db_commands_total{command="aggregate"}', 0)
+    assert isinstance(CommandCounter(), monitoring.CommandListener)
+    CommandCounter().started(Started())
+
+    assert samples(client)['storedash_db_commands_total{command="aggregate"}'] == before + 1
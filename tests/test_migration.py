@@ -0,0 +1,45 @@
+import asyncio
+from datetime import datetime
+import pytest
+from app.services import polling_service
+from app.services.index_service import ensure_indexes
+from app.storage import set_storage
+from tests.conftest import make_storage
+
+
+@pytest.fixture
+def mongo_storage(data_dir, monkeypatch):
+    storage = make_storage("mongodb", str(data_dir), monkeypatch)
+    yield storage
+    set_storage(None)
+
+
+def baseline_poll(store_id):
+    # Polls as the first version stored them: local time of day and weekday, no date
+    return {"store_id": store_id, "timestamp_local": "10:15:00", "day_of_week": 2, "status": "active"}
+
+
+def test_undated_baseline_polls_are_archived_before_the_unique_index(mongo_storage):
+    database = mongo_storage.database.sync
+    database.all_polling_data.insert_many([baseline_poll(1), baseline_poll(1), baseline_poll(2)])
+    database.all_polling_data.insert_one({"store_id": 3, "timestamp_utc": datetime(2024, 3, 1, 12, 0), "status": "active"})
+    database.latest_polling_data.insert_one(baseline_poll(1))
+
+    assert polling_service.migrate_polling_epochs() == {"migrated": 1, "archived": 4}
+
+    assert database.legacy_polling_data.count_documents({}) == 4
+    assert database.all_polling_data.count_documents({"timestamp_epoch": {"$exists": False}}) == 0
+    assert database.all_polling_data.find_one({"store_id": 3})["timestamp_epoch"] == 1709294400
+    assert database.migrations.find_one({"_id": polling_service.EPOCH_MIGRATION_ID}) is not None
+
+    results = asyncio.run(ensure_indexes())
+    assert all(result["status"] == "ok" for result in results)
+    assert database.all_polling_data.index_information()["store_id_timestamp_utc"].get("unique")
+
+
+def test_migration_runs_once(mongo_storage):
+    mongo_storage.database.sync.all_polling_data.insert_one(baseline_poll(1))
+    assert polling_service.migrate_polling_epochs()["archived"] == 1
+
+    mongo_storage.database.sync.all_polling_data.insert_one(baseline_poll(2))
+    assert polling_service.migrate_polling_epochs() == {"migrated": 0, "archived": 0}
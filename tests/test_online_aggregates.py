@@ -0,0 +1,72 @@
+import asyncio
+import os
+import numpy as np
+import pandas as pd
+from app.config import settings
+from app.services import polling_service
+from app.services.engine_comparison import compare_engines
+from app.services.online_aggregates import StoreWindows, online_aggregates
+from app.utils.business_hours import ALWAYS_OPEN, get_business_hours_index
+from tests.conftest import assert_matches_fused, ingest, ingest_in_parts
+
+
+def test_online_engine_matches_fused(storage, monkeypatch):
+    # Maintained by the ingests, late polls included
+    monkeypatch.setattr(settings, "report_engine", "online")
+    ingest_in_parts(3)
+
+    assert_matches_fused("online")
+
+
+def store_windows(batches):
+    windows = StoreWindows()
+    for epochs in batches:
+        epochs = np.asarray(epochs, dtype=np.int64)
+        windows.add(epochs, (epochs // 60) % 10080 * 1.0, epochs % 7200 == 0, ALWAYS_OPEN)
+    return windows
+
+
+def test_late_poll_inside_the_current_run_ends_it():
+    # Active on the even hours; without the 7h poll the current run goes from 6h to 8h
+    hourly = np.arange(1, 9) * 3600
+    windows = store_windows([hourly[hourly != 7 * 3600]])
+    assert (windows.active_now, windows.transition_epoch) == (True, 6 * 3600)
+
+    # A late inactive poll between them leaves only the 8h poll in the run
+    windows.add(np.array([6 * 3600 + 1800]), np.array([0.0]), np.array([False]), ALWAYS_OPEN)
+    assert (windows.active_now, windows.transition_epoch) == (True, 8 * 3600)
+
+    # A late active poll after the last inactive one starts the run earlier
+    windows.add(np.array([7 * 3600 + 1800]), np.array([0.0]), np.array([True]), ALWAYS_OPEN)
+    assert (windows.active_now, windows.transition_epoch) == (True, 7 * 3600 + 1800)
+
+
+def test_polls_in_any_order_give_the_same_state():
+    epochs = np.sort(np.random.default_rng(3).choice(np.arange(0, 9 * 86400, 600), size=400, replace=False))
+    in_order = store_windows([epochs])
+    shuffled = store_windows(np.sort(part) for part in np.array_split(np.random.default_rng(4).permutation(epochs), 7))
+
+    assert (shuffled.latest_epoch, shuffled.active_now, shuffled.transition_epoch) == (
+        in_order.latest_epoch, in_order.active_now, in_order.transition_epoch
+    )
+    np.testing.assert_allclose(shuffled.estimates, in_order.estimates)
+
+
+def test_changed_timezones_rebuild_the_state(storage, monkeypatch):
+    monkeypatch.setattr(settings, "report_engine", "online")
+    ingest()
+    asyncio.run(polling_service.current_online_aggregates())
+
+    # Every store moves to one zone; the file gets a new mtime, so the cached timezones are a new object
+    timezones = pd.read_csv(polling_service.STORE_TIMEZONES_CSV)
+    timezones["timezone_str"] = "Asia/Tokyo"
+    timezones.to_csv(polling_service.STORE_TIMEZONES_CSV, index=False)
+    stat = os.stat(polling_service.STORE_TIMEZONES_CSV)
+    os.utime(polling_service.STORE_TIMEZONES_CSV, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    version = polling_service.watermark_version(storage.load_watermark(polling_service.WATERMARK_ID))
+    assert not online_aggregates.is_current(version, get_business_hours_index(), polling_service.get_store_timezones())
+
+    # The columnar engine places the polls with the same timezones
+    result = asyncio.run(compare_engines(["columnar", "online"], 100))
+    assert result["differences"]["online"]["mismatched_stores"] == 0, result["differences"]
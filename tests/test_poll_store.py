@@ -0,0 +1,11 @@
+from app.config import settings
+from tests.conftest import assert_matches_fused, ingest_in_parts
+
+
+def test_columnar_engine_matches_fused(storage, monkeypatch):
+    # Without segments the columnar engine loads its poll store straight from the database
+    monkeypatch.setattr(settings, "report_engine", "columnar")
+    monkeypatch.setattr(settings, "poll_segments", False)
+    ingest_in_parts(3)
+
+    assert_matches_fused("columnar")
@@ -0,0 +1,25 @@
+import gzip
+from tests.conftest import wait_for_report
+
+
+def test_report_download(client):
+    report_id = client.post("/trigger_report").json()["report_id"]
+    assert wait_for_report(client, report_id)["status"] == "Complete"
+
+    response = client.get("/download_report", params={"report_id": report_id})
+    assert response.status_code == 200
+    body = response.content
+    assert body.startswith(b"store_id")
+    etag = response.headers["etag"]
+
+    assert client.get("/download_report", params={"report_id": report_id}, headers={"If-None-Match": etag}).status_code == 304
+
+    partial = client.get("/download_report", params={"report_id": report_id}, headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == f"bytes 0-9/{len(body)}"
+    assert partial.content == body[:10]
+
+    # httpx would decode the body itself, so read the raw stream
+    with client.stream("GET", "/download_report", params={"report_id": report_id}, headers={"Accept-Encoding": "gzip"}) as compressed:
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert gzip.decompress(b"".join(compressed.iter_raw())) == body
@@ -0,0 +1,37 @@
+import threading
+from app.config import settings
+from app.services import report_jobs
+from tests.conftest import wait_for_report
+
+
+def test_unchanged_inputs_reuse_the_finished_report(client, monkeypatch):
+    monkeypatch.setattr(settings, "report_cache", True)
+    first = client.post("/trigger_report").json()
+    assert wait_for_report(client, first["report_id"])["status"] == "Complete"
+
+    assert client.post("/trigger_report").json() == {"report_id": first["report_id"], "cache": "hit"}
+
+    # Another engine is another input, so it gets a report of its own
+    monkeypatch.setattr(settings, "report_engine", "columnar")
+    second = client.post("/trigger_report").json()
+    assert second["report_id"] != first["report_id"] and second["cache"] == "miss"
+    wait_for_report(client, second["report_id"])
+
+
+def test_identical_triggers_share_one_run(client, monkeypatch):
+    monkeypatch.setattr(settings, "report_cache", True)
+    release = threading.Event()
+    generate_report = report_jobs.generate_report
+
+    async def held_generate_report(report_id):
+        release.wait(10)
+        return await generate_report(report_id)
+
+    monkeypatch.setattr(report_jobs, "generate_report", held_generate_report)
+    monkeypatch.setattr(settings, "report_engine", "legacy")
+    first = client.post("/trigger_report").json()
+    try:
+        assert client.post("/trigger_report").json() == {"report_id": first["report_id"], "cache": "joined"}
+    finally:
+        release.set()
+    assert wait_for_report(client, first["report_id"])["status"] == "Complete"
@@ -0,0 +1,10 @@
+from app.config import settings
+from tests.conftest import assert_matches_fused, ingest_in_parts
+
+
+def test_fused_engine_matches_legacy_engine(storage, monkeypatch):
+    # The legacy engine writes intermediates per window and run; the fused pipeline must report the same
+    monkeypatch.setattr(settings, "report_engine", "legacy")
+    ingest_in_parts(3)
+
+    assert_matches_fused("legacy")
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+from app.config import settings
+from app.services import polling_service
+from tests.conftest import ingest, make_storage, report
+
+
+@pytest.mark.parametrize("engine", ["fused", "legacy", "rollup"])
+def test_sharded_report_matches_serial_report(data_dir, engine, monkeypatch):
+    # Worker processes are spawned and read their settings from the environment, so SQLite is the shared storage
+    storage = make_storage("sqlite", str(data_dir), monkeypatch)
+    for name, value in {"STORAGE_BACKEND": "sqlite", "SQLITE_PATH": storage.path, "REPORT_ENGINE": engine}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(settings, "report_engine", engine)
+    monkeypatch.setattr(settings, "poll_rollups", engine == "rollup")
+    ingest()
+    serial = report()
+
+    monkeypatch.setattr(settings, "report_workers", 2)
+    monkeypatch.setattr(polling_service, "report_process_pool", None)
+    try:
+        sharded = report()
+        assert polling_service.report_process_pool is not None
+    finally:
+        if polling_service.report_process_pool is not None:
+            polling_service.report_process_pool.shutdown()
+
+    assert len(serial) > 1
+    pd.testing.assert_frame_equal(sharded, serial)
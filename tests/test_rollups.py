@@ -0,0 +1,71 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from app.config import settings
+from app.services import polling_service
+from app.services.report_pipeline import active_window_estimates
+from app.utils.business_hours import get_business_hours_index
+from tests.conftest import assert_matches_fused, ingest, ingest_in_parts
+
+
+def all_rollups(storage, store_id):
+    return asyncio.run(storage.rollups(store_id, 0, 2 ** 40))
+
+
+def test_rollup_engine_matches_fused(storage, monkeypatch):
+    # Maintained by the ingests, late polls included
+    monkeypatch.setattr(settings, "report_engine", "rollup")
+    monkeypatch.setattr(settings, "poll_rollups", True)
+    ingest_in_parts(3)
+
+    assert_matches_fused("rollup")
+
+
+def test_rollups_answer_any_window(storage, monkeypatch):
+    monkeypatch.setattr(settings, "poll_rollups", True)
+    ingest_in_parts(3)
+
+    business_hours = get_business_hours_index()
+    rng = np.random.default_rng(5)
+    for store_id in asyncio.run(polling_service.get_store_ids()):
+        polls = asyncio.run(storage.window_polls(store_id, 0, 2 ** 40, ["timestamp_epoch", "minute_of_week", "status"]))
+        epochs = np.array([poll["timestamp_epoch"] for poll in polls], dtype=np.int64)
+        minutes_of_week = np.array([poll["minute_of_week"] for poll in polls], dtype=np.float64)
+        active = np.array([poll["status"] == "active" for poll in polls], dtype=bool)
+        hours = business_hours.hours_for(store_id)
+        inside = hours.contains(minutes_of_week)
+        epochs, minutes_of_week, active = epochs[inside], minutes_of_week[inside], active[inside]
+
+        for length in (600, 3600, 5400, 86400, 10 * 86400):
+            window_start = int(rng.integers(epochs[0] - 3600, epochs[-1]))
+            window_end = window_start + length
+            selected = (epochs >= window_start) & (epochs <= window_end)
+            expected = active_window_estimates(
+                epochs[selected], minutes_of_week[selected], active[selected], window_start, window_end, hours, 1
+            )
+            actual = asyncio.run(polling_service.store_window_uptime(store_id, window_start, window_end, business_hours))
+            assert actual == pytest.approx(expected, abs=1e-6)
+
+
+def test_reports_read_the_old_rollups_while_they_are_rebuilt(storage, monkeypatch):
+    monkeypatch.setattr(settings, "poll_rollups", True)
+    ingest()
+    store_ids = asyncio.run(polling_service.get_store_ids())
+    before = {store_id: all_rollups(storage, store_id) for store_id in store_ids}
+
+    # Read every store's rollups from another thread while the rebuild is reading the polls
+    seen = []
+    iter_poll_columns = storage.iter_poll_columns
+
+    def read_meanwhile(*args, **kwargs):
+        for chunk in iter_poll_columns(*args, **kwargs):
+            with ThreadPoolExecutor(max_workers=1) as reader:
+                seen.append(reader.submit(lambda: {store_id: all_rollups(storage, store_id) for store_id in store_ids}).result())
+            yield chunk
+
+    monkeypatch.setattr(storage, "iter_poll_columns", read_meanwhile)
+    polling_service.rebuild_poll_rollups()
+
+    assert seen and all(rollups == before for rollups in seen)
+    assert {store_id: all_rollups(storage, store_id) for store_id in store_ids} == before
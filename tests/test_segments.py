@@ -0,0 +1,54 @@
+import numpy as np
+from app.config import settings
+from app.services import polling_service
+from app.storage.segments import get_segment_store
+from tests.conftest import assert_matches_fused, csv_lines, ingest, ingest_in_parts, stored_polls, write_csv_lines
+
+
+def segment_polls():
+    chunks = list(get_segment_store().iter_poll_columns(0))
+    return tuple(np.concatenate(column) for column in zip(*chunks))
+
+
+def test_columnar_engine_reads_compacted_segments(storage, monkeypatch):
+    monkeypatch.setattr(settings, "poll_segments", True)
+    monkeypatch.setattr(settings, "segment_compaction_fanin", 2)
+    ingest_in_parts(4)
+
+    assert len(get_segment_store().segments()) < 4
+    assert_matches_fused("columnar")
+
+
+def assert_segments_hold_stored_polls(storage):
+    assert polling_service.segments_current()
+    for segment_column, stored_column in zip(segment_polls(), stored_polls(storage)):
+        np.testing.assert_array_equal(segment_column, stored_column)
+
+
+def ingest_with_segments_off_in_between(monkeypatch, parts):
+    # The first part is ingested into the segments, the others with the setting off; returns the remaining lines
+    lines = csv_lines()
+    cuts = [len(lines) * part // parts for part in range(1, parts + 1)]
+    for part, cut in enumerate(cuts[:2]):
+        monkeypatch.setattr(settings, "poll_segments", part == 0)
+        write_csv_lines(lines[:cut])
+        ingest()
+    monkeypatch.setattr(settings, "poll_segments", True)
+    return lines
+
+
+def test_stale_segments_are_rebuilt_before_the_columnar_engine_reads_them(storage, monkeypatch):
+    ingest_with_segments_off_in_between(monkeypatch, 2)
+
+    # The manifest still names the watermark of the first part
+    assert not polling_service.segments_current()
+    assert_matches_fused("columnar")
+    assert_segments_hold_stored_polls(storage)
+
+
+def test_stale_segments_are_rebuilt_by_the_next_ingest(storage, monkeypatch):
+    lines = ingest_with_segments_off_in_between(monkeypatch, 3)
+
+    write_csv_lines(lines)
+    ingest()
+    assert_segments_hold_stored_polls(storage)
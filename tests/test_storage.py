@@ -0,0 +1,25 @@
+import pytest
+from app.storage.base import Storage
+from app.storage.sqlite import SQLiteStorage
+
+
+def test_backends_implement_every_method(storage):
+    assert isinstance(storage, Storage)
+    assert not type(storage).__abstractmethods__
+
+
+def test_incomplete_backend_cannot_be_created():
+    class PollsOnly(Storage):
+        def upsert_polls(self, processed_data):
+            pass
+
+    with pytest.raises(TypeError, match="replace_rollups"):
+        PollsOnly()
+
+
+def test_backend_missing_one_method_cannot_be_created(tmp_path):
+    class NoRollupSwap(SQLiteStorage):
+        replace_rollups = Storage.replace_rollups
+
+    with pytest.raises(TypeError, match="replace_rollups"):
+        NoRollupSwap(str(tmp_path / "storedash.db"))
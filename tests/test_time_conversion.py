@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+import pytz
+from app.utils.time_conversion import EPOCH, local_minute_of_week, local_seconds
+
+
+def expected_local_seconds(epochs, timezone_str):
+    # The per-instant pytz conversion the tables replace
+    zone = pytz.timezone(timezone_str)
+    result = []
+    for epoch in epochs:
+        local = pytz.utc.localize(EPOCH + timedelta(seconds=int(epoch))).astimezone(zone)
+        result.append(int((local.replace(tzinfo=None) - EPOCH).total_seconds()))
+    return np.array(result, dtype=np.int64)
+
+
+def around(moment: datetime, hours=3):
+    # Every quarter hour from a few hours before a UTC moment to a few hours after, plus the seconds either side of it
+    center = int((moment - EPOCH).total_seconds())
+    return np.array(sorted(set(range(center - hours * 3600, center + hours * 3600 + 1, 900)) | {center - 1, center}), dtype=np.int64)
+
+
+@pytest.mark.parametrize("timezone_str, transition", [
+    # Spring forward and fall back in New York
+    ("America/New_York", datetime(2024, 3, 10, 7)),
+    ("America/New_York", datetime(2024, 11, 3, 6)),
+    # And in the southern hemisphere, where the year starts on summer time
+    ("Australia/Sydney", datetime(2024, 4, 6, 16)),
+    ("Australia/Sydney", datetime(2024, 10, 5, 16)),
+])
+def test_local_seconds_match_pytz_across_transitions(timezone_str, transition):
+    epochs = around(transition)
+
+    np.testing.assert_array_equal(local_seconds(epochs, timezone_str), expected_local_seconds(epochs, timezone_str))
+
+
+def test_offset_changes_at_the_transition():
+    spring_forward = int((datetime(2024, 3, 10, 7) - EPOCH).total_seconds())
+    local = local_seconds([spring_forward - 1, spring_forward], "America/New_York")
+
+    # 01:59:59 EST is followed by 03:00:00 EDT
+    assert [(EPOCH + timedelta(seconds=int(second))).strftime("%H:%M:%S") for second in local] == ["01:59:59", "03:00:00"]
+
+
+def test_wider_ranges_rebuild_the_cached_table():
+    zone = "America/Denver"
+    narrow = around(datetime(2024, 3, 10, 9))
+    wide = np.concatenate([narrow, around(datetime(2024, 11, 3, 8)), around(datetime(2023, 11, 5, 8))])
+
+    local_seconds(narrow, zone)
+    np.testing.assert_array_equal(local_seconds(wide, zone), expected_local_seconds(wide, zone))
+
+
+def test_minute_of_week_follows_local_time():
+    # Sunday 2024-11-03 05:30 UTC is Sunday 01:30 EDT; 06:30 UTC is the second 01:30, in EST
+    epochs = [int((datetime(2024, 11, 3, hour, 30) - EPOCH).total_seconds()) for hour in (5, 6)]
+
+    np.testing.assert_array_equal(local_minute_of_week(epochs, "America/New_York"), [6 * 1440 + 90, 6 * 1440 + 90])
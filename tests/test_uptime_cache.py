@@ -0,0 +1,68 @@
+import asyncio
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+from app.services import polling_service
+from app.services.uptime_cache import uptime_cache
+from tests.conftest import csv_lines, ingest, write_csv_lines
+
+
+def test_store_uptime_is_cached(client):
+    store_id = int(csv_lines()[1].split(",")[0])
+    assert client.get(f"/stores/{store_id}/uptime").json()["cache"] == "miss"
+    assert client.get(f"/stores/{store_id}/uptime").json()["cache"] == "hit"
+
+    metrics = client.get("/metrics").text
+    hits = [line for line in metrics.splitlines() if line.startswith('storedash_uptime_cache_lookups_total{result="hit"}')]
+    assert hits and float(hits[0].split()[-1]) >= 1
+
+    assert client.get("/stores/424242/uptime").status_code == 404
+
+
+def hold_back_day(store_id):
+    # Ingest every poll except one day of the store's; returns the file with them appended as late polls
+    # and a window around them
+    lines = csv_lines()
+    held_back = [line for line in lines[1:] if line.startswith(f"{store_id},") and line.split(",")[1].startswith("2024-03-03")]
+    kept = [line for line in lines if line not in held_back]
+    write_csv_lines(kept)
+    ingest()
+    epochs = [int(pd.Timestamp(line.split(",")[1]).timestamp()) for line in held_back]
+    return kept + held_back, (min(epochs) - 3600, max(epochs) + 3600)
+
+
+def store_uptime(store_id, window):
+    return asyncio.run(polling_service.get_store_uptime(store_id, *window))
+
+
+def test_ingest_drops_cached_uptimes_of_updated_stores_only(storage, monkeypatch):
+    lines, window = hold_back_day(1)
+    for store_id in (1, 2):
+        assert store_uptime(store_id, window)["cache"] == "miss"
+
+    write_csv_lines(lines)
+    ingest()
+
+    assert store_uptime(2, window)["cache"] == "hit"
+    assert store_uptime(1, window)["cache"] == "miss"
+
+
+def test_failed_ingest_drops_cached_uptimes_of_the_stores_it_wrote(storage, monkeypatch):
+    lines, window = hold_back_day(1)
+    assert store_uptime(1, window)["cache"] == "miss"
+    stale = store_uptime(1, window)
+    assert stale["cache"] == "hit"
+
+    # The polls are written, then the ingest fails to save the watermark that covers them
+    def fail(*args):
+        raise RuntimeError("ingest_watermarks is unavailable")
+
+    monkeypatch.setattr(polling_service, "save_watermark", fail)
+    write_csv_lines(lines)
+    with pytest.raises(HTTPException):
+        ingest()
+
+    fresh = store_uptime(1, window)
+    assert fresh["cache"] == "miss"
+    assert (fresh["uptime_minutes"], fresh["downtime_minutes"]) != (stale["uptime_minutes"], stale["downtime_minutes"])
+    assert len(uptime_cache.entries) == 1
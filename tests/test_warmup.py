@@ -0,0 +1,14 @@
+from app import db
+
+
+def test_ready_after_warmup(client):
+    response = client.get("/ready")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "ready"
+    assert {"warm_storage", "warm_store_catalog", "warm_timezones", "warm_business_hours", "ready"} <= set(body["timings"])
+
+
+def test_sqlite_storage_never_creates_a_mongodb_client(client):
+    assert client.get("/stores/uptime_downtime_last_hour").status_code == 200
+    assert db._client is None